@@ -16,6 +16,8 @@ Common Auth Middleware.
 
 """
 
+import time
+
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_middleware import request_id
@@ -54,6 +56,29 @@ CONF.register_opts(auth_opts)
 LOG = logging.getLogger(__name__)
 
 
+def get_db_deadline(req):
+    """Return the time after which the database statements of req are
+    cancelled, or None.
+
+    The deadline is CONF.db_request_timeout seconds away, or less if the
+    client asks for less through CONF.db_request_timeout_header.
+    """
+    timeout = CONF.db_request_timeout or None
+    header = CONF.db_request_timeout_header
+    if header and header in req.headers:
+        try:
+            requested = float(req.headers[header])
+        except ValueError:
+            LOG.debug("Ignoring invalid %(header)s header: %(value)s",
+                      {'header': header, 'value': req.headers[header]})
+        else:
+            if requested > 0 and (timeout is None or requested < timeout):
+                timeout = requested
+    if timeout is None:
+        return None
+    return time.time() + timeout
+
+
 def _load_pipeline(loader, pipeline):
     filters = [loader.get_filter(n) for n in pipeline[:-1]]
     app = loader.get_app(pipeline[-1])
@@ -147,7 +172,8 @@ class NovaKeystoneContext(wsgi.Middleware):
                                      remote_address=remote_address,
                                      service_catalog=service_catalog,
                                      request_id=req_id,
-                                     user_auth_plugin=user_auth_plugin)
+                                     user_auth_plugin=user_auth_plugin,
+                                     db_deadline=get_db_deadline(req))
 
         req.environ['fastrunner.context'] = ctx
         return self.application
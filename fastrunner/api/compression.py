@@ -0,0 +1,248 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Middleware compressing API responses.
+
+JSON and text responses are compressed with gzip or deflate when the
+Accept-Encoding header of the request accepts one of them, gzip being
+preferred. Buffered bodies are compressed at once and keep an exact
+Content-Length. Streamed bodies, such as the ones of servers/detail with
+servers_detail_streaming, are compressed chunk by chunk while they are
+sent, so they are never held in memory as a whole.
+
+Bodies smaller than CONF.response_compression_min_size are sent as they
+are. Streamed bodies are read up to that size before deciding.
+"""
+
+import itertools
+import time
+import zlib
+
+from oslo_config import cfg
+import webob.dec
+
+from fastrunner import metrics
+from fastrunner import wsgi as base_wsgi
+
+CONF = cfg.CONF
+
+# Supported content codings, by preference, with the zlib wbits producing
+# them. HTTP's deflate is the zlib format.
+_ENCODINGS = (
+    ('gzip', 16 + zlib.MAX_WBITS),
+    ('deflate', zlib.MAX_WBITS),
+)
+
+
+class CompressionStats(object):
+    """Bytes saved by compressing responses, and the time it took."""
+
+    def __init__(self):
+        self.responses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.time = 0.0
+
+    def record(self, bytes_in, bytes_out, seconds):
+        self.responses += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.time += seconds
+
+    def stats(self):
+        return {
+            'responses': self.responses,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'ratio': (float(self.bytes_out) / self.bytes_in
+                      if self.bytes_in else 0.0),
+            'time': self.time,
+        }
+
+
+_STATS = CompressionStats()
+metrics.register('response_compression', _STATS.stats)
+
+
+def accepted_encoding(header):
+    """Return the (coding, wbits) of _ENCODINGS the Accept-Encoding header
+    prefers, None if it accepts none of them.
+    """
+    if not header:
+        return None
+    qualities = {}
+    for part in header.split(','):
+        params = part.split(';')
+        coding = params[0].strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params[1:]:
+            name, _sep, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    best = None
+    best_quality = 0.0
+    for coding, wbits in _ENCODINGS:
+        quality = qualities.get(coding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best = (coding, wbits)
+            best_quality = quality
+    return best
+
+
+def _compressible(req, response):
+    if req.method == 'HEAD':
+        return False
+    if response.status_int < 200 or response.status_int in (204, 304):
+        return False
+    if response.headers.get('Content-Encoding'):
+        return False
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    content_type = response.content_type or ''
+    return (content_type == 'application/json' or
+            content_type.startswith('text/'))
+
+
+def _add_vary(response):
+    vary = response.headers.get('Vary')
+    if not vary:
+        response.headers['Vary'] = 'Accept-Encoding'
+    elif 'accept-encoding' not in [value.strip().lower()
+                                   for value in vary.split(',')]:
+        response.headers['Vary'] = vary + ', Accept-Encoding'
+
+
+def _weaken_etag(response):
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        # NOTE: a strong ETag promises the same bytes, which the encoded
+        # body is not. Like nginx, compressed responses get a weak tag;
+        # If-None-Match is compared weakly, so it still matches.
+        response.headers['ETag'] = 'W/' + etag
+
+
+def _not_modified(req, response, encoding):
+    """Give a 304 the ETag and Vary of the response it stands for."""
+    if (encoding is None or req.method == 'HEAD' or
+            'no-transform' in response.headers.get('Cache-Control', '')):
+        return
+    # NOTE: the 304 has no body to tell whether the 200 would have been
+    # compressed. Its tag is weakened whenever an encoding is negotiated,
+    # so that it matches the tag the client cached with the compressed
+    # body; weak and strong tags of uncompressed bodies still match.
+    _weaken_etag(response)
+    _add_vary(response)
+
+
+def _set_encoding(response, coding):
+    response.headers['Content-Encoding'] = coding
+    _weaken_etag(response)
+
+
+def _compressor(wbits):
+    return zlib.compressobj(CONF.response_compression_level, zlib.DEFLATED,
+                            wbits)
+
+
+def _compress_chunks(app_iter, chunks, wbits):
+    """Yield the compressed chunks, closing app_iter when done.
+
+    zlib buffers its output, so chunks are emitted as it fills blocks
+    rather than once per input chunk, and the whole body is never held.
+    """
+    compressor = _compressor(wbits)
+    bytes_in = 0
+    bytes_out = 0
+    elapsed = 0.0
+    try:
+        for chunk in chunks:
+            started = time.time()
+            data = compressor.compress(chunk)
+            elapsed += time.time() - started
+            bytes_in += len(chunk)
+            if data:
+                bytes_out += len(data)
+                yield data
+        data = compressor.flush()
+        bytes_out += len(data)
+        yield data
+    finally:
+        close = getattr(app_iter, 'close', None)
+        if close is not None:
+            close()
+    _STATS.record(bytes_in, bytes_out, elapsed)
+
+
+class CompressionMiddleware(base_wsgi.Middleware):
+    """Compress responses with the content coding the client accepts."""
+
+    @webob.dec.wsgify(RequestClass=base_wsgi.Request)
+    def __call__(self, req):
+        encoding = accepted_encoding(req.headers.get('Accept-Encoding'))
+        response = req.get_response(self.application)
+        if response.status_int == 304:
+            _not_modified(req, response, encoding)
+            return response
+        if not _compressible(req, response):
+            return response
+        # NOTE: the response depends on Accept-Encoding even when it is
+        # not compressed, for shared caches.
+        _add_vary(response)
+        if encoding is None:
+            return response
+        if response.content_length is not None:
+            return self._compress_body(response, encoding)
+        return self._compress_stream(response, encoding)
+
+    def _compress_body(self, response, encoding):
+        body = response.body
+        if len(body) < CONF.response_compression_min_size:
+            return response
+        coding, wbits = encoding
+        started = time.time()
+        compressor = _compressor(wbits)
+        compressed = compressor.compress(body) + compressor.flush()
+        _STATS.record(len(body), len(compressed), time.time() - started)
+        response.body = compressed
+        _set_encoding(response, coding)
+        return response
+
+    def _compress_stream(self, response, encoding):
+        app_iter = response.app_iter
+        chunks = iter(app_iter)
+        head = []
+        size = 0
+        for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size >= CONF.response_compression_min_size:
+                break
+        else:
+            # The whole body was read and is too small to compress.
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                close()
+            response.app_iter = head
+            response.content_length = size
+            return response
+        coding, wbits = encoding
+        response.app_iter = _compress_chunks(
+            app_iter, itertools.chain(head, chunks), wbits)
+        response.content_length = None
+        _set_encoding(response, coding)
+        return response
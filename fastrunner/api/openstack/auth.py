@@ -18,6 +18,7 @@ from oslo_config import cfg
 import webob.dec
 import webob.exc
 
+from fastrunner.api import auth as api_auth
 from fastrunner.api.openstack import wsgi
 from fastrunner import context
 from fastrunner import wsgi as base_wsgi
@@ -57,7 +58,8 @@ class NoAuthMiddlewareBase(base_wsgi.Middleware):
         ctx = context.RequestContext(user_id,
                                      project_id,
                                      is_admin=is_admin,
-                                     remote_address=remote_address)
+                                     remote_address=remote_address,
+                                     db_deadline=api_auth.get_db_deadline(req))
 
         req.environ['fastrunner.context'] = ctx
         return self.application
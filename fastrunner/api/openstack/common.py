@@ -0,0 +1,455 @@
+# Copyright 2010 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import re
+
+from oslo_log import log as logging
+from oslo_utils import strutils
+from oslo_utils import uuidutils
+import six
+import six.moves.urllib.parse as urlparse
+import webob
+
+from fastrunner.compute import task_states
+from fastrunner.compute import vm_states
+import fastrunner.conf
+from fastrunner import exception
+from fastrunner.i18n import _
+
+CONF = fastrunner.conf.CONF
+
+LOG = logging.getLogger(__name__)
+
+
+_STATE_MAP = {
+    vm_states.ACTIVE: {
+        'default': 'ACTIVE',
+        task_states.REBOOTING: 'REBOOT',
+        task_states.REBOOT_PENDING: 'REBOOT',
+        task_states.REBOOT_STARTED: 'REBOOT',
+        task_states.REBOOTING_HARD: 'HARD_REBOOT',
+        task_states.REBOOT_PENDING_HARD: 'HARD_REBOOT',
+        task_states.REBOOT_STARTED_HARD: 'HARD_REBOOT',
+        task_states.UPDATING_PASSWORD: 'PASSWORD',
+        task_states.REBUILDING: 'REBUILD',
+        task_states.REBUILD_BLOCK_DEVICE_MAPPING: 'REBUILD',
+        task_states.REBUILD_SPAWNING: 'REBUILD',
+        task_states.MIGRATING: 'MIGRATING',
+        task_states.RESIZE_PREP: 'RESIZE',
+        task_states.RESIZE_MIGRATING: 'RESIZE',
+        task_states.RESIZE_MIGRATED: 'RESIZE',
+        task_states.RESIZE_FINISH: 'RESIZE',
+    },
+    vm_states.BUILDING: {
+        'default': 'BUILD',
+    },
+    vm_states.STOPPED: {
+        'default': 'SHUTOFF',
+        task_states.RESIZE_PREP: 'RESIZE',
+        task_states.RESIZE_MIGRATING: 'RESIZE',
+        task_states.RESIZE_MIGRATED: 'RESIZE',
+        task_states.RESIZE_FINISH: 'RESIZE',
+        task_states.REBUILDING: 'REBUILD',
+        task_states.REBUILD_BLOCK_DEVICE_MAPPING: 'REBUILD',
+        task_states.REBUILD_SPAWNING: 'REBUILD',
+    },
+    vm_states.RESIZED: {
+        'default': 'VERIFY_RESIZE',
+        # Note(maoy): the OS API spec 1.1 doesn't have CONFIRMING_RESIZE
+        # state. so we comment that out for future reference only.
+        #task_states.RESIZE_CONFIRMING: 'CONFIRMING_RESIZE',
+        task_states.RESIZE_REVERTING: 'REVERT_RESIZE',
+    },
+    vm_states.PAUSED: {
+        'default': 'PAUSED',
+        task_states.MIGRATING: 'MIGRATING',
+    },
+    vm_states.SUSPENDED: {
+        'default': 'SUSPENDED',
+    },
+    vm_states.RESCUED: {
+        'default': 'RESCUE',
+    },
+    vm_states.ERROR: {
+        'default': 'ERROR',
+        task_states.REBUILDING: 'REBUILD',
+        task_states.REBUILD_BLOCK_DEVICE_MAPPING: 'REBUILD',
+        task_states.REBUILD_SPAWNING: 'REBUILD',
+    },
+    vm_states.DELETED: {
+        'default': 'DELETED',
+    },
+    vm_states.SOFT_DELETED: {
+        'default': 'SOFT_DELETED',
+    },
+    vm_states.SHELVED: {
+        'default': 'SHELVED',
+    },
+    vm_states.SHELVED_OFFLOADED: {
+        'default': 'SHELVED_OFFLOADED',
+    },
+}
+
+
+def _build_status_table():
+    """Expand _STATE_MAP over every task state nova defines, and no task
+    state at all, so that the status of a known combination is a plain
+    two-level lookup.
+    """
+    all_task_states = [None, 'default'] + sorted(
+        value for name, value in vars(task_states).items()
+        if not name.startswith('_') and isinstance(value, six.string_types))
+    return dict((vm_state, dict((task_state,
+                                 task_map.get(task_state, task_map['default']))
+                                for task_state in all_task_states))
+                for vm_state, task_map in _STATE_MAP.items())
+
+
+def _build_status_states():
+    """Reverse _STATE_MAP: map each status to the vm states showing it, and
+    for each vm state to (default, task_states).
+
+    If default is False, the vm state shows the status with task_states
+    only. If it is True, the status is the default of the vm state and it
+    shows with any task state but task_states, which map to other statuses.
+    """
+    status_states = {}
+    for vm_state, task_map in _STATE_MAP.items():
+        default_status = task_map['default']
+        overrides = set(task_state for task_state, status in task_map.items()
+                        if task_state != 'default' and
+                        status != default_status)
+        status_states.setdefault(default_status, {})[vm_state] = (
+            True, frozenset(overrides))
+        for task_state, status in task_map.items():
+            if task_state == 'default' or status == default_status:
+                continue
+            default, task_states_ = status_states.setdefault(
+                status, {}).get(vm_state, (False, frozenset()))
+            status_states[status][vm_state] = (
+                default, task_states_ | frozenset([task_state]))
+    return status_states
+
+
+# NOTE: both tables are built once at import: rendering the status of a
+# server is then a dict lookup, and a status filter a dict lookup too.
+_STATUS_TABLE = _build_status_table()
+_STATUS_STATES = _build_status_states()
+
+
+def status_from_state(vm_state, task_state='default'):
+    """Given vm_state and task_state, return a status string."""
+    try:
+        return _STATUS_TABLE[vm_state][task_state]
+    except KeyError:
+        pass
+    task_map = _STATE_MAP.get(vm_state, dict(default='UNKNOWN'))
+    status = task_map.get(task_state, task_map['default'])
+    if status == "UNKNOWN":
+        LOG.error("status is UNKNOWN from vm_state=%(vm_state)s "
+                  "task_state=%(task_state)s. Bad upgrade or db "
+                  "corrupted?",
+                  {'vm_state': vm_state, 'task_state': task_state})
+    return status
+
+
+def task_and_vm_state_from_status(statuses):
+    """Map the server's multiple status strings to list of vm states and
+    list of task states.
+    """
+    vm_states = set()
+    task_states = set()
+    lower_statuses = [status.lower() for status in statuses]
+    for state, task_map in _STATE_MAP.items():
+        for task_state, mapped_state in task_map.items():
+            status_string = mapped_state
+            if status_string.lower() in lower_statuses:
+                vm_states.add(state)
+                task_states.add(task_state)
+    # Add sort to avoid different order on set in Python 3
+    return sorted(vm_states), sorted(task_states)
+
+
+def states_from_status(statuses):
+    """Map status strings to the vm and task states showing any of them.
+
+    Unlike task_and_vm_state_from_status, the task states are kept per vm
+    state, so that a filter on them matches exactly the servers showing
+    the statuses.
+
+    :returns: dict mapping each vm state to (default, task_states). With
+              default False, only the servers with one of task_states match.
+              With default True, the servers with any other task state, or
+              none, match.
+    """
+    states = {}
+    for status in set(status.upper() for status in statuses):
+        for vm_state, (default, task_states_) in _STATUS_STATES.get(
+                status, {}).items():
+            if vm_state not in states:
+                states[vm_state] = (default, task_states_)
+                continue
+            other_default, other_task_states = states[vm_state]
+            if default:
+                states[vm_state] = (True, task_states_ - other_task_states)
+            elif other_default:
+                states[vm_state] = (True, other_task_states - task_states_)
+            else:
+                states[vm_state] = (False, other_task_states | task_states_)
+    return states
+
+
+def get_pagination_params(request):
+    """Return marker, limit tuple from request.
+
+    :param request: `wsgi.Request` possibly containing 'marker' and 'limit'
+                    GET variables. 'marker' is the id of the last element
+                    the client has seen, and 'limit' is the maximum number
+                    of items to return. If 'limit' is not specified, 0, or
+                    > max_limit, we default to max_limit. Negative values
+                    for either marker or limit will cause
+                    exc.HTTPBadRequest() exceptions to be raised.
+
+    """
+    params = {}
+    if 'limit' in request.GET:
+        params['limit'] = _get_int_param(request, 'limit')
+    if 'marker' in request.GET:
+        params['marker'] = _get_marker_param(request)
+    return params
+
+
+def _get_int_param(request, param):
+    """Extract integer param from request or fail."""
+    try:
+        int_param = int(request.GET[param])
+    except ValueError:
+        msg = _('%s param must be an integer') % param
+        raise webob.exc.HTTPBadRequest(explanation=msg)
+    if int_param < 0:
+        msg = _('%s param must be positive') % param
+        raise webob.exc.HTTPBadRequest(explanation=msg)
+    return int_param
+
+
+def _get_marker_param(request):
+    """Extract marker id from request or fail."""
+    marker = request.GET['marker']
+    if not uuidutils.is_uuid_like(marker):
+        msg = _('marker [%s] not found') % marker
+        raise webob.exc.HTTPBadRequest(explanation=msg)
+    return marker
+
+
+def get_limit_and_marker(request, max_limit=None):
+    """get limited parameter from request."""
+    params = get_pagination_params(request)
+    max_limit = max_limit or CONF.osapi_max_limit
+    limit = params.get('limit') or max_limit
+    limit = min(max_limit, limit)
+    marker = params.get('marker')
+
+    return limit, marker
+
+
+def get_sort_params(input_params, default_key='created_at',
+                    default_dir='desc'):
+    """Retrieves sort keys/directions parameters.
+
+    Processes the parameters to create a list of sort keys and sort directions
+    that correspond to the 'sort_key' and 'sort_dir' parameter values. These
+    sorting parameters can be specified multiple times in order to generate
+    the list of sort keys and directions.
+
+    The input parameters are not modified.
+
+    :param input_params: webob.multidict of request parameters (from
+                         fastrunner.wsgi.Request.params)
+    :param default_key: default sort key value, added to the list if no
+                        'sort_key' parameters are supplied
+    :param default_dir: default sort dir value, added to the list if no
+                        'sort_dir' parameters are supplied
+    :returns: list of sort keys, list of sort dirs
+    """
+    params = input_params.copy()
+    sort_keys = []
+    sort_dirs = []
+    while 'sort_key' in params:
+        sort_keys.append(params.pop('sort_key').strip())
+    while 'sort_dir' in params:
+        sort_dirs.append(params.pop('sort_dir').strip())
+    if len(sort_keys) == 0 and default_key:
+        sort_keys.append(default_key)
+    if len(sort_dirs) == 0 and default_dir:
+        sort_dirs.append(default_dir)
+    return sort_keys, sort_dirs
+
+
+def is_all_tenants(search_opts):
+    """Checks to see if the all_tenants flag is in search_opts
+
+    :param dict search_opts: The search options for a request
+    :returns: boolean indicating if all_tenants are being requested or not
+    """
+    all_tenants = search_opts.get('all_tenants')
+    if all_tenants:
+        try:
+            all_tenants = strutils.bool_from_string(all_tenants, True)
+        except ValueError as err:
+            raise exception.InvalidInput(six.text_type(err))
+    else:
+        # The empty string is considered enabling all_tenants
+        all_tenants = 'all_tenants' in search_opts
+    return all_tenants
+
+
+def remove_trailing_version_from_href(href):
+    """Removes the api version from the href.
+
+    Given: 'http://www.nova.com/compute/v1.1'
+    Returns: 'http://www.nova.com/compute'
+
+    Given: 'http://www.nova.com/v1.1'
+    Returns: 'http://www.nova.com'
+
+    """
+    parsed_url = urlparse.urlsplit(href)
+    url_parts = parsed_url.path.rsplit('/', 1)
+
+    # NOTE: this should match vX.X or vX
+    expression = re.compile(r'^v([0-9]+|[0-9]+\.[0-9]+)(/.*|$)')
+    if not expression.match(url_parts.pop()):
+        LOG.debug('href %s does not contain version', href)
+        raise ValueError(_('href %s does not contain version') % href)
+
+    new_path = url_join(*url_parts)
+    parsed_url = list(parsed_url)
+    parsed_url[2] = new_path
+    return urlparse.urlunsplit(parsed_url)
+
+
+def url_join(*parts):
+    """Convenience method for joining parts of a URL
+
+    Any leading and trailing '/' characters are removed, and the parts joined
+    together with '/' as a separator. If last element of 'parts' is an empty
+    string, the returned URL will have a trailing slash.
+    """
+    parts = parts or [""]
+    clean_parts = [part.strip("/") for part in parts if part]
+    if not parts[-1]:
+        # Empty last element should add a trailing slash
+        clean_parts.append("")
+    return "/".join(clean_parts)
+
+
+class ViewBuilder(object):
+    """Model API responses as dictionaries."""
+
+    def _get_project_id(self, request):
+        """Get project id from request url if present or empty string
+        otherwise
+        """
+        project_id = request.environ["fastrunner.context"].project_id
+        if project_id and project_id in request.url:
+            return project_id
+        return ''
+
+    def _get_links(self, request, identifier, collection_name):
+        return [{
+            "rel": "self",
+            "href": self._get_href_link(request, identifier, collection_name),
+        },
+        {
+            "rel": "bookmark",
+            "href": self._get_bookmark_link(request,
+                                            identifier,
+                                            collection_name),
+        }]
+
+    def _get_next_link(self, request, identifier, collection_name):
+        """Return href string with proper limit and marker params."""
+        params = request.params.copy()
+        params["marker"] = identifier
+        prefix = self._update_compute_link_prefix(request.application_url)
+        url = url_join(prefix,
+                       self._get_project_id(request),
+                       collection_name)
+        return "%s?%s" % (url, urlparse.urlencode(params))
+
+    def _get_collection_links(self, request, items, collection_name,
+                              id_key="uuid"):
+        """Retrieve 'next' link, if applicable. This is included if:
+        1) 'limit' param is specified and equals the number of items.
+        2) 'limit' param is specified but it exceeds CONF.osapi_max_limit,
+        in this case the number of items is CONF.osapi_max_limit.
+        3) 'limit' param is NOT specified but the number of items is
+        CONF.osapi_max_limit.
+        """
+        last_item = items[-1] if items else None
+        return self._get_page_links(request, len(items), last_item,
+                                    collection_name, id_key)
+
+    def _get_page_links(self, request, count, last_item, collection_name,
+                        id_key="uuid"):
+        """Same as _get_collection_links, for a page known only by its
+        size and its last item, as when the page is streamed.
+        """
+        links = []
+        max_items = min(
+            int(request.params.get("limit") or CONF.osapi_max_limit),
+            CONF.osapi_max_limit)
+        if max_items and max_items == count:
+            if id_key in last_item:
+                last_item_id = last_item[id_key]
+            else:
+                last_item_id = last_item["id"]
+            links.append({
+                "rel": "next",
+                "href": self._get_next_link(request,
+                                            last_item_id,
+                                            collection_name),
+            })
+        return links
+
+    def _get_href_link(self, request, identifier, collection_name):
+        """Return an href string pointing to this object."""
+        prefix = self._update_compute_link_prefix(request.application_url)
+        return url_join(prefix,
+                        self._get_project_id(request),
+                        collection_name,
+                        str(identifier))
+
+    def _get_bookmark_link(self, request, identifier, collection_name):
+        """Create a URL that refers to a specific resource."""
+        base_url = remove_trailing_version_from_href(request.application_url)
+        base_url = self._update_compute_link_prefix(base_url)
+        return url_join(base_url,
+                        self._get_project_id(request),
+                        collection_name,
+                        str(identifier))
+
+    def _update_link_prefix(self, orig_url, prefix):
+        if not prefix:
+            return orig_url
+        url_parts = list(urlparse.urlsplit(orig_url))
+        prefix_parts = list(urlparse.urlsplit(prefix))
+        url_parts[0:2] = prefix_parts[0:2]
+        url_parts[2] = prefix_parts[2] + url_parts[2]
+        return urlparse.urlunsplit(url_parts).rstrip('/')
+
+    def _update_compute_link_prefix(self, orig_url):
+        return self._update_link_prefix(orig_url,
+                                        CONF.osapi_compute_link_prefix)
@@ -0,0 +1,44 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from fastrunner.api.openstack import extensions
+from fastrunner.api.openstack import wsgi
+from fastrunner import metrics
+
+ALIAS = 'os-fastrunner-metrics'
+authorize = extensions.os_compute_authorizer(ALIAS)
+
+
+class FastrunnerMetricsController(wsgi.Controller):
+    """Stats of the worker serving the request."""
+
+    @extensions.expected_errors(())
+    def index(self, req):
+        context = req.environ['fastrunner.context']
+        authorize(context)
+        return {'metrics': metrics.collect()}
+
+
+class FastrunnerMetrics(extensions.V21APIExtensionBase):
+    """Per-worker fastrunner metrics, such as DB executor and cache stats."""
+
+    name = "FastrunnerMetrics"
+    alias = ALIAS
+    version = 1
+
+    def get_resources(self):
+        resources = [extensions.ResourceExtension(
+            ALIAS, FastrunnerMetricsController())]
+        return resources
+
+    def get_controller_extensions(self):
+        return []
@@ -15,8 +15,11 @@
 #    under the License.
 
 import base64
+import hashlib
+import itertools
 import re
 import json
+import time
 
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -29,17 +32,48 @@ import stevedore
 import webob
 from webob import exc
 
+from fastrunner.api.openstack import common
+from fastrunner.api.openstack.compute.views import servers as views_servers
 from fastrunner.api.openstack import extensions
 from fastrunner.api.openstack import db
+from fastrunner.api.openstack.db import snapshot
 from fastrunner.api.openstack import wsgi
 from fastrunner.api import validation
+from fastrunner.compute import vm_states
 from fastrunner import exception
 from fastrunner.i18n import _
 from fastrunner.i18n import _LW
+from fastrunner import metrics
 from fastrunner import utils
 
 ALIAS = 'servers'
 
+# Sort keys that expose admin-only attributes of a server.
+ADMIN_SORT_KEYS = ('host', 'node')
+
+# instance_get_all filter of each search option. Options other than the
+# ones of _get_server_search_options are only left to admins.
+SEARCH_FILTERS = {
+    'name': 'display_name',
+    'image': 'image_ref',
+    'flavor': 'flavor',
+    'vm_state': 'vm_state',
+    'task_state': 'task_state',
+    'host': 'host',
+    'node': 'node',
+    'availability_zone': 'availability_zone',
+    'changes-since': 'changes-since',
+    'changes-before': 'changes-before',
+    'status': 'status',
+    'project_id': 'project_id',
+    'user_id': 'user_id',
+}
+
+# Keys of the request cache holding the extras of the servers of a detail
+# listing, as returned by db.instance_get_extras.
+INSTANCE_EXTRAS = ('instance_metadata', 'instance_info_caches',
+                   'instance_security_groups', 'instance_faults')
+
 CONF = cfg.CONF
 CONF.import_opt('extensions_blacklist', 'fastrunner.api.openstack',
                 group='osapi_v21')
@@ -50,10 +84,25 @@ CONF.import_opt('extensions_whitelist', 'fastrunner.api.openstack',
 LOG = logging.getLogger(__name__)
 authorize = extensions.os_compute_authorizer(ALIAS)
 
+_SHOW_CACHE = None
+
+
+def _show_cache():
+    global _SHOW_CACHE
+    if _SHOW_CACHE is None:
+        _SHOW_CACHE = utils.LRUCache(CONF.servers_show_cache_size,
+                                     sizeof=utils.deep_getsizeof)
+    return _SHOW_CACHE
+
+
+metrics.register('server_show_cache', lambda: _show_cache().stats())
+
 
 class ServersController(wsgi.Controller):
     """The Server API base controller class for the OpenStack API."""
 
+    _view_builder_class = views_servers.ViewBuilder
+
     @staticmethod
     def _add_location(robj):
         # Just in case...
@@ -72,7 +121,7 @@ class ServersController(wsgi.Controller):
         super(ServersController, self).__init__(**kwargs)
 
 
-    @extensions.expected_errors((400, 403))
+    @extensions.expected_errors((400, 403, 503))
     def index(self, req):
         """Returns a list of server names and ids for a given user."""
         context = req.environ['fastrunner.context']
@@ -81,10 +130,12 @@ class ServersController(wsgi.Controller):
             servers = self._get_servers(req, is_detail=False)
         except exception.Invalid as err:
             raise exc.HTTPBadRequest(explanation=err.format_message())
+        except exception.DBDeadlineExceeded as err:
+            raise _deadline_exceeded(err)
         return servers
 
 
-    @extensions.expected_errors((400, 403))
+    @extensions.expected_errors((400, 403, 503))
     def detail(self, req):
         """Returns a list of server details for a given user."""
 
@@ -94,6 +145,8 @@ class ServersController(wsgi.Controller):
             servers = self._get_servers(req, is_detail=True)
         except exception.Invalid as err:
             raise exc.HTTPBadRequest(explanation=err.format_message())
+        except exception.DBDeadlineExceeded as err:
+            raise _deadline_exceeded(err)
         return servers
 
 
@@ -102,46 +155,382 @@ class ServersController(wsgi.Controller):
         
         search_opts = {}
         search_opts.update(req.GET)
-        LOG.info("=====TODO: handling more search options =======")
-        
+
         context = req.environ['fastrunner.context']
+        remove_invalid_options(context, search_opts,
+                               _get_server_search_options(req))
+
+        # Verify search by 'status' contains a valid status. The db layer
+        # filters on the vm and task states showing it. Like nova, unknown
+        # statuses are ignored next to known ones, and rejected alone.
+        search_opts.pop('status', None)
+        status_vm_states = None
+        if 'status' in req.GET.keys():
+            statuses = req.GET.getall('status')
+            status_vm_states = common.states_from_status(statuses)
+            if not status_vm_states:
+                msg = _('Invalid status value')
+                raise exc.HTTPBadRequest(explanation=msg)
+            search_opts['status'] = statuses
+
+        for opt in ('changes-since', 'changes-before'):
+            if opt in search_opts:
+                try:
+                    search_opts[opt] = timeutils.parse_isotime(
+                        search_opts[opt])
+                except ValueError:
+                    msg = _('Invalid %s value') % opt
+                    raise exc.HTTPBadRequest(explanation=msg)
+        if ('changes-since' in search_opts and
+                'changes-before' in search_opts and
+                search_opts['changes-since'] > search_opts['changes-before']):
+            msg = _('The value of changes-since must be less than or equal '
+                    'to changes-before.')
+            raise exc.HTTPBadRequest(explanation=msg)
 
         # all_tenant to boolean
-        # all_tenants = common.is_all_tenants(search_opts)
-        all_tenants = True #fake
+        all_tenants = common.is_all_tenants(search_opts)
+        # use the boolean from here on out so remove the entry from
+        # search_opts if it's there
+        search_opts.pop('all_tenants', None)
         if all_tenants:
             if is_detail:
                 authorize(context, action="detail:get_all_tenants")
             else:
                 authorize(context, action="index:get_all_tenants")
+            # NOTE: like nova, tenant_id is an alias of project_id.
+            if 'tenant_id' in search_opts and 'project_id' not in search_opts:
+                search_opts['project_id'] = search_opts['tenant_id']
         else:
             if context.project_id:
                 search_opts['project_id'] = context.project_id
             else:
                 search_opts['user_id'] = context.user_id
 
-        # limit, marker = common.get_limit_and_marker(req)
-        # sort_keys, sort_dirs = common.get_sort_params(req.params)
+        limit, marker = common.get_limit_and_marker(req)
+        sort_keys, sort_dirs = common.get_sort_params(req.params)
+        if not context.is_admin:
+            # NOTE: host and node are admin-only attributes, so like nova
+            # we silently drop them from the sort keys of other users.
+            sort_keys, sort_dirs = _remove_admin_sort_keys(sort_keys,
+                                                           sort_dirs)
+
+        # Like nova, list deleted servers only when asked to: through
+        # changes-since, which also returns the servers deleted since then,
+        # or through the deleted option, which only admins may pass.
+        if 'deleted' in search_opts:
+            if strutils.bool_from_string(search_opts.pop('deleted')):
+                context.read_deleted = 'only'
+            else:
+                context.read_deleted = 'no'
+        elif 'changes-since' in search_opts:
+            context.read_deleted = 'yes'
+
+        if status_vm_states is not None and list(status_vm_states) == [
+                vm_states.DELETED]:
+            if context.is_admin:
+                context.read_deleted = 'only'
+            else:
+                msg = _("Only administrators may list deleted instances")
+                raise exc.HTTPForbidden(explanation=msg)
+
+        filters = _get_filters(search_opts)
 
         if is_detail:
-            try:
-                servers = db.instance_get_all(context)
-            except:
-                pass
-                LOG.info("==========TODO: handing db.instance_get_all() exceptions=========")
+            fields = _get_fields(req, views_servers.DETAIL_FIELDS)
+            extras = _extras_keys(fields)
+            if (filters == {'project_id': context.project_id} and
+                    context.read_deleted == 'no'):
+                servers = self._get_servers_from_snapshot(
+                    req, context, fields, extras, limit=limit, marker=marker,
+                    sort_keys=sort_keys, sort_dirs=sort_dirs)
+                if servers is not None:
+                    return servers
+            view = _detail_view(fields)
+            streaming = CONF.servers_detail_streaming
         else:
-            pass
-            LOG.info("=======TODO: _get_servers() for index==========")
-        
+            fields = _get_fields(req, views_servers.INDEX_FIELDS)
+            view = 'index'
+            streaming = False
+
+        listing_etag = None
+        if CONF.servers_etag:
+            # NOTE: the fingerprint is read on the connection of the
+            # listing, so both come from the same replica.
+            listing_etag = _ListingETag(req, context)
+        if streaming:
+            get_all = db.instance_get_all_iter
+        else:
+            get_all = db.instance_get_all
+        try:
+            instance_list = get_all(context, filters=filters, limit=limit,
+                                    marker=marker, sort_keys=sort_keys,
+                                    sort_dirs=sort_dirs, view=view,
+                                    not_modified=listing_etag)
+        except exception.MarkerNotFound:
+            msg = _('marker [%s] not found') % marker
+            raise exc.HTTPBadRequest(explanation=msg)
+        etag = listing_etag and listing_etag.etag
+        if instance_list is None:
+            return _not_modified('"%s"' % etag)
+
+        if not is_detail:
+            servers = self._view_builder.index(req, instance_list, fields)
+        elif streaming:
+            instance_list = self._cache_extras_stream(req, context,
+                                                      instance_list, extras)
+            servers = self._view_builder.detail_stream(req, instance_list,
+                                                       fields)
+        else:
+            self._cache_extras(req, context, instance_list, extras)
+            servers = self._view_builder.detail(req, instance_list, fields)
+        if etag is not None:
+            if not isinstance(servers, wsgi.ResponseObject):
+                servers = wsgi.ResponseObject(servers)
+            servers['ETag'] = '"%s"' % etag
         return servers
 
 
-    @extensions.expected_errors(404)
+    def _get_servers_from_snapshot(self, req, context, fields, extras,
+                                   **kwargs):
+        """Answer a servers/detail request from the servers snapshot.
+
+        The snapshot holds the whole detail view of the servers, which is
+        restricted to fields when rendered.
+
+        Returns None when the snapshot is disabled, older than the request
+        accepts, or does not know the marker.
+        """
+        if not CONF.servers_detail_snapshot:
+            return None
+        max_staleness = CONF.servers_snapshot_max_staleness
+        cache_control = req.cache_control
+        if cache_control.no_cache:
+            return None
+        if cache_control.max_age is not None:
+            max_staleness = min(max_staleness, cache_control.max_age)
+        age = snapshot.age()
+        if age is None or age > max_staleness:
+            return None
+        # NOTE: the snapshot only changes when it is refreshed, which does
+        # not happen between these calls, as they do not yield.
+        fingerprint = snapshot.fingerprint(context)
+        try:
+            instance_list = snapshot.instance_get_all(context, **kwargs)
+        except exception.MarkerNotFound:
+            # The marker may be younger than the snapshot.
+            return None
+        etag = None
+        if CONF.servers_etag:
+            # The extras of the servers are read from the database and are
+            # not in the fingerprint of the snapshot, so its ETags are weak.
+            opaque_tag = _etag(req, context, fingerprint)
+            etag = 'W/"%s"' % opaque_tag
+            if opaque_tag in req.if_none_match:
+                response = _not_modified(etag)
+                response.headers['Age'] = str(int(age))
+                return response
+        self._cache_extras(req, context, instance_list, extras)
+        servers = wsgi.ResponseObject(
+            self._view_builder.detail(req, instance_list, fields))
+        servers['Age'] = str(int(age))
+        if etag is not None:
+            servers['ETag'] = etag
+        return servers
+
+    @staticmethod
+    def _cache_extras(req, context, servers, keys=INSTANCE_EXTRAS,
+                      independent=False):
+        """Read the metadata, addresses, security groups and faults of
+        servers in bulk, or the extras of keys only, and cache them on req
+        for the view builder.
+        """
+        if not keys:
+            return
+        extras = db.instance_get_extras(context,
+                                        [server['id'] for server in servers],
+                                        keys=keys, independent=independent)
+        for key in keys:
+            req.cache_db_items(key, extras.get(key, []), 'instance_uuid')
+
+    def _cache_extras_stream(self, req, context, servers,
+                             keys=INSTANCE_EXTRAS):
+        """Like _cache_extras, for an iterator of servers: the extras are
+        read for each CONF.database.stream_fetch_size servers before they
+        are yielded.
+
+        The listing holds its connection while it is read, so the extras
+        are read on another one. Those of a batch are dropped from req once
+        its servers are rendered, keeping memory bounded by the batch size.
+        """
+        servers = iter(servers)
+        try:
+            while True:
+                batch = list(itertools.islice(
+                    servers, CONF.database.stream_fetch_size))
+                if not batch:
+                    break
+                for key in keys:
+                    req.uncache_db_items(key)
+                self._cache_extras(req, context, batch, keys,
+                                   independent=True)
+                for server in batch:
+                    yield server
+        finally:
+            for key in keys:
+                req.uncache_db_items(key)
+
+    @extensions.expected_errors((400, 404, 503))
     def show(self, req, id):
         """Returns server details by server id."""
-        context = req.environ['fasrunner.context']
+        context = req.environ['fastrunner.context']
         authorize(context, action="show")
-   
+        fields = _get_fields(req, views_servers.SHOW_FIELDS)
+        try:
+            server = self._get_server(req, context, id)
+        except exception.InstanceNotFound as err:
+            raise exc.HTTPNotFound(explanation=err.format_message())
+        except exception.DBDeadlineExceeded as err:
+            raise _deadline_exceeded(err)
+        return self._view_builder.show(req, server, fields)
+
+    def _get_server(self, req, context, instance_uuid):
+        """Return the detail view of a server, without its links.
+
+        Rendered servers are kept in the show cache by uuid, version and
+        microversion. The version is read by db.instance_get_detail, with
+        aggregates over the instance row and the rows of its extras, so a
+        cached server is only returned while they are unchanged and it is
+        younger than CONF.servers_show_cache_ttl. The server is read on the
+        connection of its version, so both come from the same replica.
+        """
+        if not CONF.servers_show_cache_size:
+            return self._render_server(
+                req, *db.instance_get_detail(context, instance_uuid))
+        lookup = _ShowCacheLookup(req, context, instance_uuid)
+        result = db.instance_get_detail(context, instance_uuid,
+                                        not_modified=lookup)
+        if result is None:
+            return lookup.server
+        server = self._render_server(req, *result)
+        _show_cache()[lookup.key] = (lookup.now, server)
+        return server
+
+    def _render_server(self, req, instance, extras):
+        for key in INSTANCE_EXTRAS:
+            req.cache_db_items(key, extras.get(key, []), 'instance_uuid')
+        return self._view_builder.detail_server(req, instance)
+
+
+class _ShowCacheLookup(object):
+    """The not_modified callable of a server show request, looking the
+    server up in the show cache by its version.
+    """
+
+    def __init__(self, req, context, instance_uuid):
+        self.req = req
+        self.context = context
+        self.instance_uuid = instance_uuid
+        self.key = None
+        self.now = None
+        self.server = None
+
+    def __call__(self, version):
+        # NOTE: the details of faults are only shown to admins.
+        self.key = (self.instance_uuid, version,
+                    self.req.api_version_request.get_string(),
+                    self.context.is_admin)
+        self.now = time.time()
+        cached = _show_cache().get(self.key)
+        if cached is None:
+            return False
+        rendered_at, self.server = cached
+        ttl = CONF.servers_show_cache_ttl
+        return not ttl or self.now - rendered_at < ttl
+
+
+def _deadline_exceeded(err):
+    """Return the 503 answering a request whose database deadline passed."""
+    return exc.HTTPServiceUnavailable(
+        explanation=err.format_message(),
+        headers={'Retry-After': CONF.db_retry_after})
+
+
+def _get_fields(req, allowed):
+    """Return the keys of the servers view the fields parameter of req
+    asks for, with id, or None when it does not restrict them.
+
+    :raises: webob.exc.HTTPBadRequest if a key is not one of allowed
+    """
+    if 'fields' not in req.GET:
+        return None
+    fields = set()
+    for value in req.GET.getall('fields'):
+        fields.update(field.strip() for field in value.split(',')
+                      if field.strip())
+    unknown = fields - allowed
+    if unknown:
+        msg = _('Invalid fields: %s') % ', '.join(sorted(unknown))
+        raise exc.HTTPBadRequest(explanation=msg)
+    fields.add('id')
+    return frozenset(fields)
+
+
+def _detail_view(fields):
+    """Return the view the db layer renders servers/detail fields with."""
+    if fields is None:
+        return 'detail'
+    db_fields = set(fields)
+    if 'fault' in fields:
+        # The fault is only shown for servers in error or deleted.
+        db_fields.add('OS-EXT-STS:vm_state')
+    return tuple(sorted(db_fields))
+
+
+def _extras_keys(fields):
+    """Return the request cache keys of the extras fields shows."""
+    if fields is None:
+        return INSTANCE_EXTRAS
+    return tuple(key for field, key in
+                 sorted(views_servers.EXTRA_FIELDS.items())
+                 if field in fields)
+
+
+def _etag(req, context, fingerprint):
+    """Return the opaque tag of a servers listing whose servers have
+    fingerprint.
+
+    The listing also depends on the request URL, holding its filters, its
+    sort, its page and the base of its links, on the microversion, and on
+    the context, which decides on the project, the deleted servers and the
+    details of faults shown.
+    """
+    key = (fingerprint, req.url, req.api_version_request.get_string(),
+           context.project_id, context.read_deleted, context.is_admin)
+    return hashlib.sha1(utils.utf8(repr(key))).hexdigest()
+
+
+class _ListingETag(object):
+    """The not_modified callable of a servers listing request, keeping the
+    opaque tag of the listing computed from its fingerprint.
+    """
+
+    def __init__(self, req, context):
+        self.req = req
+        self.context = context
+        self.etag = None
+
+    def __call__(self, fingerprint):
+        if fingerprint is None:
+            return False
+        self.etag = _etag(self.req, self.context, fingerprint)
+        return self.etag in self.req.if_none_match
+
+
+def _not_modified(etag):
+    """Return the 304 answering a request whose If-None-Match matched."""
+    return exc.HTTPNotModified(headers={'ETag': etag})
+
 
 def remove_invalid_options(context, search_options, allowed_search_options):
     """Remove search options that are not valid for non-admin API/context."""
@@ -160,8 +549,38 @@ def remove_invalid_options(context, search_options, allowed_search_options):
             search_options.pop(opt, None)
 
 
+def _remove_admin_sort_keys(sort_keys, sort_dirs):
+    """Drop the sort keys only admins may sort on, with their directions."""
+    kept_keys = []
+    kept_dirs = []
+    for i, key in enumerate(sort_keys):
+        if key in ADMIN_SORT_KEYS:
+            continue
+        kept_keys.append(key)
+        if i < len(sort_dirs):
+            kept_dirs.append(sort_dirs[i])
+    return kept_keys, kept_dirs
+
+
 def _get_server_search_options(req):
-    LOG.info("=========TODO=================")
+    """Return server search options allowed by non-admin."""
+    return ('name', 'status', 'image', 'flavor', 'changes-since',
+            'changes-before', 'all_tenants')
+
+
+def _get_filters(search_opts):
+    """Translate search options into instance_get_all filters.
+
+    Options without a filter, such as the ones only admins may pass that
+    fastrunner does not support, are ignored.
+    """
+    filters = {}
+    for opt, value in search_opts.items():
+        name = SEARCH_FILTERS.get(opt)
+        if name is None:
+            continue
+        filters[name] = value
+    return filters
 
 
 class Servers(extensions.V21APIExtensionBase):
@@ -0,0 +1,193 @@
+# Copyright 2010-2011 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from fastrunner.api.openstack import common
+from fastrunner.api.openstack import wsgi
+from fastrunner.compute import vm_states
+
+_ISO8601_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Request cache key of the extras shown in each key of the servers/detail
+# view.
+EXTRA_FIELDS = {
+    'metadata': 'instance_metadata',
+    'addresses': 'instance_info_caches',
+    'security_groups': 'instance_security_groups',
+    'fault': 'instance_faults',
+}
+
+# Keys of each view of a server which the fields parameter may select.
+DETAIL_FIELDS = frozenset([
+    'id', 'name', 'status', 'tenant_id', 'flavor',
+    'OS-EXT-STS:power_state', 'OS-EXT-STS:task_state',
+    'OS-EXT-STS:vm_state', 'OS-EXT-AZ:availability_zone',
+    'OS-EXT-SRV-ATTR:host', 'OS-SRV-USG:created_at']).union(EXTRA_FIELDS)
+INDEX_FIELDS = frozenset(['id', 'name', 'links'])
+SHOW_FIELDS = DETAIL_FIELDS.union(['links'])
+
+
+class ViewBuilder(common.ViewBuilder):
+    """Model a server API response as a python dictionary."""
+
+    _collection_name = "servers"
+
+    def index(self, request, servers, fields=None):
+        """Show a list of servers without many details.
+
+        The servers are rendered by the db layer with their id and name
+        only; this adds their links.
+
+        :param fields: keys of INDEX_FIELDS to show, all of them if None
+        """
+        servers = [self.basic(request, server) for server in servers]
+        if fields is not None:
+            servers = [_select(server, fields) for server in servers]
+        return self._list_view(request, servers, self._collection_name)
+
+    def basic(self, request, server):
+        """Generic, non-detailed view of a server."""
+        return {
+            "id": server["id"],
+            "name": server["name"],
+            "links": self._get_links(request,
+                                     server["id"],
+                                     self._collection_name),
+        }
+
+    def detail(self, request, servers, fields=None):
+        """Detailed view of a list of servers.
+
+        The servers are already rendered by the db layer; this adds the
+        extras cached on the request, wraps them in the collection body and
+        adds the pagination links.
+
+        :param fields: keys of DETAIL_FIELDS to show, all of them if None.
+                       Only the extras of these keys are cached on the
+                       request then.
+        """
+        coll_name = self._collection_name + '/detail'
+        servers = [self._show_extras(request, server, fields)
+                   for server in servers]
+        return self._list_view(request, servers, coll_name)
+
+    def detail_stream(self, request, servers, fields=None):
+        """Detailed view of a list of servers, sent as it is produced.
+
+        :param servers: iterable of rendered servers, consumed while the
+                        response body is written
+        :param fields: as for detail
+        """
+        coll_name = self._collection_name + '/detail'
+
+        def links_builder(count, last_server):
+            return self._get_page_links(request, count, last_server,
+                                        coll_name, id_key="id")
+
+        servers = (self._show_extras(request, server, fields)
+                   for server in servers)
+        return wsgi.StreamingResponseObject({'servers': servers},
+                                            links_builder=links_builder)
+
+    def show(self, request, server, fields=None):
+        """Detailed view of a single server.
+
+        :param server: the server as returned by detail_server, which may
+                       be shared with other requests
+        :param fields: keys of SHOW_FIELDS to show, all of them if None
+        """
+        server = dict(server)
+        server["links"] = self._get_links(request,
+                                          server["id"],
+                                          self._collection_name)
+        if fields is not None:
+            server = _select(server, fields)
+        return {"server": server}
+
+    def detail_server(self, request, server):
+        """Detailed view of a server rendered by the db layer, without its
+        links, which depend on the request URL.
+        """
+        return self._show_extras(request, server)
+
+    def _show_extras(self, request, server, fields=None):
+        """Return a copy of server with the metadata, addresses, security
+        groups and fault cached on request, restricted to fields if given.
+
+        server itself may be shared with other requests, so it is never
+        modified.
+        """
+        def shown(key):
+            return fields is None or key in fields
+
+        uuid = server['id']
+        server = dict(server)
+        if shown('metadata'):
+            metadata = request.get_db_item('instance_metadata', uuid)
+            server['metadata'] = metadata['metadata'] if metadata else {}
+        if shown('addresses'):
+            info_cache = request.get_db_item('instance_info_caches', uuid)
+            server['addresses'] = (info_cache['addresses'] if info_cache
+                                   else {})
+        if shown('security_groups'):
+            security_groups = request.get_db_item(
+                'instance_security_groups', uuid)
+            if security_groups:
+                server['security_groups'] = (
+                    security_groups['security_groups'])
+        # NOTE: like nova, the fault is only shown for servers in error or
+        # deleted.
+        if shown('fault') and server['OS-EXT-STS:vm_state'] in (
+                vm_states.ERROR, vm_states.DELETED):
+            fault = request.get_db_item('instance_faults', uuid)
+            if fault:
+                server['fault'] = self._get_fault(request, fault)
+        if fields is not None:
+            server = _select(server, fields)
+        return server
+
+    def _get_fault(self, request, fault):
+        fault_dict = {
+            "code": fault["code"],
+            "created": fault["created_at"].strftime(_ISO8601_TIME_FORMAT),
+            "message": fault["message"],
+        }
+
+        if fault.get('details', None):
+            is_admin = False
+            context = request.environ["fastrunner.context"]
+            if context:
+                is_admin = getattr(context, 'is_admin', False)
+
+            if is_admin or fault['code'] != 500:
+                fault_dict['details'] = fault["details"]
+
+        return fault_dict
+
+    def _list_view(self, request, servers, coll_name):
+        servers_dict = dict(servers=servers)
+        servers_links = self._get_collection_links(request,
+                                                   servers,
+                                                   coll_name,
+                                                   id_key="id")
+        if servers_links:
+            servers_dict["servers_links"] = servers_links
+
+        return servers_dict
+
+
+def _select(server, fields):
+    """Return a copy of server with the keys of fields only."""
+    return dict((key, value) for key, value in server.items()
+                if key in fields)
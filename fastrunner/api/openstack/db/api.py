@@ -7,21 +7,338 @@ these objects be simple dictionaries.
 
 """
 
+import collections
+import heapq
+import itertools
+import time
+
 from oslo_config import cfg
-from oslo_db import concurrency
 from oslo_log import log as logging
+import six.moves.urllib.parse as urlparse
+
+from fastrunner.api.openstack.db import concurrency
+from fastrunner import context as fastrunner_context
+from fastrunner import exception
+from fastrunner.i18n import _LW
+from fastrunner import metrics
 
  
 CONF = cfg.CONF
 _BACKEND_MAPPING = {'sqlalchemy': 'fastrunner.api.openstack.db.sqlalchemy.api'}
 
-IMPL = concurrency.TpoolDbapiWrapper(CONF, backend_mapping=_BACKEND_MAPPING)
+IMPL = concurrency.DbapiExecutor(CONF, backend_mapping=_BACKEND_MAPPING)
+metrics.register('db_executor', IMPL.stats)
 
 LOG = logging.getLogger(__name__)
 
-def instance_get_all(context):
-    """Get all instances."""
-    return IMPL.instance_get_all(context)
+CellMapping = collections.namedtuple('CellMapping',
+                                     ['name', 'database_connection'])
+
+# Number of listings each cell failed to answer, by cell name.
+_CELL_FAILURES = collections.Counter()
+metrics.register('cells', lambda: {'failures': dict(_CELL_FAILURES)})
+
+
+def get_cell_mappings():
+    """Return the cells configured in [database]/cell_connection."""
+    return [CellMapping(_connection_name(connection), connection)
+            for connection in CONF.database.cell_connection]
+
+
+def _connection_name(connection):
+    """Name a database by the host and path of its connection URL."""
+    url = urlparse.urlsplit(connection)
+    return '%s%s' % (url.hostname or '', url.path)
+
+
+def create_context_manager(connection):
+    """Return a context manager for a cell database connection."""
+    return IMPL.create_context_manager(connection=connection)
+
+
+def instance_get_all(context, filters=None, limit=None, marker=None,
+                     sort_keys=None, sort_dirs=None, view='detail',
+                     not_modified=None):
+    """Get all instances that match all filters, rendered as the 'detail'
+    or 'index' view of the servers.
+
+    With not_modified, None is returned when it returns True for the value
+    instance_get_fingerprint returns for filters and view, which is read
+    from the database the listing is.
+    """
+    cell_mappings = get_cell_mappings()
+    if cell_mappings:
+        if not_modified is not None and not_modified(
+                instance_get_fingerprint(context, filters=filters,
+                                         view=view)):
+            return None
+        return _instance_get_all_cells(context, cell_mappings, filters,
+                                       limit, marker, sort_keys, sort_dirs,
+                                       view)
+    return IMPL.instance_get_all(context, filters=filters, limit=limit,
+                                 marker=marker, sort_keys=sort_keys,
+                                 sort_dirs=sort_dirs, view=view,
+                                 not_modified=not_modified)
+
+
+def instance_get_all_iter(context, filters=None, limit=None, marker=None,
+                          sort_keys=None, sort_dirs=None, view='detail',
+                          not_modified=None):
+    """Get all instances that match all filters as an iterator fed from a
+    server-side cursor, or None as instance_get_all returns it.
+
+    Listings merged from several cells are not streamed.
+    """
+    if get_cell_mappings():
+        servers = instance_get_all(context, filters=filters, limit=limit,
+                                   marker=marker, sort_keys=sort_keys,
+                                   sort_dirs=sort_dirs, view=view,
+                                   not_modified=not_modified)
+        if servers is None:
+            return None
+        return iter(servers)
+    return IMPL.instance_get_all_iter(context, filters=filters, limit=limit,
+                                      marker=marker, sort_keys=sort_keys,
+                                      sort_dirs=sort_dirs, view=view,
+                                      not_modified=not_modified)
+
+
+def instance_get_fingerprint(context, filters=None, view='detail'):
+    """Get a value which changes when the instances instance_get_all
+    returns for filters and view do.
+
+    Returns None when a cell failed to answer, as the listing may then
+    differ without the value changing. Cells are read from their primary
+    database, like their listings.
+    """
+    cell_mappings = get_cell_mappings()
+    if cell_mappings:
+        fingerprints = _scatter_gather_cells(context, cell_mappings,
+                                             IMPL.instance_get_fingerprint,
+                                             filters=filters, view=view)
+        if len(fingerprints) < len(cell_mappings):
+            return None
+        return tuple(fingerprints)
+    return IMPL.instance_get_fingerprint(context, filters=filters, view=view)
+
+
+def instance_get_all_changed(context, changed_since=None):
+    """Get the instances of every project changed since a time, with the
+    values of their sortable columns.
+    """
+    cell_mappings = get_cell_mappings()
+    if cell_mappings:
+        return list(itertools.chain.from_iterable(_scatter_gather_cells(
+            context, cell_mappings, IMPL.instance_get_all_changed,
+            changed_since=changed_since, partial=False)))
+    return IMPL.instance_get_all_changed(context, changed_since=changed_since)
+
+
+def instance_get_all_uuids(context):
+    """Get the set of the uuids of the instances of every project."""
+    cell_mappings = get_cell_mappings()
+    if cell_mappings:
+        uuids = set()
+        for cell_uuids in _scatter_gather_cells(context, cell_mappings,
+                                                IMPL.instance_get_all_uuids,
+                                                partial=False):
+            uuids.update(cell_uuids)
+        return uuids
+    return IMPL.instance_get_all_uuids(context)
+
+
+def instance_get_by_uuid(context, instance_uuid):
+    """Get an instance, rendered as the 'detail' view of the server."""
+    cell_mappings = get_cell_mappings()
+    if cell_mappings:
+        return _instance_get_cells(context, cell_mappings,
+                                   IMPL.instance_get_by_uuid, instance_uuid)
+    return IMPL.instance_get_by_uuid(context, instance_uuid)
+
+
+def instance_get_detail(context, instance_uuid, not_modified=None):
+    """Get an instance and its extras, read from one database, or None
+    when not_modified returns True for the version of the instance.
+    """
+    cell_mappings = get_cell_mappings()
+    if cell_mappings:
+        return _instance_get_cells(context, cell_mappings,
+                                   IMPL.instance_get_detail, instance_uuid,
+                                   not_modified=not_modified)
+    return IMPL.instance_get_detail(context, instance_uuid,
+                                    not_modified=not_modified)
+
+
+def _instance_get_cells(context, cell_mappings, fn, instance_uuid, **kwargs):
+    """Call fn for an instance in every cell and return the result of the
+    cell the instance is in.
+
+    :raises: fastrunner.exception.InstanceNotFound if no cell that answered
+             has the instance
+    """
+    def get(cctxt):
+        try:
+            return True, fn(cctxt, instance_uuid, **kwargs)
+        except exception.InstanceNotFound:
+            return False, None
+
+    for found, result in _scatter_gather_cells(context, cell_mappings, get):
+        if found:
+            return result
+    raise exception.InstanceNotFound(instance_id=instance_uuid)
+
+
+def instance_get_extras(context, instance_uuids, keys=None,
+                        independent=False):
+    """Get the metadata, addresses, security groups and latest fault of
+    instances, by related table, or the related tables of keys only.
+
+    With independent, they are read on a connection of their own, as
+    needed while the listing of instance_get_all_iter is being read.
+    """
+    cell_mappings = get_cell_mappings()
+    if cell_mappings:
+        # NOTE: the cell of each instance is not known here, every cell is
+        # asked for all of them. The extras of the instances of a cell that
+        # fails are left out.
+        extras = {}
+        for cell_extras in _scatter_gather_cells(context, cell_mappings,
+                                                 IMPL.instance_get_extras,
+                                                 instance_uuids, keys=keys):
+            for key, items in cell_extras.items():
+                extras.setdefault(key, []).extend(items)
+        return extras
+    return IMPL.instance_get_extras(context, instance_uuids, keys=keys,
+                                    independent=independent)
+
+
+def _instance_get_all_cells(context, cell_mappings, filters, limit, marker,
+                            sort_keys, sort_dirs, view):
+    """List instances across cells.
+
+    Every cell is queried concurrently for at most limit servers after the
+    marker, and the sorted listings are merged. A cell that fails or does
+    not answer within [database]/cell_timeout is left out of the result.
+    """
+    marker_values = None
+    if marker is not None:
+        marker_values = _instance_get_marker_values_cells(
+            context, cell_mappings, marker, filters, sort_keys, sort_dirs)
+    results = _scatter_gather_cells(
+        context, cell_mappings, IMPL.instance_get_all_sortable,
+        filters=filters, limit=limit, marker_values=marker_values,
+        sort_keys=sort_keys, sort_dirs=sort_dirs, view=view)
+    # NOTE: sort keys of different cells can be equal, the cell index and
+    # the position in the cell listing keep servers from being compared.
+    listings = [((sort_key, i, j, server)
+                 for j, (sort_key, server) in enumerate(listing))
+                for i, listing in enumerate(results)]
+    merged = (item[-1] for item in heapq.merge(*listings))
+    return list(itertools.islice(merged, limit))
+
+
+def _instance_get_marker_values_cells(context, cell_mappings, marker,
+                                      filters, sort_keys, sort_dirs):
+    def get_marker_values(cctxt):
+        try:
+            return IMPL.instance_get_marker_values(
+                cctxt, marker, filters=filters, sort_keys=sort_keys,
+                sort_dirs=sort_dirs)
+        except exception.MarkerNotFound:
+            return None
+
+    for marker_values in _scatter_gather_cells(context, cell_mappings,
+                                               get_marker_values):
+        if marker_values is not None:
+            return marker_values
+    raise exception.MarkerNotFound(marker=marker)
+
+
+def _scatter_gather_cells(context, cell_mappings, fn, *args, **kwargs):
+    """Call fn in every cell and return the results of the cells which
+    answered, in cell order.
+
+    With partial=False, a cell failing fails the call instead of being left
+    out.
+
+    :raises: fastrunner.exception.Invalid raised by fn in a cell, as every
+             cell would raise it
+    :raises: fastrunner.exception.DBDeadlineExceeded if the deadline of the
+             request passed in a cell, as it did for every cell
+    :raises: fastrunner.exception.CellTimeout if a cell did not answer and
+             partial is False
+    """
+    partial = kwargs.pop('partial', True)
+    timeout = CONF.database.cell_timeout
+    deadline = getattr(context, 'db_deadline', None)
+    if deadline is not None:
+        timeout = max(0, min(timeout, deadline - time.time()))
+    results = fastrunner_context.scatter_gather_cells(
+        context, cell_mappings, timeout, fn, *args, **kwargs)
+    answered = []
+    for cell_mapping in cell_mappings:
+        result = results[cell_mapping.name]
+        if isinstance(result, (exception.Invalid,
+                               exception.DBDeadlineExceeded)):
+            raise result
+        if (result is fastrunner_context.did_not_respond_sentinel and
+                deadline is not None and time.time() >= deadline):
+            raise exception.DBDeadlineExceeded()
+        if not partial:
+            if result is fastrunner_context.did_not_respond_sentinel:
+                raise exception.CellTimeout()
+            if isinstance(result, Exception):
+                raise result
+        if (result is fastrunner_context.did_not_respond_sentinel or
+                isinstance(result, Exception)):
+            _CELL_FAILURES[cell_mapping.name] += 1
+            LOG.warning(_LW("Cell %s is left out of the listing"),
+                        cell_mapping.name)
+            continue
+        answered.append(result)
+    return answered
+
+
+def prewarm_pools(size):
+    """Open size pooled connections to every database listings read from,
+    before the first request needs them.
+    """
+    for ctxt in _database_contexts():
+        IMPL.prewarm_pools(ctxt, size)
+
+
+def pool_stats():
+    """Return the usage of the connection pools of the worker, by cell
+    when cells are configured.
+    """
+    cell_mappings = get_cell_mappings()
+    if not cell_mappings:
+        return IMPL.pool_stats(fastrunner_context.get_admin_context())
+    return dict((cell_mapping.name, IMPL.pool_stats(ctxt))
+                for cell_mapping, ctxt in zip(cell_mappings,
+                                              _database_contexts()))
+
+
+metrics.register('db_pools', pool_stats)
+
 
+def _database_contexts():
+    """Yield an admin context targeting each database listings read from:
+    every cell, or the main database.
+    """
+    ctxt = fastrunner_context.get_admin_context()
+    cell_mappings = get_cell_mappings()
+    if not cell_mappings:
+        yield ctxt
+        return
+    for cell_mapping in cell_mappings:
+        with fastrunner_context.target_cell(ctxt, cell_mapping) as cctxt:
+            yield cctxt
 
 
+def check_schema():
+    """Check the nova tables of every database listings read from, each
+    cell or the main database, against the columns fastrunner queries.
+    """
+    for ctxt in _database_contexts():
+        IMPL.check_schema(ctxt)
@@ -0,0 +1,161 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Execution of DB API calls under eventlet.
+
+[database]/execution_mode picks how a DB API call runs:
+
+green
+    In the calling greenthread. This keeps the eventlet hub responsive only
+    with a pure-Python driver such as mysql+pymysql on monkey patched
+    sockets, where waiting on the database yields to other greenthreads.
+    Concurrency is bounded by the connection pool.
+
+tpool
+    In one of [database]/tpool_size native threads, through eventlet.tpool.
+    This suits C drivers such as MySQLdb, which block the whole process
+    while they wait on the database. Calls returning an iterator, such as
+    the streamed listings, are read to the end in their thread: the cursor
+    and the connection behind them may not move to another thread, so
+    their results are not streamed.
+"""
+
+import functools
+import inspect
+import time
+
+from eventlet import patcher
+from eventlet import tpool
+from oslo_db import api
+from oslo_log import log as logging
+
+from fastrunner.i18n import _LI, _LW
+
+LOG = logging.getLogger(__name__)
+
+# URL schemes whose driver waits on the database in C code, out of reach of
+# eventlet's monkey patching.
+_BLOCKING_SCHEMES = ('mysql', 'mysql+mysqldb', 'postgresql',
+                     'postgresql+psycopg2')
+
+
+class DbapiExecutor(object):
+    """DB API proxy running backend calls in the configured execution mode.
+
+    It also keeps the stats of those calls: how many are in flight, how
+    many are queued for a thread or a connection, and, in tpool mode, how
+    long they waited for a thread.
+    """
+
+    def __init__(self, conf, backend_mapping):
+        self._conf = conf
+        self._backend_mapping = backend_mapping
+        self._backend = None
+        self.calls = 0
+        self.in_flight = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    @property
+    def mode(self):
+        return self._conf.database.execution_mode
+
+    @property
+    def pool_size(self):
+        """Number of calls that can run at once in the current mode."""
+        if self.mode == 'tpool':
+            return self._conf.database.tpool_size
+        return (self._conf.database.max_pool_size +
+                (self._conf.database.max_overflow or 0))
+
+    @property
+    def _api(self):
+        if not self._backend:
+            self._backend = api.DBAPI.from_config(
+                conf=self._conf, backend_mapping=self._backend_mapping)
+            if self.mode == 'tpool':
+                # NOTE: this only takes effect if nothing has used tpool
+                # yet in this process.
+                tpool.set_num_threads(self._conf.database.tpool_size)
+            else:
+                self._check_green_driver()
+            LOG.info(_LI("DB API calls run in %(mode)s mode, %(size)d at "
+                         "a time"), {'mode': self.mode,
+                                     'size': self.pool_size})
+        return self._backend
+
+    def _check_green_driver(self):
+        scheme = (self._conf.database.connection or '').split(':', 1)[0]
+        if scheme in _BLOCKING_SCHEMES:
+            LOG.warning(_LW("The %s database driver blocks the eventlet hub "
+                            "in green execution mode. Use a pure-Python "
+                            "driver such as mysql+pymysql, or set "
+                            "[database]/execution_mode to tpool."), scheme)
+        if not patcher.is_monkey_patched('socket'):
+            LOG.warning(_LW("Sockets are not monkey patched, DB API calls "
+                            "in green execution mode block the eventlet "
+                            "hub."))
+
+    def __getattr__(self, key):
+        attr = getattr(self._api, key)
+        if not callable(attr):
+            return attr
+        if self.mode == 'tpool':
+            return functools.partial(self._call_in_thread, attr)
+        return functools.partial(self._call, attr)
+
+    def _call(self, fn, *args, **kwargs):
+        self.calls += 1
+        self.in_flight += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+    def _call_in_thread(self, fn, *args, **kwargs):
+        submitted = time.time()
+        started = []
+
+        def run():
+            started.append(time.time())
+            result = fn(*args, **kwargs)
+            if inspect.isgenerator(result):
+                # NOTE: the generator holds a cursor, and the connection
+                # and transaction of its reader scope, which belong to this
+                # thread. It is read and closed here rather than resumed
+                # from other threads of the pool.
+                result = iter(list(result))
+            return result
+
+        self.calls += 1
+        self.in_flight += 1
+        try:
+            result = tpool.execute(run)
+        finally:
+            self.in_flight -= 1
+            if started:
+                wait_time = started[0] - submitted
+                self.wait_time_total += wait_time
+                self.wait_time_max = max(self.wait_time_max, wait_time)
+        return result
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'pool_size': self.pool_size,
+            'calls': self.calls,
+            'in_flight': self.in_flight,
+            'queue_depth': max(0, self.in_flight - self.pool_size),
+            'wait_time_avg': (self.wait_time_total / self.calls
+                              if self.calls else 0.0),
+            'wait_time_max': self.wait_time_max,
+        }
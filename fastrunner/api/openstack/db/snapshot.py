@@ -0,0 +1,253 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-memory snapshot of the servers listing.
+
+Each worker keeps the rendered live servers of every project in memory. A
+looping call refreshes them every CONF.servers_snapshot_refresh_interval
+seconds with the servers created, updated or deleted since the latest
+change it has seen, less CONF.servers_snapshot_watermark_margin seconds.
+Every CONF.servers_snapshot_full_scan_interval seconds, it also drops the
+servers whose rows no longer exist, which no change records.
+Listings of a project are sorted once per sort order and kept until the
+project changes, so a page is served with a bisect and a slice.
+
+The snapshot holds every server of the database, so memory grows with the
+size of the instances table in each worker.
+"""
+
+import bisect
+import datetime
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_service import loopingcall
+
+from fastrunner.api.openstack import db
+from fastrunner.api.openstack.db.sqlalchemy import api as sqlalchemy_api
+from fastrunner import context as fastrunner_context
+from fastrunner import exception
+from fastrunner.i18n import _LE, _LI
+from fastrunner import metrics
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+# Columns whose latest value is where the next refresh starts from.
+_WATERMARK_KEYS = ('created_at', 'updated_at', 'deleted_at')
+
+
+class InstanceSnapshot(object):
+    """Servers of every project, kept in sync with the database by
+    refresh().
+    """
+
+    def __init__(self):
+        # project_id -> {uuid: (values, server)}
+        self._projects = {}
+        # uuid -> project_id
+        self._uuids = {}
+        # project_id -> {(sort_keys, sort_dirs): (sort keys, servers)}
+        self._listings = {}
+        # project_id -> fingerprint of the servers of the project
+        self._fingerprints = {}
+        self._watermark = None
+        self._scanned_at = None
+        self._timer = None
+        self.refreshed_at = None
+        self.refresh_time = None
+        self.served = 0
+
+    def start(self, interval):
+        self._timer = loopingcall.FixedIntervalLoopingCall(self._refresh)
+        self._timer.start(interval=interval, initial_delay=0)
+
+    def stop(self):
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+
+    def age(self):
+        """Return the number of seconds since the data of the snapshot was
+        read, None if it has not been loaded yet.
+        """
+        if self.refreshed_at is None:
+            return None
+        return time.time() - self.refreshed_at
+
+    def _refresh(self):
+        try:
+            self.refresh()
+        except Exception:
+            LOG.exception(_LE("Failed to refresh the servers snapshot"))
+
+    def refresh(self):
+        """Apply the changes made to the instances since the last refresh."""
+        started = time.time()
+        ctxt = fastrunner_context.get_admin_context()
+        loaded = self._watermark is not None
+        changed_since = None
+        if loaded:
+            # NOTE: timestamps are set by the API and compute services when
+            # they write, not when they commit, so a change may commit with
+            # a timestamp older than the watermark.
+            changed_since = self._watermark - datetime.timedelta(
+                seconds=CONF.servers_snapshot_watermark_margin)
+        changed = db.instance_get_all_changed(ctxt,
+                                              changed_since=changed_since)
+        live_uuids = None
+        scan_interval = CONF.servers_snapshot_full_scan_interval
+        if not loaded:
+            self._scanned_at = started
+        elif scan_interval and started - self._scanned_at >= scan_interval:
+            live_uuids = db.instance_get_all_uuids(ctxt)
+            self._scanned_at = started
+
+        touched = set()
+        watermark = self._watermark
+        for values, server in changed:
+            self._put(values, server, touched)
+            for key in _WATERMARK_KEYS:
+                if values[key] is not None and (watermark is None or
+                                                values[key] > watermark):
+                    watermark = values[key]
+        if live_uuids is not None:
+            for uuid in set(self._uuids) - live_uuids:
+                touched.add(self._remove(uuid))
+        for project_id in touched:
+            self._listings.pop(project_id, None)
+            self._fingerprints.pop(project_id, None)
+        self._watermark = watermark
+        self.refreshed_at = started
+        self.refresh_time = time.time() - started
+        if not loaded:
+            LOG.info(_LI("Loaded %(count)d servers in the servers snapshot "
+                         "in %(time).2f seconds"),
+                     {'count': len(self._uuids), 'time': self.refresh_time})
+
+    def _put(self, values, server, touched):
+        uuid = values['uuid']
+        project_id = values['project_id']
+        if values['deleted']:
+            if uuid in self._uuids:
+                touched.add(self._remove(uuid))
+            return
+        if self._uuids.get(uuid, project_id) != project_id:
+            touched.add(self._remove(uuid))
+        entries = self._projects.setdefault(project_id, {})
+        entry = (values, server)
+        if entries.get(uuid) != entry:
+            entries[uuid] = entry
+            self._uuids[uuid] = project_id
+            touched.add(project_id)
+
+    def _remove(self, uuid):
+        project_id = self._uuids.pop(uuid)
+        entries = self._projects[project_id]
+        del entries[uuid]
+        if not entries:
+            del self._projects[project_id]
+        return project_id
+
+    def instance_get_all(self, context, limit=None, marker=None,
+                         sort_keys=None, sort_dirs=None):
+        """Same as db.instance_get_all for a context reading live servers
+        only, answered from the snapshot.
+        """
+        sort_keys, sort_dirs = sqlalchemy_api.instance_sort_params(sort_keys,
+                                                                   sort_dirs)
+        entries = self._projects.get(context.project_id, {})
+        keys, servers = self._listing(context.project_id, entries,
+                                      sort_keys, sort_dirs)
+        start = 0
+        if marker is not None:
+            entry = entries.get(marker)
+            if entry is None:
+                raise exception.MarkerNotFound(marker=marker)
+            start = bisect.bisect_right(
+                keys, _sort_key(entry, sort_keys, sort_dirs))
+        end = None if limit is None else start + limit
+        self.served += 1
+        return servers[start:end]
+
+    def fingerprint(self, context):
+        """Return a value which changes when the servers of the context
+        project do in the snapshot: their count and their latest
+        created_at, updated_at and deleted_at.
+        """
+        project_id = context.project_id
+        fingerprint = self._fingerprints.get(project_id)
+        if fingerprint is None:
+            entries = self._projects.get(project_id, {})
+            fingerprint = (len(entries),) + tuple(
+                max([values[key] for values, _server in entries.values()
+                     if values[key] is not None] or [None])
+                for key in _WATERMARK_KEYS)
+            if entries:
+                self._fingerprints[project_id] = fingerprint
+        return fingerprint
+
+    def _listing(self, project_id, entries, sort_keys, sort_dirs):
+        if not entries:
+            return [], []
+        listings = self._listings.setdefault(project_id, {})
+        listing = listings.get((sort_keys, sort_dirs))
+        if listing is None:
+            keys = dict((uuid, _sort_key(entry, sort_keys, sort_dirs))
+                        for uuid, entry in entries.items())
+            uuids = sorted(keys, key=keys.get)
+            listing = listings[(sort_keys, sort_dirs)] = (
+                [keys[uuid] for uuid in uuids],
+                [entries[uuid][1] for uuid in uuids])
+        return listing
+
+    def stats(self):
+        return {
+            'servers': len(self._uuids),
+            'projects': len(self._projects),
+            'age': self.age(),
+            'refresh_time': self.refresh_time,
+            'served': self.served,
+        }
+
+
+def _sort_key(entry, sort_keys, sort_dirs):
+    values = entry[0]
+    return sqlalchemy_api.SortKey([values[key] for key in sort_keys],
+                                  sort_dirs)
+
+
+_SNAPSHOT = InstanceSnapshot()
+metrics.register('servers_snapshot', _SNAPSHOT.stats)
+
+
+def start(interval):
+    """Start refreshing the snapshot of this worker every interval
+    seconds.
+    """
+    _SNAPSHOT.start(interval)
+
+
+def age():
+    return _SNAPSHOT.age()
+
+
+def fingerprint(context):
+    return _SNAPSHOT.fingerprint(context)
+
+
+def instance_get_all(context, limit=None, marker=None, sort_keys=None,
+                     sort_dirs=None):
+    return _SNAPSHOT.instance_get_all(context, limit=limit, marker=marker,
+                                      sort_keys=sort_keys,
+                                      sort_dirs=sort_dirs)
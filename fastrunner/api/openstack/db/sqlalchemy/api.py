@@ -19,13 +19,19 @@
 
 import json
 import collections
+import contextlib
+import math
+import operator
 import copy
 import datetime
 import functools
+import hashlib
 import inspect
 import sys
+import time
 import uuid
 
+import eventlet
 from oslo_config import cfg
 from oslo_db import api as oslo_db_api
 from oslo_db import exception as db_exc
@@ -39,76 +45,1762 @@ from oslo_utils import timeutils
 from oslo_utils import uuidutils
 import six
 from six.moves import range
-from sqlalchemy import *
+import sqlalchemy as sa
+from sqlalchemy import sql
+from sqlalchemy import util as sa_util
 
-CONF = cfg.CONF
+from fastrunner.api.openstack import common
+from fastrunner.api.openstack.db.sqlalchemy import models
+from fastrunner.api.openstack.db.sqlalchemy import pools
+from fastrunner.api.openstack.db.sqlalchemy import replicas
+from fastrunner.api.openstack.db.sqlalchemy import slow_queries
+from fastrunner import exception
+from fastrunner.i18n import _, _LI, _LW
+import fastrunner.conf
+from fastrunner import metrics
+from fastrunner import utils
+
+CONF = fastrunner.conf.CONF
 LOG = logging.getLogger(__name__)
 
 api_context_manager = enginefacade.transaction_context()
 
+# NOTE: listing statements are built once per worker from the static table
+# definitions in models, with every request value bound at execution time,
+# so their compiled form can be reused from _compiled_cache across requests.
+_instance_join = models.instances.join(
+    models.instance_extra,
+    models.instances.c.uuid == models.instance_extra.c.instance_uuid)
+
+_instance_detail_columns = [
+    models.instances.c.hostname,
+    models.instances.c.task_state,
+    models.instances.c.uuid,
+    models.instances.c.image_ref,
+    models.instances.c.display_name,
+    models.instance_extra.c.flavor,
+    models.instances.c.availability_zone,
+    models.instances.c.host,
+    models.instances.c.project_id,
+    models.instances.c.user_id,
+    models.instances.c.created_at,
+    models.instances.c.power_state,
+    models.instances.c.vm_state,
+    models.instances.c.deleted]
+
+# NOTE: the servers index only shows the id and name of the servers, so its
+# statement reads neither instance_extra nor the other detail columns, and
+# is served by an index covering these columns.
+_instance_index_columns = [
+    models.instances.c.uuid,
+    models.instances.c.display_name]
+
+
+def _indexed_columns(table):
+    columns = set(column.name for column in table.primary_key)
+    for index in table.indexes:
+        columns.update(column.name for column in index.columns)
+    for constraint in table.constraints:
+        if isinstance(constraint, sa.UniqueConstraint):
+            columns.update(column.name for column in constraint.columns)
+    return columns
+
+# NOTE: only columns covered by an index of nova may be sorted on. A page
+# is only read without sorting the rows of the whole tenant when an index
+# leads with (project_id, deleted) and continues with the sort keys, and
+# nova creates none: the index checker recommends one per sort key, and
+# the listing index for the default sort on created_at and id. Sorts whose
+# index is missing work, but cost a filesort of the tenant's servers.
+SORTABLE_KEYS = frozenset(_indexed_columns(models.instances))
+
+# Filters matched as a regular expression.
+_REGEX_FILTERS = ('display_name',)
+
+# Filters bounding the time of the last change of a server. Like nova, they
+# compare updated_at only: nova saves the DELETED vm_state, and so moves
+# updated_at, right before it soft deletes an instance.
+_CHANGE_FILTERS = {
+    'changes-since': operator.ge,
+    'changes-before': operator.le,
+}
+
+# Columns whose values instance_get_all_changed returns with each server.
+_instance_value_columns = (
+    [models.instances.c[key] for key in sorted(SORTABLE_KEYS)] +
+    [models.instances.c.deleted_at])
+
+_STATEMENTS = None
+_FIELDS_VIEWS = None
+_COMPILED_CACHE = None
+_FLAVOR_CACHE = None
+_ADDRESSES_CACHE = None
+_REPLICA_ROUTER = None
+_CHECKOUT_WAITS = pools.CheckoutWaits()
+
+slow_queries.install()
+metrics.register('slow_queries', slow_queries.stats)
+
+
+def _get_db_conf(conf_group, connection=None):
+    kw = dict((opt.dest, conf_group[opt.dest])
+              for opt in oslo_db_options.database_opts)
+    if connection is not None:
+        kw['connection'] = connection
+        kw['slave_connection'] = None
+    return kw
+
+
+def create_context_manager(connection=None):
+    """Create a database context manager object.
+
+    :param connection: The database connection string
+    """
+    ctxt_mgr = enginefacade.transaction_context()
+    ctxt_mgr.configure(**_get_db_conf(CONF.database, connection=connection))
+    return ctxt_mgr
+
+
+def _replica_router():
+    global _REPLICA_ROUTER
+    if _REPLICA_ROUTER is None:
+        _REPLICA_ROUTER = replicas.ReplicaRouter(
+            api_context_manager,
+            [replicas.Replica(replicas.replica_name(connection),
+                              create_context_manager(connection))
+             for connection in CONF.database.replica_connection],
+            CONF.database.replica_max_lag,
+            CONF.database.replica_check_interval)
+    return _REPLICA_ROUTER
+
+
+metrics.register('replicas', lambda: _replica_router().stats())
+
+
+def get_reader_context_manager(context):
+    """Get the database context manager to read from.
+
+    Reads may be served by a replica of the primary database.
+
+    :param context: The request context that can contain a context manager
+    """
+    return (_context_manager_from_context(context) or
+            _replica_router().get())
+
+
+def _context_manager_from_context(context):
+    if context:
+        try:
+            return context.db_connection
+        except AttributeError:
+            pass
+
+
+def pick_context_manager_reader(f):
+    """Decorator to use a reader db context manager.
+
+    The db context manager will be picked from the RequestContext, or from
+    the replica router.
+
+    Wrapped function must have a RequestContext in the arguments.
+    """
+    @functools.wraps(f)
+    def wrapped(context, *args, **kwargs):
+        with _reader_scope(context):
+            return f(context, *args, **kwargs)
+    return wrapped
+
+
+@contextlib.contextmanager
+def _reader_scope(context, independent=False):
+    """Read on a connection of the reader context manager of context.
+
+    :param independent: read on a connection of its own rather than on the
+                        one of an enclosing reader scope of context, such as
+                        a listing whose cursor is still being read
+    """
+    reader = get_reader_context_manager(context).reader
+    if independent:
+        reader = reader.independent
+    started = time.time()
+    with reader.connection.using(context):
+        _CHECKOUT_WAITS.record(time.time() - started)
+        yield
+
 
 def get_api_engine():
     return api_context_manager.get_legacy_facade().get_engine()
 
 
+def _reader_engines(context):
+    """Return (name, engine) for each database context may read from: the
+    database it targets, or the primary and its replicas.
+    """
+    ctxt_mgr = _context_manager_from_context(context)
+    if ctxt_mgr is not None:
+        return [('primary', ctxt_mgr.get_legacy_facade().get_engine())]
+    return ([('primary', get_api_engine())] +
+            [(replica.name,
+              replica.context_manager.get_legacy_facade().get_engine())
+             for replica in _replica_router().replicas])
+
+
+def prewarm_pools(context, size):
+    """Open and validate up to size pooled connections to each database
+    context may read from.
+
+    :returns: dict of the number of connections opened, by database name
+    """
+    return dict((name, pools.prewarm(engine, size))
+                for name, engine in _reader_engines(context))
+
+
+def pool_stats(context):
+    """Return the usage of the pool of each database context may read
+    from, by database name, with the time reads waited for a connection.
+    """
+    stats = dict((name, pools.stats(engine))
+                 for name, engine in _reader_engines(context))
+    stats['checkout'] = _CHECKOUT_WAITS.stats()
+    return stats
+
+
 def get_backend():
     """The backend is this module itself."""
     return sys.modules[__name__]
 
 
-@enginefacade.reader.connection
-def instance_get_all(context):
-    import pdb
-    pdb.set_trace()
-    engine = get_api_engine()
-    metadata = MetaData(engine, reflect=True)
-
-    instances_table = metadata.tables['instances']    
-    instance_extra_table = metadata.tables['instance_extra']
-
-    select_str = select([
-        instances_table.c.hostname,
-        instances_table.c.task_state,
-        instances_table.c.uuid,
-        instances_table.c.image_ref,
-        instances_table.c.display_name,
-        instance_extra_table.c.flavor,
-        instances_table.c.availability_zone,
-        instances_table.c.host,
-        instances_table.c.project_id,
-        instances_table.c.user_id,
-        instances_table.c.created_at,
-        instances_table.c.power_state,
-        instances_table.c.vm_state]).select_from(
-            instances_table.join(instance_extra_table,
-                instances_table.c.uuid==instance_extra_table.c.instance_uuid)).where(
-                instances_table.c.project_id == context.project_id)
-
-    instances = context.connection.execute(select_str)
-    
-    filled_instances = []
-    for instance in instances:
-    #   status = common.status_from_state(instance['vm_state'], instance['task_state'])
-        status = 'ACTIVE' #fake 
-        flavor = json.JSONDecoder().decode(instance['flavor'])['cur']['nova_object.data']
-        instance = {
-            'status':status,
-            'name':instance['hostname'],
-            'id':instance['uuid'],
-            'OS-EXT-STS:power_state':instance['power_state'],
-            'OS-EXT-STS:task_state':instance['task_state'],
-            'OS-EXT-AZ:availability_zone':instance['availability_zone'],
-            'flavor':{
-                'disk':flavor['ephemeral_gb'],
-                'vcpus':flavor['vcpus'],
-                'ram':flavor['memory_mb'],
-                'id':flavor['flavorid'],
-                'name':flavor['name']},
-            'OS-EXT-SRV-ATTR:host':instance['host'],
-            'OS-SRV-USG:created_at':instance['created_at'],
-            'tenant_id':instance['project_id']}
-
-        filled_instances.append(instance)
-
-    return {'servers':filled_instances}
+def _compiled_cache():
+    global _COMPILED_CACHE
+    if _COMPILED_CACHE is None and CONF.database.compiled_cache_size:
+        _COMPILED_CACHE = sa_util.LRUCache(CONF.database.compiled_cache_size)
+    return _COMPILED_CACHE
+
+
+def _flavor_cache():
+    global _FLAVOR_CACHE
+    if _FLAVOR_CACHE is None:
+        _FLAVOR_CACHE = utils.LRUCache(CONF.database.flavor_cache_size)
+    return _FLAVOR_CACHE
+
+
+metrics.register('flavor_cache', lambda: _flavor_cache().stats())
+
+
+def _addresses_cache():
+    global _ADDRESSES_CACHE
+    if _ADDRESSES_CACHE is None:
+        _ADDRESSES_CACHE = utils.LRUCache(
+            CONF.database.network_info_cache_size,
+            sizeof=utils.deep_getsizeof)
+    return _ADDRESSES_CACHE
+
+
+metrics.register('network_info_cache', lambda: _addresses_cache().stats())
+
+
+def _execute(context, statement, stream_results=False, **params):
+    """Execute statement on the context connection, reusing its compiled
+    form when the compiled statement cache is enabled.
+
+    With stream_results the rows are read from a server-side cursor as they
+    are fetched instead of being buffered by the driver.
+    """
+    options = {}
+    cache = _compiled_cache()
+    if cache is not None:
+        options['compiled_cache'] = cache
+    if stream_results:
+        options['stream_results'] = True
+    connection = context.connection
+    if options:
+        connection = connection.execution_options(**options)
+    deadline = getattr(context, 'db_deadline', None)
+    if deadline is None:
+        return connection.execute(statement, **params)
+    return _execute_before(deadline, connection, statement, params)
+
+
+def _execute_before(deadline, connection, statement, params):
+    """Execute statement, cancelling it if it still runs at deadline.
+
+    On MySQL 5.7.8 and later the server enforces the deadline through the
+    max_execution_time session variable, which is reset when the connection
+    is checked in to its pool. Elsewhere, in green execution
+    mode, a greenthread cancels the statement at the deadline: KILL QUERY
+    from another connection on MySQL, interrupt() on SQLite.
+
+    :raises: fastrunner.exception.DBDeadlineExceeded if the deadline
+             passed before or while the statement ran
+    """
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise exception.DBDeadlineExceeded()
+    killer = None
+    if not _set_max_execution_time(connection, remaining):
+        killer = _spawn_killer(connection, remaining)
+    try:
+        return connection.execute(statement, **params)
+    except Exception:
+        if time.time() < deadline:
+            raise
+        LOG.warning(_LW("A statement was cancelled at the deadline of its "
+                        "request"))
+        raise exception.DBDeadlineExceeded()
+    finally:
+        if killer is not None:
+            killer.cancel()
+
+
+def _set_max_execution_time(connection, seconds):
+    """Bound the time of the next statements of connection on the server.
+
+    Returns False if the server can not, because it is not MySQL or is
+    older than 5.7.8.
+    """
+    if (connection.dialect.name != 'mysql' or
+            connection.info.get('max_execution_time') is False):
+        return False
+    milliseconds = int(math.ceil(seconds * 1000))
+    try:
+        connection.execute(sql.text('SET SESSION max_execution_time = %d'
+                                    % milliseconds))
+    except (db_exc.DBError, sa.exc.DBAPIError):
+        LOG.info(_LI("The database server does not support "
+                     "max_execution_time, statements are cancelled with "
+                     "KILL QUERY"))
+        connection.info['max_execution_time'] = False
+        return False
+    connection.info['max_execution_time'] = milliseconds
+    return True
+
+
+def _reset_max_execution_time(dbapi_connection, connection_record):
+    """Reset max_execution_time on the connections checked in to a pool.
+
+    The session variable stays with the connection, and would otherwise
+    bound the statements of whatever checks it out next: requests without
+    a deadline, replica heartbeats or the plans of slow queries.
+    """
+    if not connection_record.info.get('max_execution_time'):
+        return
+    connection_record.info['max_execution_time'] = 0
+    if dbapi_connection is None:
+        return
+    try:
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute('SET SESSION max_execution_time = 0')
+        finally:
+            cursor.close()
+    except Exception as e:
+        # NOTE: a connection which may still bound its statements is not
+        # reused.
+        LOG.warning(_LW("Could not reset max_execution_time, discarding "
+                        "the connection: %s"), e)
+        connection_record.invalidate(e)
+
+
+sa.event.listen(sa.pool.Pool, 'checkin', _reset_max_execution_time)
+
+
+def _spawn_killer(connection, seconds):
+    if CONF.database.execution_mode != 'green':
+        # NOTE: greenthreads can not be scheduled from the native threads
+        # of tpool mode.
+        return None
+    prepare = _KILLERS.get(connection.dialect.name)
+    if prepare is None:
+        return None
+    return eventlet.spawn_after(seconds, prepare(connection))
+
+
+def _prepare_mysql_kill(connection):
+    connection_id = connection.info.get('connection_id')
+    if connection_id is None:
+        connection_id = connection.info['connection_id'] = connection.execute(
+            sql.text('SELECT CONNECTION_ID()')).scalar()
+    engine = connection.engine
+
+    def kill():
+        with engine.connect() as killer:
+            killer.execute(sql.text('KILL QUERY %d' % connection_id))
+    return kill
+
+
+def _prepare_sqlite_interrupt(connection):
+    return connection.connection.interrupt
+
+
+_KILLERS = {
+    'mysql': _prepare_mysql_kill,
+    'sqlite': _prepare_sqlite_interrupt,
+}
+
+
+def _statement_cache():
+    global _STATEMENTS
+    if _STATEMENTS is None:
+        _STATEMENTS = utils.LRUCache(CONF.database.statement_cache_size)
+    return _STATEMENTS
+
+
+metrics.register('statement_cache', lambda: _statement_cache().stats())
+
+
+def _get_statement(key, builder, *args):
+    """Return the statement cached under key, building it on first use.
+
+    key must describe the shape of the statement (which clauses it has),
+    never the values bound into it.
+    """
+    cache = _statement_cache()
+    statement = cache.get(key)
+    if statement is None:
+        statement = cache[key] = builder(*args)
+    return statement
+
+
+def process_sort_params(sort_keys, sort_dirs,
+                        default_keys=['created_at', 'id'],
+                        default_dir='asc'):
+    """Process the sort parameters to include default keys.
+
+    Creates a list of sort keys and a list of sort directions. Adds the
+    default keys to the end of the list if they are not already included.
+
+    When adding the default keys to the sort keys list, the associated
+    direction is:
+    1) The first element in the 'sort_dirs' list (if specified), else
+    2) 'default_dir' value (Note that 'asc' is the default value since this is
+    the default in sqlalchemy.utils.paginate_query)
+
+    :param sort_keys: List of sort keys to include in the processed list
+    :param sort_dirs: List of sort directions to include in the processed list
+    :param default_keys: List of sort keys that need to be included in the
+                         processed list, they are added at the end of the list
+                         if not already specified.
+    :param default_dir: Sort direction associated with each of the default
+                        keys that are not supplied, used when they are added
+                        to the processed list
+    :returns: list of sort keys, list of sort directions
+    :raise exception.InvalidInput: If more sort directions than sort keys
+                                   are specified or if an invalid sort
+                                   direction is specified
+    :raise exception.InvalidSortKey: If a sort key is not backed by an
+                                     index
+    """
+    # Determine direction to use for when adding default keys
+    if sort_dirs and len(sort_dirs) != 0:
+        default_dir_value = sort_dirs[0]
+    else:
+        default_dir_value = default_dir
+
+    # Create list of keys (do not modify the input list)
+    if sort_keys:
+        result_keys = list(sort_keys)
+    else:
+        result_keys = []
+
+    for key in result_keys:
+        if key not in SORTABLE_KEYS:
+            raise exception.InvalidSortKey(
+                sort_key=key, supported=', '.join(sorted(SORTABLE_KEYS)))
+
+    # If a list of directions is not provided, use the default sort direction
+    # for all provided keys
+    if sort_dirs:
+        result_dirs = []
+        # Verify sort direction
+        for sort_dir in sort_dirs:
+            if sort_dir not in ('asc', 'desc'):
+                msg = _("Unknown sort direction, must be 'desc' or 'asc'")
+                raise exception.InvalidInput(reason=msg)
+            result_dirs.append(sort_dir)
+    else:
+        result_dirs = [default_dir_value for _sort_key in result_keys]
+
+    # Ensure that the key and direction length match
+    while len(result_dirs) < len(result_keys):
+        result_dirs.append(default_dir_value)
+    # Unless more direction are specified, which is an error
+    if len(result_dirs) > len(result_keys):
+        msg = _("Sort direction size exceeds sort key size")
+        raise exception.InvalidInput(reason=msg)
+
+    # Ensure defaults are included
+    for key in default_keys:
+        if key not in result_keys:
+            result_keys.append(key)
+            result_dirs.append(default_dir_value)
+
+    return result_keys, result_dirs
+
+
+def _marker_param(column):
+    return sql.bindparam('marker_%s' % column.name)
+
+
+def _keyset_criteria(columns, sort_dirs, null_markers):
+    """Build the seek condition that selects the rows after the marker.
+
+    For columns (a, b) sorted descending this is
+    a < :marker_a OR (a = :marker_a AND b < :marker_b).
+
+    NULLs are ordered as MySQL and SQLite order them: first when ascending,
+    last when descending. null_markers tells which marker values are NULL,
+    as those need IS NULL comparisons instead of bound parameters.
+    """
+    criteria = []
+    for i, column in enumerate(columns):
+        crit_attrs = []
+        for j in range(i):
+            if null_markers[j]:
+                crit_attrs.append(columns[j].is_(None))
+            else:
+                crit_attrs.append(columns[j] == _marker_param(columns[j]))
+
+        if null_markers[i]:
+            if sort_dirs[i] == 'desc':
+                # Nothing sorts after NULL when descending.
+                continue
+            crit_attrs.append(column.isnot(None))
+        elif sort_dirs[i] == 'desc':
+            after = column < _marker_param(column)
+            if column.nullable:
+                after = sql.or_(after, column.is_(None))
+            crit_attrs.append(after)
+        else:
+            crit_attrs.append(column > _marker_param(column))
+        criteria.append(sql.and_(*crit_attrs))
+    return sql.or_(*criteria)
+
+
+def _get_regexp_ops(connection):
+    """Return safety filter and db opts for regex."""
+    regexp_op_map = {
+        'postgresql': '~',
+        'mysql': 'REGEXP',
+        'sqlite': 'REGEXP'
+    }
+    regex_safe_filters = {
+        'mysql': _safe_regex_mysql
+    }
+    db_type = connection.split(':')[0].split('+')[0]
+    return (regex_safe_filters.get(db_type, lambda x: x),
+            regexp_op_map.get(db_type, 'LIKE'))
+
+
+def _safe_regex_mysql(raw_string):
+    """Make regex safe to mysql.
+
+    Certain items like '|' are interpreted raw by mysql REGEX. If you
+    search for a single | then you trigger an error because it's
+    expecting content on either side.
+
+    For consistency sake we escape all '|'. This does mean we wouldn't
+    support something like foo|bar to match completely different
+    things, however, one can argue putting such complicated regex into
+    name search probably means you are doing this wrong.
+    """
+    return raw_string.replace('|', '\\|')
+
+
+def _escape_like(value):
+    return (value.replace('\\', '\\\\').replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+def _filters_shape(filters):
+    """Describe the clauses filters need: the name of each filter, with the
+    number of values of the list filters, or the states of the status
+    filter.
+    """
+    shape = []
+    for name in sorted(filters):
+        value = filters[name]
+        if name == 'status':
+            shape.append((name, _status_shape(value)))
+        elif isinstance(value, (list, tuple, set)):
+            shape.append((name, len(value)))
+        else:
+            shape.append((name, None))
+    return tuple(shape)
+
+
+def _filter_params(filters):
+    params = {}
+    for name, value in filters.items():
+        if name == 'status':
+            # The states of the statuses are part of the statement.
+            continue
+        elif name in _REGEX_FILTERS:
+            safe_regex_filter, db_regexp_op = _get_regexp_ops(
+                CONF.database.connection)
+            if not isinstance(value, six.string_types):
+                value = str(value)
+            if db_regexp_op == 'LIKE':
+                value = u'%' + _escape_like(value) + u'%'
+            else:
+                value = safe_regex_filter(value)
+            params['filter_%s' % name] = value
+        elif name == 'flavor':
+            # NOTE: the flavor id is only stored in the serialized flavor
+            # of instance_extra. Servers being resized also match their old
+            # and new flavors.
+            params['filter_flavor'] = u'%%"flavorid": "%s"%%' % _escape_like(
+                six.text_type(value))
+        elif name in _CHANGE_FILTERS:
+            params[_change_param(name)] = timeutils.normalize_time(value)
+        elif isinstance(value, (list, tuple, set)):
+            for i, item in enumerate(sorted(value)):
+                params['filter_%s_%d' % (name, i)] = item
+        else:
+            params['filter_%s' % name] = value
+    return params
+
+
+def _filter_criteria(filters_shape):
+    criteria = []
+    for name, size in filters_shape:
+        if name in _REGEX_FILTERS:
+            _safe_regex_filter, db_regexp_op = _get_regexp_ops(
+                CONF.database.connection)
+            criteria.append(models.instances.c[name].op(db_regexp_op)(
+                sql.bindparam('filter_%s' % name)))
+        elif name in _CHANGE_FILTERS:
+            criteria.append(_CHANGE_FILTERS[name](
+                models.instances.c.updated_at,
+                sql.bindparam(_change_param(name))))
+        elif name == 'status':
+            criteria.append(_status_criterion(size))
+        elif name == 'flavor':
+            criteria.append(models.instance_extra.c.flavor.like(
+                sql.bindparam('filter_flavor'), escape='\\'))
+        elif size is not None:
+            criteria.append(models.instances.c[name].in_(
+                [sql.bindparam('filter_%s_%d' % (name, i))
+                 for i in range(size)]))
+        else:
+            criteria.append(models.instances.c[name] ==
+                            sql.bindparam('filter_%s' % name))
+    return criteria
+
+
+def _status_shape(statuses):
+    """Return the vm and task states showing any of statuses, as
+    (vm_state, default, task_states) tuples.
+
+    Statuses are keyed by the states they map to, so that statuses which
+    are spelled differently, or unknown, do not grow the statement cache.
+    """
+    return tuple((vm_state, default, tuple(sorted(task_states)))
+                 for vm_state, (default, task_states) in sorted(
+                     common.states_from_status(statuses).items()))
+
+
+def _status_criterion(status_shape):
+    """Select the instances showing the statuses of status_shape.
+
+    The vm and task states matching the statuses come from the status
+    table rather than from the request, so they are written in the
+    statement, which is cached per set of states.
+    """
+    instances = models.instances
+    criteria = []
+    for vm_state, default, task_states in status_shape:
+        criterion = instances.c.vm_state == vm_state
+        if default and not task_states:
+            # Every task state of vm_state shows the status.
+            criteria.append(criterion)
+            continue
+        if default:
+            matching = sql.or_(instances.c.task_state.is_(None),
+                               instances.c.task_state.notin_(task_states))
+        else:
+            matching = instances.c.task_state.in_(task_states)
+        criteria.append(sql.and_(criterion, matching))
+    if not criteria:
+        return sql.false()
+    return sql.or_(*criteria)
+
+
+def _change_param(name):
+    return 'filter_%s' % name.replace('-', '_')
+
+
+def _read_deleted_criterion(table, read_deleted):
+    """Return the criterion selecting the rows of table that read_deleted
+    asks for, None for all of them.
+
+    nova marks a soft deleted row by setting deleted to its id, live rows
+    have deleted = 0.
+    """
+    if read_deleted == 'no':
+        return table.c.deleted == 0
+    elif read_deleted == 'only':
+        return table.c.deleted != 0
+    elif read_deleted == 'yes':
+        return None
+    raise ValueError(_("Unrecognized read_deleted value '%s'")
+                     % read_deleted)
+
+
+def _instance_from(columns, filters_shape):
+    """Return instances, joined to instance_extra only when columns or
+    filters read it.
+    """
+    if (any(column.table is models.instance_extra for column in columns) or
+            any(name == 'flavor' for name, _size in filters_shape)):
+        return _instance_join
+    return models.instances
+
+
+def _listing_criteria(read_deleted, filters_shape):
+    """Return the criteria selecting the servers of a listing.
+
+    The project of the servers is one of the filters, see _project_filters.
+    """
+    criteria = []
+    # NOTE: with a project_id filter, this makes the (project_id, deleted)
+    # index of nova serve live listings without reading the soft deleted
+    # rows. Listings of every project are served by its (deleted,
+    # created_at) index instead.
+    deleted = _read_deleted_criterion(models.instances, read_deleted)
+    if deleted is not None:
+        criteria.append(deleted)
+    criteria.extend(_filter_criteria(filters_shape))
+    return criteria
+
+
+def _build_instance_fingerprint_query(view, read_deleted, filters_shape):
+    instances = models.instances
+    server_view = _get_view(view)
+    from_ = _instance_from(server_view.columns, filters_shape)
+    criteria = _listing_criteria(read_deleted, filters_shape)
+    servers = sql.select(
+        [sa.func.count().label('count'),
+         sa.func.max(instances.c.created_at).label('created_at'),
+         sa.func.max(instances.c.updated_at).label('updated_at'),
+         sa.func.max(instances.c.deleted_at).label('deleted_at')]
+    ).select_from(from_).where(sql.and_(*criteria)).alias('servers')
+    aggregates = [servers]
+    if server_view.extras:
+        aggregates.extend(_extras_aggregates(from_, criteria))
+    return sql.select([column for aggregate in aggregates
+                       for column in aggregate.c]).select_from(
+        _cross_join(aggregates))
+
+
+# Tables the extras of a server are read from, as (name, join) where join
+# returns the join of a FROM clause holding instances to the table, and to
+# the tables the extras also show. Their rows change without moving the
+# updated_at of the instance: saving the info cache of a server, setting
+# its metadata, adding it to a security group or recording a fault.
+_EXTRAS_JOINS = (
+    ('info_caches', lambda from_: from_.join(
+        models.instance_info_caches,
+        models.instance_info_caches.c.instance_uuid ==
+        models.instances.c.uuid)),
+    ('metadata', lambda from_: from_.join(
+        models.instance_metadata,
+        models.instance_metadata.c.instance_uuid ==
+        models.instances.c.uuid)),
+    ('security_groups', lambda from_: from_.join(
+        models.security_group_instance_association,
+        models.security_group_instance_association.c.instance_uuid ==
+        models.instances.c.uuid).join(
+            models.security_groups,
+            models.security_group_instance_association.c.security_group_id ==
+            models.security_groups.c.id)),
+    ('faults', lambda from_: from_.join(
+        models.instance_faults,
+        models.instance_faults.c.instance_uuid == models.instances.c.uuid)),
+)
+
+
+def _extras_aggregates(from_, criteria):
+    """Return a one row subquery per table of _EXTRAS_JOINS, aggregating
+    the rows of the servers from_ and criteria select.
+
+    The rows are counted, for the ones removed, and their latest created_at,
+    updated_at and deleted_at taken, soft deleted rows included. Each table
+    is aggregated on its own, so that the rows of one do not multiply the
+    ones of another, through the instance_uuid index nova has on each.
+    """
+    aggregates = []
+    for name, join in _EXTRAS_JOINS:
+        joined = join(from_)
+        columns = [sa.func.count().label('%s_count' % name)]
+        for table in _joined_tables(joined):
+            if table is models.instances or table is models.instance_extra:
+                continue
+            for column in ('created_at', 'updated_at', 'deleted_at'):
+                columns.append(sa.func.max(table.c[column]).label(
+                    '%s_%s' % (table.name, column)))
+        aggregates.append(sql.select(columns).select_from(joined).where(
+            sql.and_(*criteria)).alias(name))
+    return aggregates
+
+
+def _joined_tables(joined):
+    """Return the tables of a join, left to right."""
+    if isinstance(joined, sa.Table):
+        return [joined]
+    return _joined_tables(joined.left) + _joined_tables(joined.right)
+
+
+def _cross_join(aggregates):
+    """Join one row subqueries, on nothing."""
+    joined = aggregates[0]
+    for aggregate in aggregates[1:]:
+        joined = joined.join(aggregate, sql.true())
+    return joined
+
+
+def _build_instance_get_all_query(view, read_deleted, filters_shape,
+                                  sort_keys, sort_dirs, null_markers,
+                                  use_limit):
+    sort_columns = [models.instances.c[key] for key in sort_keys]
+    columns = _get_view(view).columns
+    query = sql.select(columns).select_from(
+        _instance_from(columns, filters_shape))
+    for criterion in _listing_criteria(read_deleted, filters_shape):
+        query = query.where(criterion)
+    if null_markers is not None:
+        query = query.where(_keyset_criteria(sort_columns, sort_dirs,
+                                             null_markers))
+    query = query.order_by(*[getattr(column, sort_dir)()
+                             for column, sort_dir in zip(sort_columns,
+                                                         sort_dirs)])
+    if use_limit:
+        query = query.limit(sql.bindparam('limit'))
+    return query
+
+
+def _build_instance_marker_query(sort_keys, project_only):
+    criteria = [models.instances.c.uuid == sql.bindparam('marker')]
+    if project_only:
+        criteria.append(
+            models.instances.c.project_id == sql.bindparam('project_id'))
+    return sql.select(
+        [models.instances.c[key] for key in sort_keys]).where(
+            sql.and_(*criteria))
+
+
+def check_schema(context=None):
+    """Verify the tables fastrunner queries against the live database
+    context targets, the main database if none.
+
+    :raises: fastrunner.exception.DBSchemaMismatch if a table or column
+             declared in models is missing from the database.
+    """
+    ctxt_mgr = _context_manager_from_context(context)
+    if ctxt_mgr is None:
+        engine = get_api_engine()
+    else:
+        engine = ctxt_mgr.get_legacy_facade().get_engine()
+    inspector = sa.inspect(engine)
+    missing = []
+    for table in models.metadata.sorted_tables:
+        try:
+            existing = set(column['name'] for column in
+                           inspector.get_columns(table.name))
+        except sa.exc.NoSuchTableError:
+            existing = set()
+        missing.extend('%s.%s' % (table.name, column.name)
+                       for column in table.columns
+                       if column.name not in existing)
+    if missing:
+        raise exception.DBSchemaMismatch(database=repr(engine.url),
+                                         missing=', '.join(missing))
+
+
+# Columns of the instances indexes that serve listings best. nova does not
+# create them; the index checker recommends them when the statements they
+# serve scan or sort without them.
+_LISTING_INDEX = ('project_id', 'deleted', 'created_at', 'id')
+_INDEX_LISTING_INDEX = _LISTING_INDEX + ('uuid', 'display_name')
+_CHANGES_INDEX = ('project_id', 'updated_at')
+
+
+def _sort_index(sort_keys):
+    """Return the columns of the instances index serving the listings
+    sorted on sort_keys, defaults included.
+    """
+    prefix = ('project_id', 'deleted')
+    return prefix + tuple(key for key in sort_keys if key not in prefix)
+
+_DELETED_AT_INDEX = ('deleted_at',)
+
+_ALL_PROJECTS_INDEX = ('deleted', 'created_at', 'id')
+
+
+def listing_statements():
+    """Return the statements fastrunner issues to list servers, to check
+    the plans the database picks for them.
+
+    :returns: list of (name, statement, params, index) tuples, where params
+              are sample bind values for the statement and index is the
+              columns of the instances index recommended for it, or None
+    """
+    now = timeutils.utcnow()
+    statements = []
+
+    def sample(column):
+        if isinstance(column.type, sa.DateTime):
+            return now
+        if isinstance(column.type, sa.Integer):
+            return 1
+        return column.name
+
+    def listing(name, view='detail', read_deleted='no', filters=None,
+                sort_keys=None, marker=False, index=None):
+        sort_keys, sort_dirs = instance_sort_params(sort_keys, None)
+        filters = dict(filters or {}, project_id='project')
+        params = _filter_params(filters)
+        params['limit'] = CONF.osapi_max_limit
+        null_markers = None
+        if marker:
+            null_markers = (False,) * len(sort_keys)
+            for key in sort_keys:
+                params['marker_%s' % key] = sample(models.instances.c[key])
+        statements.append((name, _build_instance_get_all_query(
+            view, read_deleted, _filters_shape(filters), sort_keys,
+            sort_dirs, null_markers, True), params, index))
+
+    listing('servers', index=_LISTING_INDEX)
+    listing('servers after a marker', marker=True, index=_LISTING_INDEX)
+    listing('servers index', view='index', index=_INDEX_LISTING_INDEX)
+    listing('servers index after a marker', view='index', marker=True,
+            index=_INDEX_LISTING_INDEX)
+    listing('servers fields', view=('OS-EXT-SRV-ATTR:host', 'id', 'status'),
+            index=_LISTING_INDEX)
+    for name, value in sorted({'host': 'host',
+                               'node': 'node',
+                               'availability_zone': 'nova',
+                               'image_ref': 'image',
+                               'vm_state': ['active'],
+                               'task_state': ['rebooting'],
+                               'status': ['ACTIVE'],
+                               'display_name': 'name',
+                               'flavor': '1',
+                               'user_id': 'user',
+                               'changes-before': now}.items()):
+        listing('servers filtered on %s' % name, filters={name: value})
+    default_keys, default_dirs = instance_sort_params(None, None)
+    for key in sorted(SORTABLE_KEYS - set(default_keys)):
+        sort_keys, _sort_dirs = instance_sort_params([key], None)
+        listing('servers sorted on %s' % key, sort_keys=[key],
+                index=_sort_index(sort_keys))
+    listing('servers changed since', read_deleted='yes',
+            filters={'changes-since': now}, index=_CHANGES_INDEX)
+    # NOTE: admins list every project with all_tenants, in the order of
+    # the (deleted, created_at) index of nova.
+    all_projects = _build_instance_get_all_query(
+        'detail', 'no', (), default_keys, default_dirs, None, True)
+    statements.append(('servers of all projects', all_projects,
+                       {'limit': CONF.osapi_max_limit},
+                       _ALL_PROJECTS_INDEX))
+    for view in ('detail', 'index'):
+        statements.append(('servers %s fingerprint' % view,
+                           _build_instance_fingerprint_query(
+                               view, 'no', (('project_id', None),)),
+                           {'filter_project_id': 'project'},
+                           _LISTING_INDEX))
+    statements.append(('server', _build_instance_get_query('no', True),
+                       {'uuid': 'uuid', 'project_id': 'project'}, None))
+    statements.append(('server version',
+                       _build_instance_version_query('no', True),
+                       {'uuid': 'uuid', 'project_id': 'project'}, None))
+    statements.append(('marker',
+                       _build_instance_marker_query(default_keys, True),
+                       {'marker': 'marker', 'project_id': 'project'}, None))
+    statements.append(('snapshot changes', _build_instance_changed_query(True),
+                       {'changed_since': now}, _DELETED_AT_INDEX))
+    statements.append(('snapshot uuids',
+                       sql.select([models.instances.c.uuid],
+                                  models.instances.c.deleted == 0),
+                       {}, None))
+    return statements
+
+
+@pick_context_manager_reader
+def instance_get_all(context, filters=None, limit=None, marker=None,
+                     sort_keys=None, sort_dirs=None, view='detail',
+                     not_modified=None):
+    """Return the servers of the context project.
+
+    Results are ordered by sort_keys/sort_dirs, with created_at and id
+    appended so the order is total, and paginated with a seek on those
+    keys rather than an OFFSET.
+
+    :param filters: dict of the filters the servers must match, by column.
+                    A list value matches any of its items. display_name is
+                    matched as a regular expression, and flavor against the
+                    flavor id. changes-since and changes-before are
+                    datetimes bounding updated_at. status is a list of
+                    servers view statuses
+    :param limit: maximum number of servers to return, None for all
+    :param marker: uuid of the last server of the previous page; the
+                   result starts right after it
+    :param sort_keys: list of instance columns to sort on
+    :param sort_dirs: list of 'asc'/'desc' matching sort_keys
+    :param view: 'detail' to render the servers/detail view of the servers,
+                 'index' to render the servers view, their id and name only
+    :param not_modified: callable returning whether the client has the
+                         listing already, given its fingerprint, as
+                         instance_get_fingerprint returns it. The
+                         fingerprint is read on the connection of the
+                         listing, from the same database, and None is
+                         returned rather than the listing when the client
+                         has it.
+    :raises: fastrunner.exception.MarkerNotFound if marker does not name a
+             server of the project
+    :raises: fastrunner.exception.InvalidSortKey if a sort key is not backed
+             by an index
+    """
+    if not_modified is not None and not_modified(
+            _instance_fingerprint(context, filters, view)):
+        return None
+    query, params = _instance_get_all_query(context, filters, limit, marker,
+                                            sort_keys, sort_dirs, view=view)
+    render = _get_view(view).render
+    servers = [render(row) for row in _execute(context, query, **params)]
+    LOG.debug("Flavor cache: %(size)d entries, hit rate %(hit_rate).2f",
+              _flavor_cache().stats())
+    return servers
+
+
+@pick_context_manager_reader
+def instance_get_fingerprint(context, filters=None, view='detail'):
+    """Return a value which changes when the servers instance_get_all
+    lists for filters and view do.
+
+    It is read with aggregates over the rows the listing selects: their
+    count and their latest created_at, updated_at and deleted_at and, for
+    views showing the extras of the servers, the same aggregates over the
+    rows of their info caches, metadata, security groups and faults. No row
+    is fetched or rendered.
+    """
+    return _instance_fingerprint(context, filters, view)
+
+
+def _instance_fingerprint(context, filters, view):
+    filters = _project_filters(context, filters)
+    params = _filter_params(filters)
+    filters_shape = _filters_shape(filters)
+    read_deleted = context.read_deleted
+    view = _view_key(view)
+    query = _get_statement(
+        ('instance_get_fingerprint', view, read_deleted, filters_shape),
+        _build_instance_fingerprint_query, view, read_deleted, filters_shape)
+    return tuple(_execute(context, query, **params).first())
+
+
+def instance_get_all_iter(context, filters=None, limit=None, marker=None,
+                          sort_keys=None, sort_dirs=None, view='detail',
+                          not_modified=None):
+    """Like instance_get_all, but return an iterator over the servers.
+
+    Rows are read from a server-side cursor CONF.database.stream_fetch_size
+    at a time and rendered one by one, so memory does not grow with the
+    size of the result. The statement is executed before this returns, so
+    errors such as MarkerNotFound are raised here rather than while
+    iterating. The connection is held until the iterator is exhausted or
+    closed.
+    """
+    stream = _instance_stream(context, filters, limit, marker, sort_keys,
+                              sort_dirs, view, not_modified)
+    if not next(stream):
+        stream.close()
+        return None
+    return stream
+
+
+def _instance_stream(context, filters, limit, marker, sort_keys, sort_dirs,
+                     view, not_modified):
+    with _reader_scope(context):
+        if not_modified is not None and not_modified(
+                _instance_fingerprint(context, filters, view)):
+            yield False
+            return
+        query, params = _instance_get_all_query(context, filters, limit,
+                                                marker, sort_keys, sort_dirs,
+                                                view=view)
+        render = _get_view(view).render
+        rows = _execute(context, query, stream_results=True, **params)
+        # Hand control back once the statement has run.
+        yield True
+        try:
+            while True:
+                batch = rows.fetchmany(CONF.database.stream_fetch_size)
+                if not batch:
+                    break
+                for row in batch:
+                    yield render(row)
+        finally:
+            rows.close()
+            LOG.debug("Flavor cache: %(size)d entries, hit rate "
+                      "%(hit_rate).2f", _flavor_cache().stats())
+
+
+def _instance_get_all_query(context, filters, limit, marker, sort_keys,
+                            sort_dirs, marker_values=None, view='detail'):
+    """Return the listing statement for the arguments and its bind params.
+
+    The marker is resolved on the context connection first, unless the
+    sort values it resolves to are given as marker_values.
+    """
+    sort_keys, sort_dirs = instance_sort_params(sort_keys, sort_dirs)
+
+    filters = _project_filters(context, filters)
+    params = _filter_params(filters)
+    null_markers = None
+    if marker is not None and marker_values is None:
+        marker_values = _instance_marker_values(context, marker, sort_keys,
+                                                filters)
+    if marker_values is not None:
+        null_markers = tuple(marker_values[key] is None for key in sort_keys)
+        for key in sort_keys:
+            if marker_values[key] is not None:
+                params['marker_%s' % key] = marker_values[key]
+    use_limit = limit is not None
+    if use_limit:
+        params['limit'] = limit
+
+    filters_shape = _filters_shape(filters)
+    read_deleted = context.read_deleted
+    view = _view_key(view)
+    query = _get_statement(
+        ('instance_get_all', view, read_deleted, filters_shape, sort_keys,
+         sort_dirs, null_markers, use_limit),
+        _build_instance_get_all_query,
+        view, read_deleted, filters_shape, sort_keys, sort_dirs,
+        null_markers, use_limit)
+    return query, params
+
+
+def instance_sort_params(sort_keys, sort_dirs):
+    """Return the sort keys and directions of a listing, defaults included,
+    as tuples.
+    """
+    sort_keys, sort_dirs = process_sort_params(sort_keys, sort_dirs,
+                                               default_dir='desc')
+    return tuple(sort_keys), tuple(sort_dirs)
+
+
+def _project_filters(context, filters):
+    """Return filters, restricted to the project of context unless context
+    is an admin's.
+
+    Admins list the servers of the project of their project_id filter, or
+    of every project without one.
+    """
+    filters = dict(filters or {})
+    if not context.is_admin:
+        filters['project_id'] = context.project_id
+    return filters
+
+
+def _instance_marker_values(context, marker, sort_keys, filters):
+    project_only = 'project_id' in filters
+    marker_query = _get_statement(('instance_marker', sort_keys,
+                                   project_only),
+                                  _build_instance_marker_query,
+                                  sort_keys, project_only)
+    params = {'marker': marker}
+    if project_only:
+        params['project_id'] = filters['project_id']
+    marker_row = _execute(context, marker_query, **params).first()
+    if marker_row is None:
+        raise exception.MarkerNotFound(marker=marker)
+    return dict((key, marker_row[key]) for key in sort_keys)
+
+
+@pick_context_manager_reader
+def instance_get_marker_values(context, marker, filters=None,
+                               sort_keys=None, sort_dirs=None):
+    """Return the values the marker server has for the listing sort keys.
+
+    They let instance_get_all_sortable resume a listing after a server
+    that is stored in another database.
+
+    :raises: fastrunner.exception.MarkerNotFound if marker does not name a
+             server of the project listed
+    """
+    sort_keys, sort_dirs = instance_sort_params(sort_keys, sort_dirs)
+    return _instance_marker_values(context, marker, sort_keys,
+                                   _project_filters(context, filters))
+
+
+@pick_context_manager_reader
+def instance_get_all_sortable(context, filters=None, limit=None,
+                              marker_values=None, sort_keys=None,
+                              sort_dirs=None, view='detail'):
+    """Like instance_get_all, but return (sort key, server) pairs.
+
+    Sort keys compare in the listing order, so the listings of several
+    databases can be merged on them. The listing starts after the
+    marker_values returned by instance_get_marker_values, if given.
+    """
+    query, params = _instance_get_all_query(context, filters, limit, None,
+                                            sort_keys, sort_dirs,
+                                            marker_values=marker_values,
+                                            view=view)
+    sort_keys, sort_dirs = instance_sort_params(sort_keys, sort_dirs)
+    sort_columns = [models.instances.c[key] for key in sort_keys]
+    query = _get_statement(('instance_get_all_sortable', query),
+                           _build_instance_sortable_query,
+                           query, _get_view(view).columns, sort_columns)
+    render = _get_view(view).render
+    return [(SortKey([row[column] for column in sort_columns], sort_dirs),
+             render(row))
+            for row in _execute(context, query, **params)]
+
+
+@pick_context_manager_reader
+def instance_get_all_changed(context, changed_since=None):
+    """Return (values, server) pairs for the servers of every project.
+
+    values maps each sortable column, and deleted_at, to its value for the
+    server. Without changed_since, the live servers are returned. With it,
+    the servers created, updated or deleted at or after changed_since are,
+    deleted or not, some of them more than once.
+    """
+    use_since = changed_since is not None
+    query = _get_statement(('instance_get_all_changed', use_since),
+                           _build_instance_changed_query, use_since)
+    params = {}
+    if use_since:
+        params['changed_since'] = changed_since
+    return [(dict((column.name, row[column])
+                  for column in _instance_value_columns),
+             _render_instance(row))
+            for row in _execute(context, query, **params)]
+
+
+@pick_context_manager_reader
+def instance_get_all_uuids(context):
+    """Return the set of the uuids of the live servers of every project."""
+    query = _get_statement(('instance_get_all_uuids',), sql.select,
+                           [models.instances.c.uuid],
+                           models.instances.c.deleted == 0)
+    return set(row[0] for row in _execute(context, query))
+
+
+@pick_context_manager_reader
+def instance_get_by_uuid(context, instance_uuid):
+    """Return the servers/detail view of a server.
+
+    Servers of other projects are only returned to admins.
+
+    :raises: fastrunner.exception.InstanceNotFound if there is no such
+             server, or the context may not read it
+    """
+    return _instance_get(context, instance_uuid)
+
+
+@pick_context_manager_reader
+def instance_get_detail(context, instance_uuid, not_modified=None):
+    """Return the servers/detail view of a server and its extras, as
+    instance_get_by_uuid and instance_get_extras return them, read on one
+    connection.
+
+    :param not_modified: callable returning whether the caller has the
+                         server already, given its version: a value which
+                         changes when the instance row of the server or the
+                         rows of its extras do. The version is read first,
+                         from the same database, and None is returned rather
+                         than the server when the caller has it.
+    :raises: fastrunner.exception.InstanceNotFound if there is no such
+             server, or the context may not read it
+    """
+    if not_modified is not None and not_modified(
+            _instance_version(context, instance_uuid)):
+        return None
+    server = _instance_get(context, instance_uuid)
+    return server, _instance_get_extras(context, [instance_uuid], None)
+
+
+def _instance_get(context, instance_uuid):
+    project_only = not context.is_admin
+    query = _get_statement(
+        ('instance_get_by_uuid', context.read_deleted, project_only),
+        _build_instance_get_query, context.read_deleted, project_only)
+    row = _execute(context, query,
+                   **_instance_get_params(context, instance_uuid)).first()
+    if row is None:
+        raise exception.InstanceNotFound(instance_id=instance_uuid)
+    return _render_instance(row)
+
+
+def _instance_version(context, instance_uuid):
+    """Return the version of a server, read with aggregates over its
+    instance row and the rows of its extras only, a cheap probe to
+    revalidate a rendered server.
+    """
+    project_only = not context.is_admin
+    query = _get_statement(
+        ('instance_get_version', context.read_deleted, project_only),
+        _build_instance_version_query, context.read_deleted, project_only)
+    row = _execute(context, query,
+                   **_instance_get_params(context, instance_uuid)).first()
+    if row is None:
+        raise exception.InstanceNotFound(instance_id=instance_uuid)
+    return tuple(row)
+
+
+def _instance_get_params(context, instance_uuid):
+    params = {'uuid': instance_uuid}
+    if not context.is_admin:
+        params['project_id'] = context.project_id
+    return params
+
+
+# Keys of the result of instance_get_extras.
+INSTANCE_EXTRAS = ('instance_metadata', 'instance_info_caches',
+                   'instance_security_groups', 'instance_faults')
+
+
+def instance_get_extras(context, instance_uuids, keys=None,
+                        independent=False):
+    """Return the metadata, addresses, security groups and latest fault of
+    servers.
+
+    Each related table is read with one IN query per chunk of at most
+    CONF.database.enrichment_chunk_size uuids, whatever the number of
+    servers. Only the tables of keys are read.
+
+    :param keys: keys of INSTANCE_EXTRAS to return
+    :param independent: read on a connection of its own, for the servers of
+                        a listing returned by instance_get_all_iter which
+                        still holds its connection
+    :returns: dict mapping each of keys to a list of dicts, one per server
+              that has any, each with the uuid of the server as
+              instance_uuid
+    """
+    with _reader_scope(context, independent=independent):
+        return _instance_get_extras(context, instance_uuids, keys)
+
+
+def _instance_get_extras(context, instance_uuids, keys):
+    if keys is None:
+        keys = INSTANCE_EXTRAS
+    metadata = collections.OrderedDict()
+    security_groups = collections.OrderedDict()
+    info_caches = []
+    faults = []
+    for chunk in _uuid_chunks(instance_uuids):
+        params = dict(('uuid_%d' % i, uuid) for i, uuid in enumerate(chunk))
+        size = len(chunk)
+        if 'instance_metadata' in keys:
+            query = _get_statement(('instance_metadata', size),
+                                   _build_instance_metadata_query, size)
+            for row in _execute(context, query, **params):
+                metadata.setdefault(row['instance_uuid'],
+                                    {})[row['key']] = row['value']
+        if 'instance_info_caches' in keys:
+            query = _get_statement(('instance_info_caches', size),
+                                   _build_instance_info_cache_query, size)
+            for row in _execute(context, query, **params):
+                info_caches.append({
+                    'instance_uuid': row['instance_uuid'],
+                    'addresses': _render_info_cache(row)})
+        if 'instance_security_groups' in keys:
+            query = _get_statement(('instance_security_groups', size),
+                                   _build_instance_security_groups_query,
+                                   size)
+            for row in _execute(context, query, **params):
+                security_groups.setdefault(row['instance_uuid'],
+                                           []).append({'name': row['name']})
+        if 'instance_faults' in keys:
+            query = _get_statement(('instance_faults', size),
+                                   _build_instance_fault_query, size)
+            for row in _execute(context, query, **params):
+                faults.append(dict(row))
+    extras = {
+        'instance_metadata': [{'instance_uuid': uuid, 'metadata': items}
+                              for uuid, items in metadata.items()],
+        'instance_info_caches': info_caches,
+        'instance_security_groups': [{'instance_uuid': uuid,
+                                      'security_groups': groups}
+                                     for uuid, groups in
+                                     security_groups.items()],
+        'instance_faults': faults,
+    }
+    return dict((key, extras[key]) for key in keys)
+
+
+def _uuid_chunks(uuids):
+    """Split uuids in chunks of at most CONF.database.enrichment_chunk_size.
+
+    Each chunk is padded to a power of two by repeating its last uuid, so
+    a handful of statements, one per chunk size, serve every page size.
+    """
+    uuids = list(uuids)
+    chunk_size = CONF.database.enrichment_chunk_size
+    for start in range(0, len(uuids), chunk_size):
+        chunk = uuids[start:start + chunk_size]
+        size = 1
+        while size < len(chunk):
+            size *= 2
+        size = min(size, chunk_size)
+        yield chunk + [chunk[-1]] * (size - len(chunk))
+
+
+def _uuid_in(column, size):
+    return column.in_([sql.bindparam('uuid_%d' % i) for i in range(size)])
+
+
+def _build_instance_metadata_query(size):
+    table = models.instance_metadata
+    return sql.select(
+        [table.c.instance_uuid, table.c.key, table.c.value]).where(sql.and_(
+            _uuid_in(table.c.instance_uuid, size),
+            table.c.deleted == 0))
+
+
+def _build_instance_info_cache_query(size):
+    table = models.instance_info_caches
+    return sql.select(
+        [table.c.instance_uuid, table.c.network_info, table.c.created_at,
+         table.c.updated_at]).where(sql.and_(
+            _uuid_in(table.c.instance_uuid, size),
+            table.c.deleted == 0))
+
+
+def _build_instance_security_groups_query(size):
+    association = models.security_group_instance_association
+    groups = models.security_groups
+    return sql.select(
+        [association.c.instance_uuid, groups.c.name]).select_from(
+            association.join(
+                groups,
+                association.c.security_group_id == groups.c.id)).where(
+            sql.and_(_uuid_in(association.c.instance_uuid, size),
+                     association.c.deleted == 0,
+                     groups.c.deleted == 0)).order_by(groups.c.name)
+
+
+def _build_instance_fault_query(size):
+    # NOTE: like nova, only the latest fault of each server is shown. The
+    # subquery keeps the servers' older faults from being read at all.
+    faults = models.instance_faults
+    latest = sql.select(
+        [sa.func.max(faults.c.id).label('id')]).where(sql.and_(
+            _uuid_in(faults.c.instance_uuid, size),
+            faults.c.deleted == 0)).group_by(
+                faults.c.instance_uuid).alias('latest')
+    return sql.select(
+        [faults.c.instance_uuid, faults.c.code, faults.c.message,
+         faults.c.details, faults.c.created_at]).select_from(
+             faults.join(latest, faults.c.id == latest.c.id))
+
+
+def _instance_get_criteria(read_deleted, project_only):
+    criteria = [models.instances.c.uuid == sql.bindparam('uuid')]
+    if project_only:
+        criteria.append(
+            models.instances.c.project_id == sql.bindparam('project_id'))
+    deleted = _read_deleted_criterion(models.instances, read_deleted)
+    if deleted is not None:
+        criteria.append(deleted)
+    return sql.and_(*criteria)
+
+
+def _build_instance_get_query(read_deleted, project_only):
+    return sql.select(_instance_detail_columns).select_from(
+        _instance_join).where(_instance_get_criteria(read_deleted,
+                                                     project_only))
+
+
+def _build_instance_version_query(read_deleted, project_only):
+    instances = models.instances
+    criteria = [_instance_get_criteria(read_deleted, project_only)]
+    server = sql.select(
+        [instances.c.created_at, instances.c.updated_at, instances.c.deleted]
+    ).where(criteria[0]).alias('server')
+    aggregates = [server] + _extras_aggregates(instances, criteria)
+    return sql.select([column for aggregate in aggregates
+                       for column in aggregate.c]).select_from(
+        _cross_join(aggregates))
+
+
+def _build_instance_changed_query(use_since):
+    selected = set(_instance_detail_columns)
+    query = sql.select(
+        _instance_detail_columns +
+        [column for column in _instance_value_columns
+         if column not in selected]).select_from(_instance_join)
+    if not use_since:
+        return query.where(models.instances.c.deleted == 0)
+    # NOTE: an OR of the three bounds would scan the table. Each arm is
+    # served by an index instead: nova's (updated_at, project_id) and
+    # (deleted, created_at) ones, and the deleted_at one the index checker
+    # recommends. Servers created and deleted since are read by the last.
+    # A server may be read by several arms, which the snapshot ignores.
+    since = sql.bindparam('changed_since')
+    instances = models.instances
+    return sql.union_all(
+        query.where(instances.c.updated_at >= since),
+        query.where(sql.and_(instances.c.deleted == 0,
+                             instances.c.created_at >= since)),
+        query.where(instances.c.deleted_at >= since))
+
+
+def _build_instance_sortable_query(query, view_columns, sort_columns):
+    selected = set(view_columns)
+    columns = [column for column in sort_columns if column not in selected]
+    if not columns:
+        return query
+    return query.with_only_columns(list(view_columns) + columns)
+
+
+@functools.total_ordering
+class SortKey(object):
+    """Sort values of a server, ordered by the listing sort directions.
+
+    NULLs are ordered as in _keyset_criteria.
+    """
+
+    __slots__ = ('values', 'dirs')
+
+    def __init__(self, values, dirs):
+        self.values = values
+        self.dirs = dirs
+
+    def __eq__(self, other):
+        return self.values == other.values
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        for value, other_value, sort_dir in zip(self.values, other.values,
+                                                self.dirs):
+            if value == other_value:
+                continue
+            less = value is None or (other_value is not None and
+                                     value < other_value)
+            return less if sort_dir == 'asc' else not less
+        return False
+
+    __hash__ = None
+
+
+# Servers view key of each column of _instance_detail_columns copied as is
+# into the rendered server.
+_SERVER_FIELDS = (
+    ('name', models.instances.c.hostname),
+    ('id', models.instances.c.uuid),
+    ('OS-EXT-STS:power_state', models.instances.c.power_state),
+    ('OS-EXT-STS:task_state', models.instances.c.task_state),
+    ('OS-EXT-STS:vm_state', models.instances.c.vm_state),
+    ('OS-EXT-AZ:availability_zone', models.instances.c.availability_zone),
+    ('OS-EXT-SRV-ATTR:host', models.instances.c.host),
+    ('OS-SRV-USG:created_at', models.instances.c.created_at),
+    ('tenant_id', models.instances.c.project_id),
+)
+
+# NOTE: every statement whose rows are rendered selects
+# _instance_detail_columns first, so their positions are the same in all of
+# them. Rows are read by position with a single itemgetter call instead of
+# a lookup by name per column.
+_DETAIL_INDEXES = dict((column, i)
+                       for i, column in enumerate(_instance_detail_columns))
+_SERVER_KEYS = tuple(key for key, _column in _SERVER_FIELDS)
+_server_values = operator.itemgetter(
+    *[_DETAIL_INDEXES[column] for _key, column in _SERVER_FIELDS])
+_FLAVOR_INDEX = _DETAIL_INDEXES[models.instance_extra.c.flavor]
+_VM_STATE_INDEX = _DETAIL_INDEXES[models.instances.c.vm_state]
+_TASK_STATE_INDEX = _DETAIL_INDEXES[models.instances.c.task_state]
+_DELETED_INDEX = _DETAIL_INDEXES[models.instances.c.deleted]
+
+
+def _render_instance(instance):
+    """Render an instance row as the servers/detail view of the server."""
+    server = dict(zip(_SERVER_KEYS, _server_values(instance)))
+    server['status'] = _render_status(instance[_VM_STATE_INDEX],
+                                      instance[_TASK_STATE_INDEX],
+                                      instance[_DELETED_INDEX])
+    server['flavor'] = _render_flavor(instance[_FLAVOR_INDEX])
+    return server
+
+
+def _render_status(vm_state, task_state, deleted):
+    # NOTE: like nova, the vm and task states of a deleted server do not
+    # matter.
+    if deleted:
+        return 'DELETED'
+    return common.status_from_state(vm_state, task_state)
+
+
+def _render_instance_index(instance):
+    """Render a row of _instance_index_columns as the servers view of the
+    server, without its links.
+    """
+    return {'id': instance[0], 'name': instance[1]}
+
+
+def _render_flavor(flavor_blob):
+    """Render the instance_extra flavor blob as the servers view flavor.
+
+    A tenant's servers share a handful of flavors, so each distinct blob is
+    parsed once and its rendered dict is cached by the blob's digest and
+    shared by every server using it. Callers must not modify it.
+    """
+    cache = _flavor_cache()
+    key = hashlib.sha1(utils.utf8(flavor_blob)).digest()
+    flavor = cache.get(key)
+    if flavor is None:
+        data = json.loads(flavor_blob)['cur']['nova_object.data']
+        flavor = {
+            'disk':data['ephemeral_gb'],
+            'vcpus':data['vcpus'],
+            'ram':data['memory_mb'],
+            'id':data['flavorid'],
+            'name':data['name']}
+        cache[key] = flavor
+    return flavor
+
+
+def _render_info_cache(info_cache):
+    """Render an instance info cache row as the addresses of the server.
+
+    network_info only changes when the info cache is saved, which moves
+    its updated_at. The rendered addresses are cached by instance uuid and
+    updated_at, so polling a server does not parse its network_info again
+    until it changes. Callers must not modify them.
+    """
+    cache = _addresses_cache()
+    key = (info_cache['instance_uuid'],
+           info_cache['updated_at'] or info_cache['created_at'])
+    addresses = cache.get(key)
+    if addresses is None:
+        addresses = _render_addresses(info_cache['network_info'])
+        cache[key] = addresses
+    return addresses
+
+
+def _render_addresses(network_info):
+    """Render the network_info blob of an instance info cache as the
+    addresses of the servers view: the fixed then floating IPs of the
+    server, by network label.
+    """
+    networks = collections.OrderedDict()
+    for vif in json.loads(network_info or '[]'):
+        network = vif.get('network') or {}
+        label = network.get('label')
+        if label is None:
+            continue
+        fixed, floating = networks.setdefault(label, ([], []))
+        for subnet in network.get('subnets') or []:
+            for ip in subnet.get('ips') or []:
+                fixed.append(_render_address(ip, vif))
+                for floating_ip in ip.get('floating_ips') or []:
+                    floating.append(_render_address(floating_ip, vif))
+    return dict((label, fixed + floating)
+                for label, (fixed, floating) in networks.items())
+
+
+def _render_address(ip, vif):
+    return {
+        'version':ip.get('version'),
+        'addr':ip['address'],
+        'OS-EXT-IPS:type':ip.get('type'),
+        'OS-EXT-IPS-MAC:mac_addr':vif.get('address')}
+
+
+# Columns read and renderer of the rows of each view of the servers, and
+# whether the view shows the extras of instance_get_extras.
+ServerView = collections.namedtuple('ServerView',
+                                    ['columns', 'render', 'extras'])
+
+# Keys of the servers/detail view read by instance_get_extras.
+_EXTRA_KEYS = frozenset(['metadata', 'addresses', 'security_groups', 'fault'])
+
+# Keys of the servers/detail view the db layer renders or reads the extras
+# for. Other keys do not change the ServerView of the fields views.
+_VIEW_KEYS = frozenset(_SERVER_KEYS + ('status', 'flavor')) | _EXTRA_KEYS
+
+_VIEWS = {
+    'detail': ServerView(_instance_detail_columns, _render_instance, True),
+    'index': ServerView(_instance_index_columns, _render_instance_index,
+                        False),
+}
+
+
+def _view_key(view):
+    """Return the key of view: 'detail' or 'index' as is, and for keys of
+    the servers/detail view, the sorted keys among them the db layer uses.
+
+    Views with the same key render the same, so fields views differing
+    only in the order of their keys or in keys rendered by the caller
+    share their statements and ServerView.
+    """
+    if isinstance(view, six.string_types):
+        return view
+    return tuple(sorted(_VIEW_KEYS.intersection(view)))
+
+
+def _fields_views():
+    global _FIELDS_VIEWS
+    if _FIELDS_VIEWS is None:
+        _FIELDS_VIEWS = utils.LRUCache(CONF.database.statement_cache_size)
+    return _FIELDS_VIEWS
+
+
+metrics.register('fields_views', lambda: _fields_views().stats())
+
+
+def _get_view(view):
+    """Return the ServerView of view: 'detail', 'index', or keys of the
+    servers/detail view, for a view showing only them.
+    """
+    key = _view_key(view)
+    server_view = _VIEWS.get(key)
+    if server_view is None:
+        cache = _fields_views()
+        server_view = cache.get(key)
+        if server_view is None:
+            server_view = cache[key] = _build_fields_view(key)
+    return server_view
+
+
+def _build_fields_view(fields):
+    """Return the ServerView rendering only the keys fields of the
+    servers/detail view, and id, from only the columns they need.
+
+    instance_extra is only read for the flavor. Keys read from the extras
+    are left to the caller, and other keys the db layer does not render
+    are ignored.
+    """
+    positions = {}
+    columns = []
+
+    def position(column):
+        if column not in positions:
+            positions[column] = len(columns)
+            columns.append(column)
+        return positions[column]
+
+    copied = [(key, position(column)) for key, column in _SERVER_FIELDS
+              if key in fields or key == 'id']
+    status = None
+    if 'status' in fields:
+        status = [position(models.instances.c.vm_state),
+                  position(models.instances.c.task_state),
+                  position(models.instances.c.deleted)]
+    flavor = None
+    if 'flavor' in fields:
+        flavor = position(models.instance_extra.c.flavor)
+
+    def render(instance):
+        server = dict((key, instance[i]) for key, i in copied)
+        if status is not None:
+            server['status'] = _render_status(*[instance[i] for i in status])
+        if flavor is not None:
+            server['flavor'] = _render_flavor(instance[flavor])
+        return server
 
+    return ServerView(columns, render, bool(_EXTRA_KEYS.intersection(fields)))
@@ -0,0 +1,131 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Check of the plans the database picks for fastrunner's statements.
+
+Every statement of api.listing_statements() is run through EXPLAIN on the
+configured database. Full table scans and sorts that do not come from an
+index are reported, and the indexes recommended for the statements showing
+them are returned when the database does not have them yet.
+
+Plans are read from MySQL's EXPLAIN and SQLite's EXPLAIN QUERY PLAN.
+"""
+
+import collections
+import re
+
+import sqlalchemy as sa
+
+from fastrunner.api.openstack.db.sqlalchemy import api
+from fastrunner.api.openstack.db.sqlalchemy import models
+from fastrunner import exception
+
+StatementCheck = collections.namedtuple(
+    'StatementCheck', ['name', 'plan', 'problems', 'index'])
+
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+
+
+def check_indexes(engine):
+    """EXPLAIN every listing statement on engine.
+
+    :returns: list of StatementCheck, with the lines of the plan and the
+              problems found in it
+    :raises: fastrunner.exception.UnsupportedDialect if the database is
+             neither MySQL nor SQLite
+    """
+    explain = _EXPLAINERS.get(engine.dialect.name)
+    if explain is None:
+        raise exception.UnsupportedDialect(dialect=engine.dialect.name)
+    checks = []
+    with engine.connect() as connection:
+        for name, statement, params, index in api.listing_statements():
+            plan, problems = explain(connection, statement, params)
+            checks.append(StatementCheck(name, plan, problems, index))
+    return checks
+
+
+def recommended_indexes(engine, checks):
+    """Return the indexes recommended for the statements with problems that
+    engine's database does not have yet.
+
+    The indexes belong to a copy of the instances table, so creating them
+    leaves models untouched.
+    """
+    existing = [tuple(index['column_names']) for index in
+                sa.inspect(engine).get_indexes(models.instances.name)]
+    table = models.instances.tometadata(sa.MetaData())
+    indexes = []
+    seen = set()
+    for check in checks:
+        columns = check.index
+        if not check.problems or columns is None or columns in seen:
+            continue
+        seen.add(columns)
+        if any(index[:len(columns)] == columns for index in existing):
+            continue
+        indexes.append(sa.Index('%s_%s_idx' % (table.name, '_'.join(columns)),
+                                *[table.c[column] for column in columns]))
+    return indexes
+
+
+def index_ddl(engine, index):
+    """Return the CREATE INDEX statement of index for engine's database."""
+    return str(sa.schema.CreateIndex(index).compile(dialect=engine.dialect))
+
+
+def _execute_explain(connection, prefix, statement, params):
+    compiled = statement.compile(dialect=connection.dialect)
+    bound = compiled.construct_params(params)
+    if compiled.positional:
+        bound = [bound[name] for name in compiled.positiontup]
+    return connection.execute(prefix + compiled.string, bound).fetchall()
+
+
+def _explain_mysql(connection, statement, params):
+    plan = []
+    problems = []
+    for row in _execute_explain(connection, 'EXPLAIN ', statement, params):
+        row = dict((key.lower(), value) for key, value in row.items())
+        extra = row.get('extra') or ''
+        plan.append('%(table)s: type=%(type)s key=%(key)s rows=%(rows)s '
+                    '%(extra)s' % dict(row, extra=extra))
+        if row['type'] == 'ALL':
+            problems.append('full scan of %s' % row['table'])
+        elif row['type'] == 'index':
+            problems.append('full index scan of %s' % row['table'])
+        if 'Using filesort' in extra:
+            problems.append('filesort on %s' % row['table'])
+        if 'Using temporary' in extra:
+            problems.append('temporary table for %s' % row['table'])
+    return plan, problems
+
+
+def _explain_sqlite(connection, statement, params):
+    plan = []
+    problems = []
+    for row in _execute_explain(connection, 'EXPLAIN QUERY PLAN ',
+                                statement, params):
+        detail = row[-1]
+        plan.append(detail)
+        match = _SQLITE_SCAN.match(detail)
+        if match and 'INDEX' not in detail:
+            problems.append('full scan of %s' % match.group(1))
+        if 'USE TEMP B-TREE' in detail:
+            problems.append('filesort (%s)' % detail)
+    return plan, problems
+
+
+_EXPLAINERS = {
+    'mysql': _explain_mysql,
+    'sqlite': _explain_sqlite,
+}
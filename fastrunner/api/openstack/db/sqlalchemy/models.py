@@ -0,0 +1,149 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Table definitions for the parts of the nova schema fastrunner reads.
+
+fastrunner does not own these tables, so they are declared here with only
+the columns it queries. They are built once at import time instead of being
+reflected from the database on every request; check_schema() in the
+sqlalchemy api module verifies them against the live database.
+
+The indexes declared here are the ones nova creates on these tables. They
+are never created by fastrunner; the api module uses them to decide which
+columns can be sorted on without sorting a whole tenant.
+"""
+
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import String
+from sqlalchemy import Table
+from sqlalchemy import Text
+from sqlalchemy import UniqueConstraint
+
+
+metadata = MetaData()
+
+
+instances = Table('instances', metadata,
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    Column('deleted_at', DateTime),
+    Column('id', Integer, primary_key=True),
+    Column('uuid', String(36), nullable=False),
+    Column('user_id', String(255)),
+    Column('project_id', String(255)),
+    Column('image_ref', String(255)),
+    Column('power_state', Integer),
+    Column('vm_state', String(255)),
+    Column('task_state', String(255)),
+    Column('hostname', String(255)),
+    Column('host', String(255)),
+    Column('node', String(255)),
+    Column('display_name', String(255)),
+    Column('availability_zone', String(255)),
+    Column('cleaned', Integer),
+    Column('deleted', Integer),
+    UniqueConstraint('uuid', name='uniq_instances0uuid'),
+    Index('instances_project_id_deleted_idx', 'project_id', 'deleted'),
+    Index('instances_uuid_deleted_idx', 'uuid', 'deleted'),
+    Index('instances_task_state_updated_at_idx', 'task_state', 'updated_at'),
+    Index('instances_host_node_deleted_idx', 'host', 'node', 'deleted'),
+    Index('instances_host_deleted_cleaned_idx', 'host', 'deleted',
+          'cleaned'),
+    Index('instances_deleted_created_at_idx', 'deleted', 'created_at'),
+    Index('instances_updated_at_project_id_idx', 'updated_at',
+          'project_id'),
+)
+
+
+instance_extra = Table('instance_extra', metadata,
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    Column('deleted_at', DateTime),
+    Column('id', Integer, primary_key=True),
+    Column('instance_uuid', String(36), nullable=False),
+    Column('flavor', Text),
+    Column('deleted', Integer),
+    Index('instance_extra_idx', 'instance_uuid'),
+)
+
+
+instance_metadata = Table('instance_metadata', metadata,
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    Column('deleted_at', DateTime),
+    Column('id', Integer, primary_key=True),
+    Column('key', String(255)),
+    Column('value', String(255)),
+    Column('instance_uuid', String(36)),
+    Column('deleted', Integer),
+    Index('instance_metadata_instance_uuid_idx', 'instance_uuid'),
+)
+
+
+instance_info_caches = Table('instance_info_caches', metadata,
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    Column('deleted_at', DateTime),
+    Column('id', Integer, primary_key=True),
+    Column('network_info', Text),
+    Column('instance_uuid', String(36), nullable=False),
+    Column('deleted', Integer),
+    UniqueConstraint('instance_uuid',
+                     name='uniq_instance_info_caches0instance_uuid'),
+)
+
+
+security_groups = Table('security_groups', metadata,
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    Column('deleted_at', DateTime),
+    Column('id', Integer, primary_key=True),
+    Column('name', String(255)),
+    Column('project_id', String(255)),
+    Column('deleted', Integer),
+)
+
+
+security_group_instance_association = Table(
+    'security_group_instance_association', metadata,
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    Column('deleted_at', DateTime),
+    Column('id', Integer, primary_key=True),
+    Column('security_group_id', Integer),
+    Column('instance_uuid', String(36)),
+    Column('deleted', Integer),
+    Index('security_group_instance_association_instance_uuid_idx',
+          'instance_uuid'),
+)
+
+
+instance_faults = Table('instance_faults', metadata,
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    Column('deleted_at', DateTime),
+    Column('id', Integer, primary_key=True),
+    Column('instance_uuid', String(36)),
+    Column('code', Integer, nullable=False),
+    Column('message', String(255)),
+    Column('details', Text),
+    Column('host', String(255)),
+    Column('deleted', Integer),
+    Index('instance_faults_host_idx', 'host'),
+    Index('instance_faults_instance_uuid_deleted_created_at_idx',
+          'instance_uuid', 'deleted', 'created_at'),
+)
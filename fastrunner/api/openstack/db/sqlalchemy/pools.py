@@ -0,0 +1,98 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Warming and instrumentation of the connection pools of the engines.
+
+Workers open their connections lazily, so without warming the first
+requests a worker serves also pay for connecting and authenticating to the
+database. prewarm() opens connections up to the size of an engine's pool
+ahead of the first request and leaves them checked in.
+"""
+
+from oslo_log import log as logging
+from sqlalchemy import pool as sa_pool
+from sqlalchemy import sql
+
+from fastrunner.i18n import _LI
+
+LOG = logging.getLogger(__name__)
+
+_PING = sql.select([1])
+
+
+def prewarm(engine, size):
+    """Open and validate up to size connections of engine's pool.
+
+    The connections are held together while they are opened, so that each
+    is a distinct connection, then returned to the pool. No more than the
+    pool keeps are opened; pools other than QueuePool, such as the ones of
+    SQLite, are left alone.
+
+    :returns: the number of connections opened
+    """
+    pool = engine.pool
+    if not isinstance(pool, sa_pool.QueuePool):
+        return 0
+    size = min(size, pool.size())
+    connections = []
+    try:
+        for _i in range(size):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.scalar(_PING)
+    finally:
+        for connection in connections:
+            connection.close()
+    LOG.info(_LI("Opened %(count)d connections to %(url)s"),
+             {'count': len(connections), 'url': repr(engine.url)})
+    return len(connections)
+
+
+def stats(engine):
+    """Return the current usage of engine's pool."""
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, sa_pool.QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            # NOTE: QueuePool counts overflow from -size while the pool
+            # fills up.
+            'overflow': max(0, pool.overflow()),
+        })
+    return stats
+
+
+class CheckoutWaits(object):
+    """Time spent by DB API calls waiting for a connection.
+
+    This includes waiting for a connection to be checked in when the pool
+    is exhausted, and opening it if the pool had none ready.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def stats(self):
+        return {
+            'checkouts': self.count,
+            'wait_time_avg': self.total / self.count if self.count else 0.0,
+            'wait_time_max': self.max,
+        }
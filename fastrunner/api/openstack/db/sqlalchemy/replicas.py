@@ -0,0 +1,181 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Routing of read queries to replicas of the nova database.
+
+Replica lag is measured as the difference between max(instances.updated_at)
+on the primary and on the replica. updated_at leads an index of nova's, so
+this is an index lookup on both sides. A replica that cannot be queried, or
+lags the primary by more than the staleness bound, is left out until a
+later check finds it usable again. Reads go to the primary when no replica
+is usable, which is the case until the first check completes.
+
+Checks run in the background, so that a replica which does not answer
+stalls the check rather than the read which found it due.
+"""
+
+import itertools
+import time
+
+import eventlet
+from eventlet import patcher
+from oslo_config import cfg
+from oslo_db import exception as db_exc
+from oslo_log import log as logging
+import sqlalchemy as sa
+from sqlalchemy import sql
+
+from fastrunner.api.openstack.db.sqlalchemy import models
+from fastrunner.i18n import _LI, _LW
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+_HEARTBEAT = sql.select([sa.func.max(models.instances.c.updated_at)])
+
+
+class Replica(object):
+    def __init__(self, name, context_manager):
+        self.name = name
+        self.context_manager = context_manager
+        self.healthy = False
+        self.lag = None
+        self.checked_at = None
+
+    def heartbeat(self):
+        engine = self.context_manager.get_legacy_facade().get_engine()
+        return engine.scalar(_HEARTBEAT)
+
+
+def _spawn(fn):
+    """Run fn in the background of the calling thread."""
+    if CONF.database.execution_mode == 'green':
+        eventlet.spawn_n(fn)
+    else:
+        # NOTE: in tpool mode reads are routed from native threads of the
+        # pool, where greenthreads can not be spawned.
+        thread = patcher.original('threading').Thread(target=fn)
+        thread.daemon = True
+        thread.start()
+
+
+class ReplicaRouter(object):
+    """Pick the context manager serving a read, round robin across the
+    replicas within max_lag seconds of the primary.
+
+    Replicas are checked at most every check_interval seconds, in the
+    background of the first read past the interval.
+
+    :param spawn: callable running the check it is given in the
+                  background, a greenthread or a native thread by default,
+                  according to [database]/execution_mode
+    """
+
+    def __init__(self, primary, replicas, max_lag, check_interval,
+                 spawn=_spawn):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._spawn = spawn
+        self._usable = []
+        self._next = itertools.count()
+        self._checked_at = None
+        self._checking = False
+        self.reads = {'primary': 0}
+        for replica in replicas:
+            self.reads[replica.name] = 0
+
+    def get(self):
+        """Return the context manager to run the next read on."""
+        if self.replicas:
+            self._maybe_check()
+        usable = self._usable
+        if not usable:
+            self.reads['primary'] += 1
+            return self.primary
+        replica = usable[next(self._next) % len(usable)]
+        self.reads[replica.name] += 1
+        return replica.context_manager
+
+    def _maybe_check(self):
+        now = time.time()
+        if self._checking or (self._checked_at is not None and
+                              now - self._checked_at < self.check_interval):
+            return
+        self._checking = True
+        self._checked_at = now
+        self._spawn(self._check_in_background)
+
+    def _check_in_background(self):
+        try:
+            self.check()
+        except Exception:
+            LOG.exception("Replica check failed")
+        finally:
+            self._checking = False
+
+    def check(self):
+        """Measure the lag of every replica and update the usable set."""
+        primary_engine = self.primary.get_legacy_facade().get_engine()
+        try:
+            primary_heartbeat = primary_engine.scalar(_HEARTBEAT)
+        except db_exc.DBError:
+            LOG.exception("Primary database heartbeat failed, keeping the "
+                          "previous replica states")
+            return
+        usable = []
+        for replica in self.replicas:
+            was_healthy = replica.healthy
+            replica.checked_at = time.time()
+            try:
+                heartbeat = replica.heartbeat()
+            except db_exc.DBError as e:
+                replica.healthy = False
+                replica.lag = None
+                LOG.warning(_LW("Replica %(name)s is unreachable: %(err)s"),
+                            {'name': replica.name, 'err': e})
+                continue
+            if primary_heartbeat is None or heartbeat == primary_heartbeat:
+                replica.lag = 0.0
+            elif heartbeat is None:
+                replica.lag = float('inf')
+            else:
+                replica.lag = max(
+                    0.0, (primary_heartbeat - heartbeat).total_seconds())
+            replica.healthy = replica.lag <= self.max_lag
+            if replica.healthy:
+                usable.append(replica)
+                if not was_healthy:
+                    LOG.info(_LI("Replica %s is in use"), replica.name)
+            else:
+                LOG.warning(_LW("Replica %(name)s lags the primary by "
+                                "%(lag)s seconds, reading from other "
+                                "databases"),
+                            {'name': replica.name, 'lag': replica.lag})
+        self._usable = usable
+
+    def stats(self):
+        return {
+            'reads': dict(self.reads),
+            'replicas': [{'name': replica.name,
+                          'healthy': replica.healthy,
+                          'lag': replica.lag,
+                          'checked_at': replica.checked_at}
+                         for replica in self.replicas],
+        }
+
+
+def replica_name(connection):
+    """Name a replica by the host and database of its connection URL."""
+    url = sa.engine.url.make_url(connection)
+    return '%s/%s' % (url.host or '', url.database or '')
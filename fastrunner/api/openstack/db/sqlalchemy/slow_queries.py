@@ -0,0 +1,228 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Slow query log.
+
+Every statement run by an engine of the worker is timed. Statements slower
+than CONF.database.slow_query_threshold are added to a digest, by their
+normalized SQL, and logged with the shapes of their parameters, their row
+count, the request they ran for and the plan the database picked for them.
+
+The plan is read by a separate greenthread once the statement returned, on
+another connection. At most CONF.database.slow_query_log_rate statements
+are logged, and explained, per minute; the others only count in the digest.
+"""
+
+import re
+import time
+
+import eventlet
+from oslo_config import cfg
+from oslo_context import context as common_context
+from oslo_log import log as logging
+import sqlalchemy as sa
+
+from fastrunner.i18n import _LW
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+_EXPLAIN_PREFIXES = {
+    'mysql': 'EXPLAIN ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+
+# Placeholders of the DBAPI paramstyles, and lists of them.
+_PLACEHOLDER = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_PLACEHOLDER_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)'
+                               % (_PLACEHOLDER, _PLACEHOLDER))
+_WHITESPACE = re.compile(r'\s+')
+
+_START_TIMES_KEY = 'slow_queries.start_times'
+
+
+def normalize(statement):
+    """Return statement with its whitespace collapsed and its lists of
+    parameters folded, so that statements differing only by the length of
+    an IN list share a digest entry.
+    """
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    return _PLACEHOLDER_LIST.sub('(...)', statement)
+
+
+def parameters_shape(parameters, executemany=False):
+    """Describe the types of parameters, never their values."""
+    if executemany:
+        return {'rows': len(parameters)}
+    if isinstance(parameters, dict):
+        return dict((name, type(value).__name__)
+                    for name, value in parameters.items())
+    return [type(value).__name__ for value in parameters or ()]
+
+
+class SlowQueryLog(object):
+    """Digest of the slow statements of the worker, and their log."""
+
+    def __init__(self):
+        # normalized SQL -> digest entry
+        self._digest = {}
+        self._window_start = 0.0
+        self._window_logged = 0
+        self.logged = 0
+        self.suppressed = 0
+
+    def record(self, connection, statement, parameters, executemany,
+               seconds, rowcount):
+        sql = normalize(statement)
+        entry = self._digest.get(sql)
+        if entry is None:
+            entry = self._digest[sql] = {
+                'sql': sql, 'count': 0, 'total_time': 0.0, 'max_time': 0.0,
+                'max_rows': None, 'request_id': None, 'plan': None}
+            self._prune()
+        request_id = _current_request_id()
+        entry['count'] += 1
+        entry['total_time'] += seconds
+        if seconds >= entry['max_time']:
+            entry['max_time'] = seconds
+            entry['request_id'] = request_id
+        if rowcount is not None and rowcount >= 0:
+            entry['max_rows'] = max(entry['max_rows'] or 0, rowcount)
+
+        if not self._may_log():
+            self.suppressed += 1
+            return
+        self.logged += 1
+        LOG.warning(_LW("Slow query (%(time).3fs, %(rows)s rows, request "
+                        "%(request_id)s): %(sql)s parameters "
+                        "%(parameters)s"),
+                    {'time': seconds, 'rows': rowcount,
+                     'request_id': request_id, 'sql': sql,
+                     'parameters': parameters_shape(parameters,
+                                                    executemany)})
+        if not executemany:
+            self._explain(connection.engine, statement, parameters, entry,
+                          request_id)
+
+    def _may_log(self):
+        now = time.time()
+        if now - self._window_start >= 60:
+            if self.suppressed and self._window_logged:
+                LOG.warning(_LW("%d slow queries were not logged in the "
+                                "last minute"), self.suppressed)
+            self._window_start = now
+            self._window_logged = 0
+            self.suppressed = 0
+        if self._window_logged >= CONF.database.slow_query_log_rate:
+            return False
+        self._window_logged += 1
+        return True
+
+    def _explain(self, engine, statement, parameters, entry, request_id):
+        prefix = _EXPLAIN_PREFIXES.get(engine.dialect.name)
+        if prefix is None or not statement.lstrip().upper().startswith(
+                'SELECT'):
+            return
+        if CONF.database.execution_mode == 'green':
+            eventlet.spawn_n(self._capture_plan, engine, prefix + statement,
+                             parameters, entry, request_id)
+        else:
+            # NOTE: this runs in a native thread of tpool, which the hub
+            # does not wait on; greenthreads can not be spawned from it.
+            self._capture_plan(engine, prefix + statement, parameters,
+                               entry, request_id)
+
+    def _capture_plan(self, engine, explain, parameters, entry, request_id):
+        try:
+            with engine.connect() as connection:
+                plan = [' '.join(str(value) for value in row)
+                        for row in connection.execute(explain, parameters)]
+        except Exception as e:
+            LOG.debug("Could not explain slow query: %s", e)
+            return
+        entry['plan'] = plan
+        LOG.warning(_LW("Plan of slow query of request %(request_id)s: "
+                        "%(plan)s"),
+                    {'request_id': request_id, 'plan': ' | '.join(plan)})
+
+    def _prune(self):
+        limit = CONF.database.slow_query_digest_size * 10
+        if len(self._digest) <= limit:
+            return
+        entries = sorted(self._digest.values(),
+                         key=lambda entry: entry['total_time'])
+        for entry in entries[:len(self._digest) - limit]:
+            del self._digest[entry['sql']]
+
+    def digest(self, size=None):
+        """Return the digest entries with the most total time, slowest
+        first.
+        """
+        size = size or CONF.database.slow_query_digest_size
+        entries = sorted(self._digest.values(),
+                         key=lambda entry: entry['total_time'],
+                         reverse=True)
+        return [dict(entry) for entry in entries[:size]]
+
+    def stats(self):
+        return {
+            'threshold': CONF.database.slow_query_threshold,
+            'logged': self.logged,
+            'suppressed': self.suppressed,
+            'top': self.digest(),
+        }
+
+
+def _current_request_id():
+    context = common_context.get_current()
+    return getattr(context, 'request_id', None)
+
+
+_SLOW_QUERY_LOG = SlowQueryLog()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault(_START_TIMES_KEY, []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    start_times = conn.info.get(_START_TIMES_KEY)
+    if not start_times:
+        return
+    seconds = time.time() - start_times.pop()
+    threshold = CONF.database.slow_query_threshold
+    if not threshold or seconds < threshold:
+        return
+    if statement.startswith(tuple(_EXPLAIN_PREFIXES.values())):
+        return
+    _SLOW_QUERY_LOG.record(conn, statement, parameters, executemany,
+                           seconds, getattr(cursor, 'rowcount', None))
+
+
+def install():
+    """Time the statements of every engine of the worker."""
+    if not sa.event.contains(sa.engine.Engine, 'before_cursor_execute',
+                             _before_cursor_execute):
+        sa.event.listen(sa.engine.Engine, 'before_cursor_execute',
+                        _before_cursor_execute)
+        sa.event.listen(sa.engine.Engine, 'after_cursor_execute',
+                        _after_cursor_execute)
+
+
+def digest(size=None):
+    return _SLOW_QUERY_LOG.digest(size)
+
+
+def stats():
+    return _SLOW_QUERY_LOG.stats()
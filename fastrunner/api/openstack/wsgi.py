@@ -118,6 +118,13 @@ class Request(wsgi.Request):
         for item in items:
             db_items[item_get(item, item_key)] = item
 
+    def uncache_db_items(self, key):
+        """Forget the objects stored under key, for API methods rendering
+        their results in batches, which need not keep the objects of the
+        batches already rendered.
+        """
+        self._extension_data['db_items'].pop(key, None)
+
     def get_db_items(self, key):
         """Allow an API extension to get previously stored objects within
         the same API request.
@@ -381,6 +388,57 @@ class ResponseObject(object):
         return self._headers.copy()
 
 
+class StreamingResponseObject(ResponseObject):
+    """Response object whose collection is encoded while it is sent.
+
+    obj must be a dict with a single key, the collection name, mapping to
+    an iterable of items. Each item is JSON encoded on its own and handed
+    to the WSGI server as a separate chunk of the app_iter, so neither the
+    items nor the encoded body are ever held in memory as a whole.
+
+    links_builder, if given, is called with the number of items sent and
+    the last item once the iterable is exhausted; a non-empty result is
+    emitted as the <collection>_links member.
+    """
+
+    def __init__(self, obj, code=None, headers=None, links_builder=None):
+        super(StreamingResponseObject, self).__init__(obj, code=code,
+                                                      headers=headers)
+        self.links_builder = links_builder
+
+    def _iter_body(self):
+        (collection, items), = self.obj.items()
+        yield utils.utf8('{"%s": [' % collection)
+        count = 0
+        last_item = None
+        for item in items:
+            if count:
+                yield b', '
+            yield utils.utf8(jsonutils.dumps(item))
+            count += 1
+            last_item = item
+        yield b']'
+        if self.links_builder:
+            links = self.links_builder(count, last_item)
+            if links:
+                yield utils.utf8(', "%s_links": %s' %
+                                 (collection, jsonutils.dumps(links)))
+        yield b'}'
+
+    def serialize(self, request, content_type):
+        """Returns a webob.Response streaming the wrapped collection.
+
+        The response has no Content-Length, so the WSGI server sends it
+        with chunked transfer encoding.
+        """
+        response = webob.Response(app_iter=self._iter_body())
+        response.status_int = self.code
+        for hdr, value in self._headers.items():
+            response.headers[hdr] = utils.utf8(value)
+        response.headers['Content-Type'] = utils.utf8(content_type)
+        return response
+
+
 def action_peek(body):
     """Determine action to invoke.
 
@@ -1074,7 +1132,7 @@ class Fault(webob.exc.HTTPException):
             fault_name: {
                 'code': code,
                 'message': explanation}}
-        if code == 413 or code == 429:
+        if code == 413 or code == 429 or code == 503:
             retry = self.wrapped_exc.headers.get('Retry-After', None)
             if retry:
                 fault_data[fault_name]['retryAfter'] = retry
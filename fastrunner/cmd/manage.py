@@ -0,0 +1,153 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+  CLI interface for fastrunner management.
+"""
+
+from __future__ import print_function
+
+import sys
+
+from oslo_config import cfg
+from oslo_log import log as logging
+import six
+
+from fastrunner.api.openstack.db.sqlalchemy import api as db_api
+from fastrunner.api.openstack.db.sqlalchemy import indexes
+from fastrunner import exception
+from fastrunner.i18n import _
+from fastrunner import utils
+
+CONF = cfg.CONF
+
+
+# Decorators for actions
+def args(*args, **kwargs):
+    def _decorator(func):
+        func.__dict__.setdefault('args', []).insert(0, (args, kwargs))
+        return func
+    return _decorator
+
+
+class DbCommands(object):
+    """Class for checking the nova database fastrunner reads."""
+
+    @args('--ddl', action='store_true', dest='ddl', default=False,
+          help='Print the DDL of the recommended indexes')
+    @args('--apply', action='store_true', dest='apply', default=False,
+          help='Create the recommended indexes')
+    @args('--verbose', action='store_true', dest='verbose', default=False,
+          help='Print the plan of every statement')
+    def check_indexes(self, ddl=False, apply=False, verbose=False):
+        """Check the plans of the statements fastrunner issues.
+
+        Returns 0 when no statement scans a full table or sorts outside of
+        an index, 1 otherwise, and 2 if the plans can not be checked.
+        """
+        engine = db_api.get_api_engine()
+        try:
+            checks = indexes.check_indexes(engine)
+        except exception.UnsupportedDialect as e:
+            print(e.format_message())
+            return 2
+
+        for check in checks:
+            if check.problems:
+                print(_('%(name)s: %(problems)s') %
+                      {'name': check.name,
+                       'problems': '; '.join(check.problems)})
+            else:
+                print(_('%s: OK') % check.name)
+            if verbose or check.problems:
+                for line in check.plan:
+                    print('    %s' % line)
+
+        recommended = indexes.recommended_indexes(engine, checks)
+        if recommended:
+            print()
+            print(_('Recommended indexes:'))
+        for index in recommended:
+            if ddl or not apply:
+                print(indexes.index_ddl(engine, index).strip() + ';')
+            if apply:
+                index.create(bind=engine)
+                print(_('Created index %s') % index.name)
+        return 1 if any(check.problems for check in checks) else 0
+
+
+CATEGORIES = {
+    'db': DbCommands,
+}
+
+
+def methods_of(obj):
+    """Get all callable methods of an object that don't start with underscore
+
+    returns a list of tuples of the form (method_name, method)
+    """
+    result = []
+    for i in dir(obj):
+        if callable(getattr(obj, i)) and not i.startswith('_'):
+            result.append((i, getattr(obj, i)))
+    return result
+
+
+def add_command_parsers(subparsers):
+    for category in sorted(CATEGORIES):
+        command_object = CATEGORIES[category]()
+
+        parser = subparsers.add_parser(category)
+        parser.set_defaults(command_object=command_object)
+
+        category_subparsers = parser.add_subparsers(dest='action')
+
+        for (action, action_fn) in methods_of(command_object):
+            parser = category_subparsers.add_parser(
+                action.replace('_', '-'), description=action_fn.__doc__)
+
+            action_kwargs = []
+            for args, kwargs in getattr(action_fn, 'args', []):
+                parser.add_argument(*args, **kwargs)
+                action_kwargs.append(kwargs['dest'])
+
+            parser.set_defaults(action_fn=action_fn)
+            parser.set_defaults(action_kwargs=action_kwargs)
+
+
+category_opt = cfg.SubCommandOpt('category',
+                                 title='Command categories',
+                                 help='Available categories',
+                                 handler=add_command_parsers)
+
+
+def main():
+    """Parse options and call the appropriate class/method."""
+    CONF.register_cli_opts([category_opt])
+    utils.parse_args(sys.argv)
+    logging.setup(CONF, "fastrunner")
+
+    fn = CONF.category.action_fn
+    fn_kwargs = {}
+    for k in CONF.category.action_kwargs:
+        v = getattr(CONF.category, 'action_kwarg_' + k)
+        if v is None:
+            continue
+        if isinstance(v, six.binary_type):
+            v = v.decode('utf-8')
+        fn_kwargs[k] = v
+
+    try:
+        return fn(**fn_kwargs)
+    except Exception as ex:
+        print(_("error: %s") % ex)
+        return 1
@@ -0,0 +1,41 @@
+# Copyright 2010 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Possible vm states for instances.
+
+These are the values nova stores in instances.vm_state. Compute instance
+vm states represent the state of an instance as it pertains to a user or
+administrator.
+"""
+
+ACTIVE = 'active'  # VM is running
+BUILDING = 'building'  # VM only exists in DB
+PAUSED = 'paused'
+SUSPENDED = 'suspended'  # VM is suspended to disk.
+STOPPED = 'stopped'  # VM is powered off, the disk image is still there.
+RESCUED = 'rescued'  # A rescue image is running with the original VM image
+# attached.
+RESIZED = 'resized'  # a VM with the new size is active. The user is expected
+# to manually confirm or revert.
+
+SOFT_DELETED = 'soft-delete'  # VM is marked as deleted but the disk images are
+# still available to restore.
+DELETED = 'deleted'  # VM is permanently deleted.
+
+ERROR = 'error'
+
+SHELVED = 'shelved'  # VM is powered off, resources still on hypervisor
+SHELVED_OFFLOADED = 'shelved_offloaded'  # VM and associated resources are
+# not on hypervisor
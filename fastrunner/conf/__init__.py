@@ -19,7 +19,11 @@
 
 from oslo_config import cfg
 
+from fastrunner.conf import api
+from fastrunner.conf import database
 from fastrunner.conf import wsgi
 
 CONF = cfg.CONF
+api.register_opts(CONF)
+database.register_opts(CONF)
 wsgi.register_opts(CONF)
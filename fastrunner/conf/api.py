@@ -0,0 +1,174 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_config import cfg
+
+osapi_max_limit_opt = cfg.IntOpt('osapi_max_limit',
+         default=1000,
+         min=1,
+         help='The maximum number of items returned in a single response '
+              'from a collection resource. Requests asking for a larger '
+              'limit, or for no limit at all, are capped to this value and '
+              'get a "next" link to the following page.')
+
+osapi_compute_link_prefix_opt = cfg.StrOpt('osapi_compute_link_prefix',
+         help='Base URL that will be presented to users in links to the '
+              'OpenStack Compute API')
+
+servers_detail_streaming_opt = cfg.BoolOpt('servers_detail_streaming',
+         default=False,
+         help='Stream servers/detail responses. Rows are read from a '
+              'server-side cursor and each server is encoded and sent as '
+              'its own chunk, so memory per request stays flat whatever the '
+              'number of servers. Streamed responses have no '
+              'Content-Length and a database error part way through cuts '
+              'the response short instead of returning an error code. With '
+              '[database]/execution_mode tpool, the rows are read in full '
+              'by the thread running the query before any is sent, so '
+              'memory grows with the number of servers again.')
+
+servers_detail_snapshot_opt = cfg.BoolOpt('servers_detail_snapshot',
+         default=False,
+         help='Answer servers/detail from an in-memory snapshot of the '
+              'instances kept by each worker, when the snapshot is recent '
+              'enough. Such responses carry an Age header with the age of '
+              'the snapshot in seconds. Requests with "Cache-Control: '
+              'no-cache" are always answered from the database, and '
+              '"Cache-Control: max-age=N" lowers the accepted age.')
+
+servers_snapshot_refresh_interval_opt = cfg.IntOpt(
+         'servers_snapshot_refresh_interval',
+         default=5,
+         min=1,
+         help='Number of seconds between two refreshes of the servers '
+              'snapshot. Each refresh reads the instances changed since the '
+              'previous one.')
+
+servers_snapshot_max_staleness_opt = cfg.IntOpt(
+         'servers_snapshot_max_staleness',
+         default=30,
+         min=0,
+         help='Maximum age in seconds of the servers snapshot for it to '
+              'answer servers/detail. Older snapshots, for instance when '
+              'refreshes fail, leave requests to the database.')
+
+servers_snapshot_watermark_margin_opt = cfg.IntOpt(
+         'servers_snapshot_watermark_margin',
+         default=10,
+         min=0,
+         help='Number of seconds before the latest change seen by the '
+              'servers snapshot each refresh reads changes from again. '
+              'Writes are timestamped before they commit, so a change '
+              'committed by a transaction running longer than this may be '
+              'missed until the server changes again.')
+
+servers_snapshot_full_scan_interval_opt = cfg.IntOpt(
+         'servers_snapshot_full_scan_interval',
+         default=600,
+         min=0,
+         help='Number of seconds between two reads of the uuids of every '
+              'live instance by the servers snapshot, to drop the servers '
+              'whose rows were removed without being soft deleted first. '
+              'Soft deleted servers are dropped by the next refresh. A '
+              'value of 0 disables the scan.')
+
+db_request_timeout_opt = cfg.IntOpt('db_request_timeout',
+         default=60,
+         min=0,
+         help='Number of seconds an API request may spend querying the '
+              'database. Statements still running at that deadline are '
+              'cancelled and the request fails with 503 and a Retry-After '
+              'header. A value of 0 sets no deadline.')
+
+db_request_timeout_header_opt = cfg.StrOpt('db_request_timeout_header',
+         help='Name of a request header through which clients may shorten '
+              'db_request_timeout for their request, in seconds, e.g. '
+              'X-Request-Timeout. Clients can not extend the deadline. '
+              'Unset, the header is ignored.')
+
+db_retry_after_opt = cfg.IntOpt('db_retry_after',
+         default=5,
+         min=0,
+         help='Number of seconds sent in the Retry-After header of the '
+              'responses to requests whose database deadline expired.')
+
+servers_show_cache_size_opt = cfg.IntOpt('servers_show_cache_size',
+         default=1024,
+         min=0,
+         help='Number of rendered servers each worker keeps to answer '
+              'GET /servers/{id}. A cached server is only used while a '
+              'probe of its instance and the rows of its metadata, '
+              'addresses, security groups and faults shows it unchanged. A '
+              'value of 0 disables the cache.')
+
+servers_show_cache_ttl_opt = cfg.IntOpt('servers_show_cache_ttl',
+         default=60,
+         min=0,
+         help='Maximum age in seconds of a cached server for it to answer '
+              'GET /servers/{id}. It bounds how long changes the probe of '
+              'the show cache does not see, such as the rename of a flavor, '
+              'may be hidden. A value of 0 lets cached servers be used '
+              'until the probe shows a change.')
+
+servers_etag_opt = cfg.BoolOpt('servers_etag',
+         default=True,
+         help='Tag servers and servers/detail responses with an ETag and '
+              'answer requests whose If-None-Match matches it with 304 Not '
+              'Modified, without reading or rendering the servers. The tag '
+              'is derived from an aggregate query over the listed '
+              'instances and, for servers/detail, the rows of their '
+              'metadata, addresses, security groups and faults, run on the '
+              'connection of each listing before it. Listings answered from '
+              'the servers snapshot get weak ETags.')
+
+response_compression_min_size_opt = cfg.IntOpt(
+         'response_compression_min_size',
+         default=1024,
+         min=0,
+         help='Minimum size in bytes of a response body for the compress '
+              'filter of the API pipeline to compress it. Smaller bodies '
+              'are sent as they are, as compressing them saves little.')
+
+response_compression_level_opt = cfg.IntOpt('response_compression_level',
+         default=6,
+         min=1,
+         max=9,
+         help='zlib compression level of the responses compressed by the '
+              'compress filter of the API pipeline. Higher levels send '
+              'fewer bytes for more CPU time per response; the '
+              'response_compression worker metrics report both.')
+
+ALL_OPTS = [osapi_max_limit_opt,
+            osapi_compute_link_prefix_opt,
+            servers_detail_streaming_opt,
+            servers_detail_snapshot_opt,
+            servers_snapshot_refresh_interval_opt,
+            servers_snapshot_max_staleness_opt,
+            servers_snapshot_watermark_margin_opt,
+            servers_snapshot_full_scan_interval_opt,
+            db_request_timeout_opt,
+            db_request_timeout_header_opt,
+            db_retry_after_opt,
+            servers_show_cache_size_opt,
+            servers_show_cache_ttl_opt,
+            servers_etag_opt,
+            response_compression_min_size_opt,
+            response_compression_level_opt,
+            ]
+
+
+def register_opts(conf):
+    conf.register_opts(ALL_OPTS)
+
+
+def list_opts():
+    return {"DEFAULT": ALL_OPTS}
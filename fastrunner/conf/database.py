@@ -0,0 +1,183 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_config import cfg
+
+db_group = cfg.OptGroup('database',
+                        title='Database Options')
+
+compiled_cache_size_opt = cfg.IntOpt('compiled_cache_size',
+         default=100,
+         min=0,
+         help='Maximum number of compiled SQL statements kept per worker. '
+              'Listing statements are built once and their compiled form '
+              'is reused across requests. A value of 0 disables the '
+              'compiled statement cache.')
+
+statement_cache_size_opt = cfg.IntOpt('statement_cache_size',
+         default=500,
+         min=1,
+         help='Maximum number of SQL statements kept built per worker, by '
+              'the clauses they have. Statements are built once per set of '
+              'filters, sort keys and view and reused across requests; the '
+              'least recently used ones are dropped past this number. The '
+              'renderers of the views requested with the fields parameter '
+              'are kept up to the same number.')
+
+check_schema_on_start_opt = cfg.BoolOpt('check_schema_on_start',
+         default=True,
+         help='Verify at worker start that the nova tables queried by '
+              'fastrunner have the columns fastrunner expects. Startup '
+              'fails if a column is missing.')
+
+stream_fetch_size_opt = cfg.IntOpt('stream_fetch_size',
+         default=100,
+         min=1,
+         help='Number of rows fetched at a time from the server-side cursor '
+              'when a listing is streamed.')
+
+flavor_cache_size_opt = cfg.IntOpt('flavor_cache_size',
+         default=256,
+         min=0,
+         help='Maximum number of decoded instance flavors kept per worker. '
+              'Each distinct flavor blob of instance_extra is parsed once '
+              'and shared by every server using it. A value of 0 disables '
+              'the cache.')
+
+network_info_cache_size_opt = cfg.IntOpt('network_info_cache_size',
+         default=4096,
+         min=0,
+         help='Maximum number of rendered server addresses kept per worker. '
+              'The network_info blob of an instance info cache is parsed '
+              'once per update and its addresses are reused until the info '
+              'cache changes. A value of 0 disables the cache.')
+
+execution_mode_opt = cfg.StrOpt('execution_mode',
+         default='green',
+         choices=('green', 'tpool'),
+         help='How DB API calls run. "green" runs them in the request '
+              'greenthread and needs a pure-Python driver such as '
+              'mysql+pymysql so that waiting on the database yields to '
+              'other requests. "tpool" hands them to a pool of native '
+              'threads, which C drivers such as MySQLdb need.')
+
+tpool_size_opt = cfg.IntOpt('tpool_size',
+         default=20,
+         min=1,
+         help='Number of native threads running DB API calls when '
+              'execution_mode is "tpool".')
+
+replica_connection_opt = cfg.MultiStrOpt('replica_connection',
+         default=[],
+         secret=True,
+         help='SQLAlchemy connection string of a read replica of the nova '
+              'database. Repeat the option to use several replicas; reads '
+              'are spread across the replicas in round robin.')
+
+replica_max_lag_opt = cfg.IntOpt('replica_max_lag',
+         default=30,
+         min=0,
+         help='Maximum number of seconds a replica may lag the primary '
+              'database and still serve reads. Lag is measured by comparing '
+              'the latest instance update on both. Reads go to the primary '
+              'when no replica is within this bound.')
+
+replica_check_interval_opt = cfg.IntOpt('replica_check_interval',
+         default=10,
+         min=1,
+         help='Number of seconds between two checks of replica health and '
+              'lag. Checks run in the background; reads go to the '
+              'primary until the first check completes.')
+
+cell_connection_opt = cfg.MultiStrOpt('cell_connection',
+         default=[],
+         secret=True,
+         help='SQLAlchemy connection string of a cell database. Repeat the '
+              'option for every cell. When set, listings query all the '
+              'cell databases concurrently and merge their results, '
+              'instead of reading from the connection option.')
+
+cell_timeout_opt = cfg.IntOpt('cell_timeout',
+         default=30,
+         min=1,
+         help='Number of seconds to wait for a cell database to answer a '
+              'listing. Cells that do not answer in time are left out of '
+              'the listing and reported in the logs and worker metrics.')
+
+enrichment_chunk_size_opt = cfg.IntOpt('enrichment_chunk_size',
+         default=500,
+         min=1,
+         help='Maximum number of servers whose metadata, addresses, security '
+              'groups and faults are read with a single IN query. Larger '
+              'pages are read in several queries of at most this many '
+              'servers.')
+
+pool_prewarm_size_opt = cfg.IntOpt('pool_prewarm_size',
+         default=5,
+         min=0,
+         help='Number of connections each worker opens to every database '
+              'it reads from when it starts, before serving requests. They '
+              'are validated and kept in the connection pool, up to its '
+              'max_pool_size, so that the first requests after a restart '
+              'do not wait for connections to be established. A value of 0 '
+              'leaves connections to be opened on demand.')
+
+slow_query_threshold_opt = cfg.FloatOpt('slow_query_threshold',
+         default=0.5,
+         min=0,
+         help='Number of seconds after which a statement is reported as a '
+              'slow query. Slow queries are logged with the shapes of their '
+              'parameters, their row count, their request ID and their '
+              'EXPLAIN plan, and kept in the slow_queries digest of the '
+              'worker metrics. A value of 0 disables the slow query log.')
+
+slow_query_log_rate_opt = cfg.IntOpt('slow_query_log_rate',
+         default=10,
+         min=0,
+         help='Maximum number of slow queries each worker logs and explains '
+              'per minute. Slow queries past this rate are only counted in '
+              'the slow_queries digest.')
+
+slow_query_digest_size_opt = cfg.IntOpt('slow_query_digest_size',
+         default=20,
+         min=1,
+         help='Number of statements, by total time, reported in the '
+              'slow_queries digest of the worker metrics.')
+
+ALL_OPTS = [compiled_cache_size_opt,
+            statement_cache_size_opt,
+            check_schema_on_start_opt,
+            stream_fetch_size_opt,
+            flavor_cache_size_opt,
+            network_info_cache_size_opt,
+            execution_mode_opt,
+            tpool_size_opt,
+            replica_connection_opt,
+            replica_max_lag_opt,
+            replica_check_interval_opt,
+            cell_connection_opt,
+            cell_timeout_opt,
+            enrichment_chunk_size_opt,
+            pool_prewarm_size_opt,
+            slow_query_threshold_opt,
+            slow_query_log_rate_opt,
+            slow_query_digest_size_opt,
+            ]
+
+
+def register_opts(conf):
+    conf.register_group(db_group)
+    conf.register_opts(ALL_OPTS, group=db_group)
+
+
+def list_opts():
+    return {db_group: ALL_OPTS}
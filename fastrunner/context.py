@@ -20,6 +20,8 @@
 from contextlib import contextmanager
 import copy
 
+import eventlet.queue
+import eventlet.timeout
 from keystoneauth1.access import service_catalog as ksa_service_catalog
 from keystoneauth1 import plugin
 from oslo_context import context
@@ -34,6 +36,13 @@ from fastrunner import policy
 from fastrunner import utils
 
 LOG = logging.getLogger(__name__)
+# Context managers of the cell databases, by connection string. Cells come
+# from [database]/cell_connection, which is not mutable and so is not
+# reloaded on SIGHUP: the cache holds one entry per configured cell and
+# none goes stale while the worker runs, so it is never purged.
+CELL_CACHE = {}
+# Result of a cell which did not answer scatter_gather_cells in time.
+did_not_respond_sentinel = object()
 
 
 class _ContextAuthPlugin(plugin.BaseAuthPlugin):
@@ -75,7 +84,7 @@ class RequestContext(context.RequestContext):
                  request_id=None, auth_token=None, overwrite=True,
                  quota_class=None, user_name=None, project_name=None,
                  service_catalog=None, instance_lock_checked=False,
-                 user_auth_plugin=None, **kwargs):
+                 user_auth_plugin=None, db_deadline=None, **kwargs):
         """:param read_deleted: 'no' indicates deleted records are hidden,
                 'yes' indicates deleted records are visible,
                 'only' indicates that *only* deleted records are visible.
@@ -86,6 +95,10 @@ class RequestContext(context.RequestContext):
            :param user_auth_plugin: The auth plugin for the current request's
                 authentication data.
 
+           :param db_deadline: time.time() value after which the database
+                statements of the request are cancelled, None for no
+                deadline.
+
            :param kwargs: Extra arguments that might be present, but we ignore
                 because they possibly came in from older rpc messages.
         """
@@ -148,6 +161,7 @@ class RequestContext(context.RequestContext):
         # It is only manipulated using the target_cell contextmanager
         # provided by this module
         self.db_connection = None
+        self.db_deadline = db_deadline
         self.user_auth_plugin = user_auth_plugin
         if self.is_admin is None:
             self.is_admin = policy.check_is_admin(self)
@@ -281,3 +295,88 @@ def authorize_quota_class_context(context, class_name):
             raise exception.Forbidden()
 
 
+@contextmanager
+def target_cell(context, cell_mapping):
+    """Yields a new context with connection information for a specific cell.
+
+    This function yields a copy of the provided context, which is targeted to
+    the referenced cell for DB operations.
+
+    :param context: The RequestContext to add connection information
+    :param cell_mapping: An object with a database_connection attribute
+    """
+    # avoid circular import
+    from fastrunner.api.openstack import db
+    cctxt = copy.copy(context)
+    db_connection_string = cell_mapping.database_connection
+    if db_connection_string not in CELL_CACHE:
+        CELL_CACHE[db_connection_string] = db.create_context_manager(
+            db_connection_string)
+    cctxt.db_connection = CELL_CACHE[db_connection_string]
+    yield cctxt
+
+
+def scatter_gather_cells(context, cell_mappings, timeout, fn, *args,
+                         **kwargs):
+    """Target cells in parallel and return their results.
+
+    The first parameter in the signature of the function to call for each
+    cell should be of type RequestContext.
+
+    :param context: The RequestContext for querying cells
+    :param cell_mappings: The objects with name and database_connection
+                          attributes naming the cells to query
+    :param timeout: The amount of time in seconds to wait for all cells to
+                    respond
+    :param fn: The function to call for each cell
+    :param args: The args for the function to call for each cell, not
+                 including the RequestContext
+    :param kwargs: The kwargs for the function to call for each cell
+    :returns: A dict {cell name: result} containing the joined results. The
+              did_not_respond_sentinel will be returned for cells that did
+              not respond within the timeout, and the exception it raised
+              for a cell that failed.
+    """
+    greenthreads = []
+    queue = eventlet.queue.LightQueue()
+    results = {}
+
+    def gather_result(cell_mapping, fn, context, *args, **kwargs):
+        cell_name = cell_mapping.name
+        try:
+            with target_cell(context, cell_mapping) as cctxt:
+                result = fn(cctxt, *args, **kwargs)
+        except exception.FastrunnerException as e:
+            result = e
+        except Exception as e:
+            LOG.exception('Error gathering result from cell %s', cell_name)
+            result = e
+        # The queue is already synchronized.
+        queue.put((cell_name, result))
+
+    for cell_mapping in cell_mappings:
+        greenthreads.append((cell_mapping.name,
+                             utils.spawn(gather_result, cell_mapping,
+                                         fn, context, *args, **kwargs)))
+
+    with eventlet.timeout.Timeout(timeout, exception.CellTimeout):
+        try:
+            while len(results) != len(greenthreads):
+                cell_name, result = queue.get()
+                results[cell_name] = result
+        except exception.CellTimeout:
+            # NOTE: did_not_respond_sentinel is filled in below, when the
+            # pending green threads are killed.
+            pass
+
+    # Kill the green threads still pending and wait on those we know are done.
+    for cell_name, greenthread in greenthreads:
+        if cell_name not in results:
+            greenthread.kill()
+            results[cell_name] = did_not_respond_sentinel
+            LOG.warning(_LW('Timed out waiting for response from cell %s'),
+                        cell_name)
+        else:
+            greenthread.wait()
+
+    return results
@@ -135,10 +135,32 @@ class AdminRequired(Forbidden):
     msg_fmt = _("User does not have admin privileges")
 
 
+class NotFound(FastrunnerException):
+    msg_fmt = _("Resource could not be found.")
+    code = 404
+
+
+class MarkerNotFound(NotFound):
+    msg_fmt = _("Marker %(marker)s could not be found.")
+
+
+class InstanceNotFound(NotFound):
+    msg_fmt = _("Instance %(instance_id)s could not be found.")
+
+
+class CellTimeout(NotFound):
+    msg_fmt = _("Timeout waiting for response from cell")
+
+
 class InvalidInput(Invalid):
     msg_fmt = _("Invalid input received: %(reason)s")
 
 
+class InvalidSortKey(Invalid):
+    msg_fmt = _("Sort key %(sort_key)s is not supported. Supported keys "
+                "are: %(supported)s")
+
+
 class ConfigNotFound(FastrunnerException):
     msg_fmt = _("Could not find config at %(path)s")
 
@@ -147,4 +169,17 @@ class PasteAppNotFound(FastrunnerException):
     msg_fmt = _("Could not load paste app '%(name)s' from %(path)s")
 
 
+class DBSchemaMismatch(FastrunnerException):
+    msg_fmt = _("The schema of database %(database)s does not match the "
+                "tables fastrunner queries. Missing columns: %(missing)s")
+
+
+class UnsupportedDialect(FastrunnerException):
+    msg_fmt = _("Query plans can not be checked on %(dialect)s databases, "
+                "only on MySQL and SQLite.")
+
 
+class DBDeadlineExceeded(FastrunnerException):
+    msg_fmt = _("The database did not answer within the deadline of the "
+                "request.")
+    code = 503
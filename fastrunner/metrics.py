@@ -0,0 +1,36 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Per-worker instrumentation.
+
+Components register a collector, a callable returning a dict of their
+current counters, under a name. collect() gathers them all. The values
+describe the worker process they are collected in.
+"""
+
+import collections
+import os
+
+_COLLECTORS = collections.OrderedDict()
+
+
+def register(name, collector):
+    """Register collector under name, replacing any previous one."""
+    _COLLECTORS[name] = collector
+
+
+def collect():
+    """Return the current stats of every registered collector."""
+    stats = {'pid': os.getpid()}
+    for name, collector in _COLLECTORS.items():
+        stats[name] = collector()
+    return stats
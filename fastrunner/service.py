@@ -29,6 +29,8 @@ import oslo_messaging as messaging
 from oslo_service import service
 from oslo_utils import importutils
 
+from fastrunner.api.openstack import db
+from fastrunner.api.openstack.db import snapshot
 from fastrunner import context
 from fastrunner import exception
 from fastrunner.i18n import _, _LE, _LI, _LW
@@ -139,6 +141,12 @@ class WSGIService(service.Service):
         :returns: None
 
         """
+        if CONF.database.check_schema_on_start:
+            db.check_schema()
+        if CONF.database.pool_prewarm_size:
+            db.prewarm_pools(CONF.database.pool_prewarm_size)
+        if CONF.servers_detail_snapshot:
+            snapshot.start(CONF.servers_snapshot_refresh_interval)
         self.server.start()
         if self.manager:
             self.manager.post_start_hook()
@@ -0,0 +1,102 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests of fastrunner.api.openstack.db.concurrency."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from eventlet import patcher
+from oslo_db import options
+import six
+import sqlalchemy as sa
+
+from fastrunner.api.openstack.db import api as db
+from fastrunner.api.openstack.db import concurrency
+from fastrunner.api.openstack.db.sqlalchemy import api
+from fastrunner.api.openstack.db.sqlalchemy import models
+from fastrunner import context as fastrunner_context
+
+_thread = patcher.original(six.moves._thread.__name__)
+
+
+class _FakeBackend(object):
+    """Backend whose listing records the thread running each of its
+    steps.
+    """
+
+    def __init__(self):
+        self.threads = []
+
+    def listing(self):
+        def stream():
+            try:
+                for i in range(3):
+                    self.threads.append(_thread.get_ident())
+                    yield i
+            finally:
+                self.threads.append(_thread.get_ident())
+        self.threads.append(_thread.get_ident())
+        return stream()
+
+
+class TpoolStreamingTest(unittest.TestCase):
+
+    def setUp(self):
+        super(TpoolStreamingTest, self).setUp()
+        options.set_defaults(api.CONF)
+        api.CONF.set_override('execution_mode', 'tpool', group='database')
+        self.addCleanup(api.CONF.clear_override, 'execution_mode',
+                        group='database')
+        self.executor = concurrency.DbapiExecutor(
+            api.CONF, backend_mapping=db._BACKEND_MAPPING)
+
+    def test_generator_runs_in_one_thread(self):
+        backend = _FakeBackend()
+        self.executor._backend = backend
+        self.assertEqual([0, 1, 2], list(self.executor.listing()))
+        self.assertEqual(5, len(backend.threads))
+        self.assertEqual(1, len(set(backend.threads)))
+        self.assertNotEqual(_thread.get_ident(), backend.threads[0])
+
+    def test_stream_listing_from_sqlite(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        connection = 'sqlite:///%s' % os.path.join(tmpdir, 'nova.db')
+        engine = sa.create_engine(connection)
+        self.addCleanup(engine.dispose)
+        models.metadata.create_all(engine)
+        for i in range(3):
+            uuid = 'uuid-%d' % i
+            engine.execute(models.instances.insert(), {
+                'uuid': uuid, 'project_id': 'project', 'deleted': 0,
+                'vm_state': 'active', 'hostname': 'server-%d' % i})
+            engine.execute(models.instance_extra.insert(), {
+                'instance_uuid': uuid, 'deleted': 0,
+                'flavor': '{"cur": {"nova_object.data": {"ephemeral_gb": 0, '
+                          '"vcpus": 1, "memory_mb": 512, "flavorid": "1", '
+                          '"name": "m1.tiny"}}}'})
+        context = fastrunner_context.RequestContext(
+            user_id='user', project_id='project', is_admin=False,
+            overwrite=False)
+        context.db_connection = api.create_context_manager(connection)
+        self.addCleanup(
+            lambda: context.db_connection.get_legacy_facade().get_engine()
+            .dispose())
+
+        servers = self.executor.instance_get_all_iter(context)
+        self.assertEqual(set(['uuid-0', 'uuid-1', 'uuid-2']),
+                         set(server['id'] for server in servers))
+        # The stream released its connection: the database is not locked.
+        engine.execute('CREATE TABLE after_stream (id INTEGER)')
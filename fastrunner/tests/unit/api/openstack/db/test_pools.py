@@ -0,0 +1,133 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests of the prewarming and the stats of the connection pools, with
+SQLite databases behind QueuePools.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from oslo_db import options
+import sqlalchemy as sa
+
+from fastrunner.api.openstack.db import api as db
+from fastrunner.api.openstack.db.sqlalchemy import api
+from fastrunner.api.openstack.db.sqlalchemy import pools
+from fastrunner.api.openstack.db.sqlalchemy import replicas
+from fastrunner import context as fastrunner_context
+
+
+class _FakeContextManager(object):
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def get_legacy_facade(self):
+        return self
+
+    def get_engine(self):
+        return self.engine
+
+
+class _PoolsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(_PoolsTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def _engine(self, name):
+        engine = sa.create_engine(
+            'sqlite:///%s' % os.path.join(self.tmpdir, name),
+            poolclass=sa.pool.QueuePool, pool_size=2, max_overflow=2)
+        self.addCleanup(engine.dispose)
+        return engine
+
+
+class PrewarmTest(_PoolsTestCase):
+
+    def test_prewarm(self):
+        engine = self._engine('nova.db')
+        self.assertEqual(2, pools.prewarm(engine, 5))
+        self.assertEqual({'pool': 'QueuePool', 'size': 2, 'checked_in': 2,
+                          'checked_out': 0, 'overflow': 0},
+                         pools.stats(engine))
+        connection = engine.connect()
+        self.addCleanup(connection.close)
+        self.assertEqual(1, pools.stats(engine)['checked_out'])
+        self.assertEqual(1, pools.stats(engine)['checked_in'])
+
+    def test_prewarm_fewer(self):
+        engine = self._engine('nova.db')
+        self.assertEqual(1, pools.prewarm(engine, 1))
+        self.assertEqual(1, pools.stats(engine)['checked_in'])
+
+    def test_pool_without_size(self):
+        engine = sa.create_engine('sqlite://')
+        self.addCleanup(engine.dispose)
+        self.assertEqual(0, pools.prewarm(engine, 2))
+        self.assertEqual({'pool': 'SingletonThreadPool'},
+                         pools.stats(engine))
+
+
+class DatabasePoolsTest(_PoolsTestCase):
+    """prewarm_pools and pool_stats of the DB API, with and without cells.
+    """
+
+    def setUp(self):
+        super(DatabasePoolsTest, self).setUp()
+        options.set_defaults(api.CONF)
+
+    def _cell(self, name):
+        connection = 'sqlite:///%s' % os.path.join(self.tmpdir, name)
+        fastrunner_context.CELL_CACHE[connection] = _FakeContextManager(
+            self._engine(name))
+        self.addCleanup(fastrunner_context.CELL_CACHE.pop, connection)
+        return connection
+
+    def test_without_cells(self):
+        primary = _FakeContextManager(self._engine('nova.db'))
+        replica = replicas.Replica('replica', _FakeContextManager(
+            self._engine('replica.db')))
+        self.addCleanup(setattr, api, 'api_context_manager',
+                        api.api_context_manager)
+        self.addCleanup(setattr, api, '_REPLICA_ROUTER', api._REPLICA_ROUTER)
+        api.api_context_manager = primary
+        api._REPLICA_ROUTER = replicas.ReplicaRouter(primary, [replica], 30,
+                                                     10)
+
+        db.prewarm_pools(5)
+        stats = db.pool_stats()
+        self.assertEqual(set(['primary', 'replica', 'checkout']), set(stats))
+        for name in ('primary', 'replica'):
+            self.assertEqual(2, stats[name]['checked_in'])
+            self.assertEqual(0, stats[name]['checked_out'])
+
+    def test_cells(self):
+        api.CONF.set_override('cell_connection',
+                              [self._cell('cell1.db'), self._cell('cell2.db')],
+                              group='database')
+        self.addCleanup(api.CONF.clear_override, 'cell_connection',
+                        group='database')
+
+        db.prewarm_pools(1)
+        stats = db.pool_stats()
+        names = [cell.name for cell in db.get_cell_mappings()]
+        self.assertEqual(2, len(set(names)))
+        self.assertEqual(set(names), set(stats))
+        for name in names:
+            self.assertEqual(set(['primary', 'checkout']), set(stats[name]))
+            self.assertEqual(1, stats[name]['primary']['checked_in'])
+            self.assertEqual(2, stats[name]['primary']['size'])
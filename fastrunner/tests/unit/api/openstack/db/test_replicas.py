@@ -0,0 +1,153 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests of fastrunner.api.openstack.db.sqlalchemy.replicas, with SQLite
+databases standing in for the primary and its replicas.
+"""
+
+import datetime
+import time
+import unittest
+
+import eventlet
+from eventlet import event
+from oslo_db import exception as db_exc
+import sqlalchemy as sa
+
+from fastrunner.api.openstack.db.sqlalchemy import models
+from fastrunner.api.openstack.db.sqlalchemy import replicas
+
+_UPDATED_AT = datetime.datetime(2016, 1, 1, 12, 0, 0)
+
+
+class _FakeContextManager(object):
+    """Context manager of a database, for the heartbeat of the router."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def get_legacy_facade(self):
+        return self
+
+    def get_engine(self):
+        return self.engine
+
+
+class _UnreachableEngine(object):
+
+    def scalar(self, statement):
+        raise db_exc.DBConnectionError()
+
+
+class _HangingEngine(object):
+    """Engine whose queries wait until released, like a replica which
+    does not answer.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.released = event.Event()
+
+    def scalar(self, statement):
+        self.released.wait()
+        return self.engine.scalar(statement)
+
+
+def _database(updated_at):
+    engine = sa.create_engine('sqlite://')
+    models.metadata.create_all(engine)
+    engine.execute(models.instances.insert(), {
+        'uuid': 'uuid', 'deleted': 0, 'updated_at': updated_at})
+    return engine
+
+
+def _run(fn):
+    fn()
+
+
+class ReplicaRouterTest(unittest.TestCase):
+
+    def setUp(self):
+        super(ReplicaRouterTest, self).setUp()
+        self.primary = _FakeContextManager(_database(_UPDATED_AT))
+
+    def _replica(self, name, lag=0, engine=None):
+        if engine is None:
+            engine = _database(_UPDATED_AT - datetime.timedelta(seconds=lag))
+        return replicas.Replica(name, _FakeContextManager(engine))
+
+    def _router(self, replica_list, spawn=_run):
+        return replicas.ReplicaRouter(self.primary, replica_list, max_lag=30,
+                                      check_interval=10, spawn=spawn)
+
+    def test_round_robin(self):
+        first = self._replica('first')
+        second = self._replica('second', lag=5)
+        router = self._router([first, second])
+        picked = [router.get() for _i in range(4)]
+        self.assertEqual([first.context_manager, second.context_manager] * 2,
+                         picked)
+        self.assertEqual({'primary': 0, 'first': 2, 'second': 2},
+                         router.stats()['reads'])
+        self.assertEqual(5.0, second.lag)
+
+    def test_lagging_replica_left_out(self):
+        first = self._replica('first')
+        lagging = self._replica('lagging', lag=60)
+        router = self._router([first, lagging])
+        self.assertEqual([first.context_manager] * 3,
+                         [router.get() for _i in range(3)])
+        self.assertFalse(lagging.healthy)
+        self.assertEqual(60.0, lagging.lag)
+
+    def test_unreachable_replica_left_out(self):
+        first = self._replica('first')
+        unreachable = self._replica('unreachable',
+                                    engine=_UnreachableEngine())
+        router = self._router([unreachable, first])
+        self.assertEqual([first.context_manager] * 2,
+                         [router.get() for _i in range(2)])
+        self.assertFalse(unreachable.healthy)
+        self.assertIsNone(unreachable.lag)
+
+    def test_primary_without_usable_replica(self):
+        router = self._router([self._replica('lagging', lag=60),
+                               self._replica('unreachable',
+                                             engine=_UnreachableEngine())])
+        self.assertIs(self.primary, router.get())
+        self.assertEqual(1, router.stats()['reads']['primary'])
+
+    def test_replica_usable_again(self):
+        replica = self._replica('replica', lag=60)
+        router = self._router([replica])
+        self.assertIs(self.primary, router.get())
+        replica.context_manager.engine.execute(
+            models.instances.update().values(updated_at=_UPDATED_AT))
+        router._checked_at -= router.check_interval
+        self.assertIs(replica.context_manager, router.get())
+
+    def test_check_does_not_stall_reads(self):
+        hanging = _HangingEngine(_database(_UPDATED_AT))
+        replica = self._replica('hanging', engine=hanging)
+        router = self._router([replica], spawn=eventlet.spawn_n)
+        started = time.time()
+        self.assertIs(self.primary, router.get())
+        eventlet.sleep(0)
+        # The check is waiting on the replica; reads keep going to the
+        # primary without waiting for it.
+        self.assertIs(self.primary, router.get())
+        self.assertLess(time.time() - started, 1)
+        self.assertTrue(router._checking)
+        hanging.released.send()
+        eventlet.sleep(0)
+        self.assertFalse(router._checking)
+        self.assertTrue(replica.healthy)
@@ -0,0 +1,156 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests of fastrunner.api.openstack.db.sqlalchemy.slow_queries."""
+
+import logging
+import time
+import unittest
+
+from oslo_context import context as common_context
+from oslo_db import options
+import sqlalchemy as sa
+
+from fastrunner.api.openstack.db.sqlalchemy import api
+from fastrunner.api.openstack.db.sqlalchemy import slow_queries
+
+
+class NormalizeTest(unittest.TestCase):
+
+    def test_whitespace(self):
+        self.assertEqual('SELECT a FROM t WHERE b = ?',
+                         slow_queries.normalize('\n  SELECT a\nFROM t\n'
+                                                '\tWHERE   b = ?  '))
+
+    def test_parameter_lists(self):
+        for placeholders in ('?, ?', '?, ?, ?', '%s,%s', ':uuid_1, :uuid_2',
+                             '%(uuid_1)s, %(uuid_2)s, %(uuid_3)s'):
+            self.assertEqual(
+                'SELECT a FROM t WHERE uuid IN (...)',
+                slow_queries.normalize('SELECT a FROM t WHERE uuid IN (%s)'
+                                       % placeholders))
+
+    def test_single_parameter_kept(self):
+        self.assertEqual('SELECT a FROM t WHERE uuid IN (?)',
+                         slow_queries.normalize(
+                             'SELECT a FROM t WHERE uuid IN (?)'))
+
+
+class ParametersShapeTest(unittest.TestCase):
+
+    def test_dict(self):
+        self.assertEqual({'project_id': 'str', 'limit': 'int'},
+                         slow_queries.parameters_shape(
+                             {'project_id': 'secret', 'limit': 1000}))
+
+    def test_sequence(self):
+        self.assertEqual(['str', 'NoneType'],
+                         slow_queries.parameters_shape(('secret', None)))
+        self.assertEqual([], slow_queries.parameters_shape(None))
+
+    def test_executemany(self):
+        self.assertEqual({'rows': 2}, slow_queries.parameters_shape(
+            [('secret',), ('other',)], executemany=True))
+
+
+class _RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class SlowQueryLogTest(unittest.TestCase):
+
+    def setUp(self):
+        super(SlowQueryLogTest, self).setUp()
+        options.set_defaults(api.CONF)
+        self._override('slow_query_threshold', 0.05)
+        # NOTE: in tpool mode the plan is read before record returns,
+        # rather than by a greenthread outliving the test.
+        self._override('execution_mode', 'tpool')
+        self.addCleanup(setattr, slow_queries, '_SLOW_QUERY_LOG',
+                        slow_queries._SLOW_QUERY_LOG)
+        slow_queries._SLOW_QUERY_LOG = slow_queries.SlowQueryLog()
+        slow_queries.install()
+
+        self.handler = _RecordingHandler()
+        logger = logging.getLogger(slow_queries.__name__)
+        logger.addHandler(self.handler)
+        self.addCleanup(logger.removeHandler, self.handler)
+
+        self.engine = sa.create_engine('sqlite://')
+        self.addCleanup(self.engine.dispose)
+
+        @sa.event.listens_for(self.engine, 'connect')
+        def _sleep(dbapi_connection, connection_record):
+            dbapi_connection.create_function('sleep', 2, _sleep_and_return)
+
+    def _override(self, name, value):
+        api.CONF.set_override(name, value, group='database')
+        self.addCleanup(api.CONF.clear_override, name, group='database')
+
+    def _select(self, seconds):
+        return self.engine.execute(
+            sa.text("SELECT sleep(:seconds, :secret)  \n  WHERE 1 IN (1, 2)"),
+            seconds=seconds, secret='hunter2').scalar()
+
+    def test_threshold(self):
+        self._select(0)
+        self.assertEqual([], self.handler.messages)
+        self.assertEqual([], slow_queries.digest())
+        self._select(0.1)
+        self.assertEqual(1, slow_queries.stats()['logged'])
+        entry, = slow_queries.digest()
+        self.assertEqual(1, entry['count'])
+        self.assertGreaterEqual(entry['max_time'], 0.1)
+
+    def test_disabled(self):
+        self._override('slow_query_threshold', 0)
+        self._select(0.1)
+        self.assertEqual([], self.handler.messages)
+        self.assertEqual([], slow_queries.digest())
+
+    def test_log_record(self):
+        common_context.RequestContext(request_id='req-slow')
+        self._select(0.1)
+        message = self.handler.messages[0]
+        self.assertTrue(message.startswith('Slow query ('), message)
+        self.assertIn('SELECT sleep(...) WHERE 1 IN (1, 2) parameters '
+                      "['float', 'str']", message)
+        self.assertIn('request req-slow', message)
+        self.assertNotIn('hunter2', message)
+        entry, = slow_queries.digest()
+        self.assertEqual('SELECT sleep(...) WHERE 1 IN (1, 2)', entry['sql'])
+        self.assertEqual('req-slow', entry['request_id'])
+        self.assertTrue(entry['plan'])
+        self.assertTrue(self.handler.messages[1].startswith(
+            'Plan of slow query of request req-slow: '))
+
+    def test_rate(self):
+        self._override('slow_query_log_rate', 1)
+        self._select(0.06)
+        self._select(0.06)
+        stats = slow_queries.stats()
+        self.assertEqual(1, stats['logged'])
+        self.assertEqual(1, stats['suppressed'])
+        self.assertEqual(2, stats['top'][0]['count'])
+        self.assertEqual(1, len([message for message in self.handler.messages
+                                 if message.startswith('Slow query (')]))
+
+
+def _sleep_and_return(seconds, value):
+    time.sleep(seconds)
+    return value
@@ -0,0 +1,436 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests of the statements of fastrunner.api.openstack.db.sqlalchemy.api,
+run on an in-memory SQLite database.
+"""
+
+import datetime
+import re
+import unittest
+
+from oslo_db import options
+import six
+import sqlalchemy as sa
+from sqlalchemy import sql
+
+from fastrunner.api.openstack import common
+from fastrunner.api.openstack.compute import servers
+from fastrunner.api.openstack.db.sqlalchemy import api
+from fastrunner.api.openstack.db.sqlalchemy import indexes
+from fastrunner.api.openstack.db.sqlalchemy import models
+from fastrunner import exception
+from fastrunner.tests.unit.api.openstack import test_common
+from fastrunner import utils
+
+
+class StatusCriterionTest(unittest.TestCase):
+
+    def setUp(self):
+        super(StatusCriterionTest, self).setUp()
+        self.engine = sa.create_engine('sqlite://')
+        models.metadata.create_all(self.engine)
+        self.shown = {}
+        rows = []
+        for vm_state in sorted(common._STATE_MAP):
+            for task_state in test_common.ALL_TASK_STATES:
+                uuid = '%s/%s' % (vm_state, task_state)
+                self.shown[uuid] = common.status_from_state(vm_state,
+                                                            task_state)
+                rows.append({'uuid': uuid, 'vm_state': vm_state,
+                             'task_state': task_state, 'deleted': 0})
+        self.engine.execute(models.instances.insert(), rows)
+
+    def tearDown(self):
+        self.engine.dispose()
+        super(StatusCriterionTest, self).tearDown()
+
+    def _select(self, statuses):
+        statement = sql.select([models.instances.c.uuid]).where(
+            api._status_criterion(api._status_shape(statuses)))
+        return set(row[0] for row in self.engine.execute(statement))
+
+    def test_every_status(self):
+        for status in test_common.ALL_STATUSES:
+            expected = set(uuid for uuid, shown in self.shown.items()
+                           if shown == status)
+            self.assertEqual(expected, self._select([status]), status)
+
+    def test_several_statuses(self):
+        statuses = ['ACTIVE', 'REBOOT', 'SHUTOFF']
+        expected = set(uuid for uuid, shown in self.shown.items()
+                       if shown in statuses)
+        self.assertEqual(expected, self._select(statuses))
+
+    def test_unknown_status(self):
+        self.assertEqual(set(), self._select(['FOO']))
+
+    def test_default_without_overrides_ignores_task_state(self):
+        criterion = api._status_criterion(api._status_shape(['BUILD']))
+        self.assertNotIn('task_state', str(criterion))
+
+    def test_shape_of_equivalent_statuses(self):
+        self.assertEqual(api._status_shape(['ACTIVE']),
+                         api._status_shape(['active', 'ACTIVE', 'FOO']))
+
+
+class FingerprintQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        super(FingerprintQueryTest, self).setUp()
+        self.engine = sa.create_engine('sqlite://')
+        models.metadata.create_all(self.engine)
+        self.engine.execute(models.instances.insert(), [
+            {'uuid': 'a', 'project_id': 'p', 'deleted': 0,
+             'created_at': datetime.datetime(2016, 1, 1)},
+            {'uuid': 'b', 'project_id': 'p', 'deleted': 0,
+             'created_at': datetime.datetime(2016, 1, 2)},
+            {'uuid': 'c', 'project_id': 'other', 'deleted': 0,
+             'created_at': datetime.datetime(2016, 1, 3)},
+        ])
+        self.engine.execute(models.instance_extra.insert(), [
+            {'instance_uuid': uuid, 'deleted': 0} for uuid in 'abc'])
+        self.engine.execute(models.security_groups.insert(),
+                            {'id': 1, 'name': 'default', 'deleted': 0})
+
+    def tearDown(self):
+        self.engine.dispose()
+        super(FingerprintQueryTest, self).tearDown()
+
+    def _fingerprint(self, view='detail'):
+        query = api._build_instance_fingerprint_query(
+            view, 'no', (('project_id', None),))
+        return tuple(self.engine.execute(query,
+                                         filter_project_id='p').first())
+
+    def _assert_moves(self, table, **values):
+        before = self._fingerprint()
+        index_before = self._fingerprint('index')
+        self.engine.execute(table.insert(), dict(
+            values, created_at=datetime.datetime(2016, 2, 1), deleted=0))
+        self.assertNotEqual(before, self._fingerprint())
+        self.assertEqual(index_before, self._fingerprint('index'))
+
+    def test_servers(self):
+        fingerprint = self._fingerprint('index')
+        self.assertEqual(2, fingerprint[0])
+        self.engine.execute(models.instances.insert(), {
+            'uuid': 'd', 'project_id': 'other', 'deleted': 0})
+        self.assertEqual(fingerprint, self._fingerprint('index'))
+        self.engine.execute(models.instances.update().where(
+            models.instances.c.uuid == 'a').values(
+                updated_at=datetime.datetime(2016, 3, 1)))
+        self.assertNotEqual(fingerprint, self._fingerprint('index'))
+
+    def test_info_cache(self):
+        self._assert_moves(models.instance_info_caches, instance_uuid='a')
+
+    def test_metadata(self):
+        self._assert_moves(models.instance_metadata, instance_uuid='a',
+                           key='k', value='v')
+
+    def test_security_group(self):
+        self._assert_moves(models.security_group_instance_association,
+                           instance_uuid='b', security_group_id=1)
+
+    def test_fault(self):
+        self._assert_moves(models.instance_faults, instance_uuid='b',
+                           code=500, message='boom')
+
+    def test_other_project_extras(self):
+        before = self._fingerprint()
+        self.engine.execute(models.instance_metadata.insert(), {
+            'instance_uuid': 'c', 'key': 'k', 'value': 'v', 'deleted': 0,
+            'created_at': datetime.datetime(2016, 2, 1)})
+        self.assertEqual(before, self._fingerprint())
+
+    def test_renamed_security_group(self):
+        self.engine.execute(
+            models.security_group_instance_association.insert(),
+            {'instance_uuid': 'a', 'security_group_id': 1, 'deleted': 0})
+        before = self._fingerprint()
+        self.engine.execute(models.security_groups.update().values(
+            name='renamed', updated_at=datetime.datetime(2016, 3, 1)))
+        self.assertNotEqual(before, self._fingerprint())
+
+
+class VersionQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        super(VersionQueryTest, self).setUp()
+        self.engine = sa.create_engine('sqlite://')
+        models.metadata.create_all(self.engine)
+        self.engine.execute(models.instances.insert(), [
+            {'uuid': 'a', 'project_id': 'p', 'deleted': 0},
+            {'uuid': 'b', 'project_id': 'p', 'deleted': 0},
+        ])
+
+    def tearDown(self):
+        self.engine.dispose()
+        super(VersionQueryTest, self).tearDown()
+
+    def _version(self, uuid='a'):
+        query = api._build_instance_version_query('no', True)
+        row = self.engine.execute(query, uuid=uuid, project_id='p').first()
+        return row and tuple(row)
+
+    def test_missing_server(self):
+        self.assertIsNone(self._version('c'))
+
+    def test_metadata(self):
+        before = self._version()
+        self.engine.execute(models.instance_metadata.insert(), {
+            'instance_uuid': 'a', 'key': 'k', 'value': 'v', 'deleted': 0,
+            'created_at': datetime.datetime(2016, 2, 1)})
+        self.assertNotEqual(before, self._version())
+
+    def test_other_server(self):
+        before = self._version()
+        self.engine.execute(models.instance_faults.insert(), {
+            'instance_uuid': 'b', 'code': 500, 'deleted': 0,
+            'created_at': datetime.datetime(2016, 2, 1)})
+        self.assertEqual(before, self._version())
+
+
+class FieldsViewTest(unittest.TestCase):
+
+    def setUp(self):
+        super(FieldsViewTest, self).setUp()
+        self.addCleanup(setattr, api, '_FIELDS_VIEWS', api._FIELDS_VIEWS)
+        api._FIELDS_VIEWS = utils.LRUCache(2)
+
+    def test_same_view_for_db_keys(self):
+        view = api._get_view(('id', 'name', 'status'))
+        self.assertIs(view, api._get_view(('status', 'links', 'name', 'id')))
+        self.assertIs(view, api._get_view(frozenset(['name', 'status', 'id',
+                                                     'key_name'])))
+        self.assertEqual(1, len(api._FIELDS_VIEWS))
+        self.assertEqual(('id', 'metadata', 'name', 'status'),
+                         api._view_key(['metadata', 'links', 'name', 'id',
+                                        'status']))
+
+    def test_builtin_views(self):
+        self.assertEqual('detail', api._view_key('detail'))
+        self.assertIs(api._VIEWS['index'], api._get_view('index'))
+        self.assertEqual(0, len(api._FIELDS_VIEWS))
+
+    def test_bounded(self):
+        for fields in (('id', 'name'), ('id', 'status'), ('id', 'flavor'),
+                       ('id', 'tenant_id')):
+            api._get_view(fields)
+        self.assertEqual(2, len(api._FIELDS_VIEWS))
+        self.assertEqual({'id': 'uuid', 'tenant_id': 'p'},
+                         api._get_view(('id', 'tenant_id')).render(
+                             ('uuid', 'p')))
+
+
+class ChangedQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        super(ChangedQueryTest, self).setUp()
+        self.engine = sa.create_engine('sqlite://')
+        models.metadata.create_all(self.engine)
+        old = datetime.datetime(2016, 1, 1)
+        new = datetime.datetime(2016, 2, 1)
+        for id_, uuid, created_at, updated_at, deleted_at in [
+                (1, 'old', old, None, None),
+                (2, 'created', new, None, None),
+                (3, 'updated', old, new, None),
+                (4, 'deleted', old, None, new),
+                (5, 'short-lived', new, None, new)]:
+            self.engine.execute(models.instances.insert(), {
+                'id': id_, 'uuid': uuid, 'created_at': created_at,
+                'updated_at': updated_at, 'deleted_at': deleted_at,
+                'deleted': id_ if deleted_at else 0})
+        self.engine.execute(models.instance_extra.insert(), [
+            {'instance_uuid': uuid, 'deleted': 0}
+            for uuid in ('old', 'created', 'updated', 'deleted',
+                         'short-lived')])
+
+    def tearDown(self):
+        self.engine.dispose()
+        super(ChangedQueryTest, self).tearDown()
+
+    def test_changed_since(self):
+        query = api._build_instance_changed_query(True)
+        rows = self.engine.execute(
+            query, changed_since=datetime.datetime(2016, 1, 15)).fetchall()
+        self.assertEqual(set(['created', 'updated', 'deleted', 'short-lived']),
+                         set(row[models.instances.c.uuid] for row in rows))
+
+    def test_live(self):
+        query = api._build_instance_changed_query(False)
+        rows = self.engine.execute(query).fetchall()
+        self.assertEqual(set(['old', 'created', 'updated']),
+                         set(row[models.instances.c.uuid] for row in rows))
+
+
+class _FakeCursor(object):
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, statement):
+        if self.connection.error is not None:
+            raise self.connection.error
+        self.connection.executed.append(statement)
+
+    def close(self):
+        pass
+
+
+class _FakeConnection(object):
+
+    def __init__(self, error=None):
+        self.error = error
+        self.executed = []
+
+    def cursor(self):
+        return _FakeCursor(self)
+
+
+class _FakeRecord(object):
+
+    def __init__(self, max_execution_time):
+        self.info = {'max_execution_time': max_execution_time}
+        self.invalidated = None
+
+    def invalidate(self, e):
+        self.invalidated = e
+
+
+class ResetMaxExecutionTimeTest(unittest.TestCase):
+
+    def test_reset(self):
+        connection = _FakeConnection()
+        record = _FakeRecord(1500)
+        api._reset_max_execution_time(connection, record)
+        self.assertEqual(['SET SESSION max_execution_time = 0'],
+                         connection.executed)
+        self.assertEqual(0, record.info['max_execution_time'])
+        self.assertIsNone(record.invalidated)
+
+    def test_not_set(self):
+        for value in (0, False, None):
+            connection = _FakeConnection()
+            api._reset_max_execution_time(connection, _FakeRecord(value))
+            self.assertEqual([], connection.executed)
+
+    def test_failed_reset_invalidates(self):
+        error = Exception('gone away')
+        record = _FakeRecord(1500)
+        api._reset_max_execution_time(_FakeConnection(error), record)
+        self.assertIs(error, record.invalidated)
+
+    def test_checkin(self):
+        engine = sa.create_engine('sqlite://')
+        connection = engine.connect()
+        connection.info['max_execution_time'] = 1500
+        connection.close()
+        with engine.connect() as connection:
+            self.assertFalse(connection.info.get('max_execution_time'))
+        engine.dispose()
+
+
+class _FakeFacade(object):
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def get_engine(self):
+        return self.engine
+
+
+class _FakeContextManager(object):
+
+    def __init__(self, engine):
+        self.facade = _FakeFacade(engine)
+
+    def get_legacy_facade(self):
+        return self.facade
+
+
+class _FakeCellContext(object):
+
+    def __init__(self, engine):
+        self.db_connection = _FakeContextManager(engine)
+
+
+class CheckSchemaTest(unittest.TestCase):
+
+    def setUp(self):
+        super(CheckSchemaTest, self).setUp()
+        self.engine = sa.create_engine('sqlite://')
+
+    def tearDown(self):
+        self.engine.dispose()
+        super(CheckSchemaTest, self).tearDown()
+
+    def test_matching_schema(self):
+        models.metadata.create_all(self.engine)
+        api.check_schema(_FakeCellContext(self.engine))
+
+    def test_missing_column(self):
+        models.metadata.create_all(self.engine)
+        self.engine.execute('DROP TABLE instance_faults')
+        self.engine.execute('CREATE TABLE instance_faults (id INTEGER)')
+        six.assertRaisesRegex(self, exception.DBSchemaMismatch,
+                              'instance_faults.code',
+                              api.check_schema,
+                              _FakeCellContext(self.engine))
+
+
+def _regexp(dbapi_connection, connection_record):
+    dbapi_connection.create_function(
+        'REGEXP', 2,
+        lambda pattern, value: (value is not None and
+                                re.search(pattern, value) is not None))
+
+
+class ListingIndexTest(unittest.TestCase):
+    """Every filter of the servers API must be served by an index of nova,
+    or the listings filtered on it scan the instances of every project.
+    """
+
+    def setUp(self):
+        super(ListingIndexTest, self).setUp()
+        options.set_defaults(api.CONF)
+        # NOTE: the regexp operator of the display_name filter is picked
+        # from the connection string.
+        api.CONF.set_override('connection', 'sqlite://', group='database')
+        self.addCleanup(api.CONF.clear_override, 'connection',
+                        group='database')
+        self.engine = sa.create_engine('sqlite://')
+        sa.event.listen(self.engine, 'connect', _regexp)
+        models.metadata.create_all(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        super(ListingIndexTest, self).tearDown()
+
+    def test_filters_use_an_index(self):
+        checks = dict((check.name, check)
+                      for check in indexes.check_indexes(self.engine))
+        # NOTE: every listing has a project_id filter unless an admin asks
+        # for all_tenants, and changes-since is sampled on its own.
+        names = set(servers.SEARCH_FILTERS.values()) - set(
+            ['project_id', 'changes-since'])
+        for name in sorted(names):
+            check = checks['servers filtered on %s' % name]
+            self.assertEqual([], [problem for problem in check.problems
+                                  if problem.startswith('full scan')],
+                             '%s: %s' % (check.name, check.plan))
+        for name in ('servers', 'servers of all projects',
+                     'servers changed since'):
+            self.assertEqual([], [problem for problem in checks[name].problems
+                                  if problem.startswith('full scan')],
+                             '%s: %s' % (name, checks[name].plan))
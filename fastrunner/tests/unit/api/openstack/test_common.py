@@ -0,0 +1,93 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests of the status map and search options of
+fastrunner.api.openstack.common.
+"""
+
+import unittest
+
+import six
+
+from fastrunner.api.openstack import common
+from fastrunner.compute import task_states
+from fastrunner import exception
+
+ALL_TASK_STATES = [None] + sorted(
+    value for name, value in vars(task_states).items()
+    if not name.startswith('_') and isinstance(value, six.string_types))
+
+ALL_STATUSES = sorted(set(status for task_map in common._STATE_MAP.values()
+                          for status in task_map.values()))
+
+
+def _matches(states, vm_state, task_state):
+    """Evaluate the states_from_status result as the filter does."""
+    if vm_state not in states:
+        return False
+    default, task_states_ = states[vm_state]
+    if default:
+        return task_state not in task_states_
+    return task_state in task_states_
+
+
+class StatesFromStatusTest(unittest.TestCase):
+
+    def _assert_statuses(self, statuses):
+        states = common.states_from_status(statuses)
+        for vm_state in common._STATE_MAP:
+            for task_state in ALL_TASK_STATES:
+                shown = common.status_from_state(vm_state, task_state)
+                self.assertEqual(
+                    shown in statuses,
+                    _matches(states, vm_state, task_state),
+                    '%s: vm_state=%s task_state=%s shows %s' % (
+                        statuses, vm_state, task_state, shown))
+
+    def test_every_status(self):
+        for status in ALL_STATUSES:
+            self._assert_statuses([status])
+
+    def test_pairs_of_statuses(self):
+        for first in ALL_STATUSES:
+            for second in ALL_STATUSES:
+                self._assert_statuses(sorted(set([first, second])))
+
+    def test_case_insensitive(self):
+        self.assertEqual(common.states_from_status(['ACTIVE']),
+                         common.states_from_status(['active']))
+
+    def test_unknown_status(self):
+        self.assertEqual({}, common.states_from_status(['FOO']))
+
+    def test_default_without_overrides(self):
+        states = common.states_from_status(['BUILD'])
+        self.assertEqual({'building': (True, frozenset())}, states)
+
+
+class IsAllTenantsTest(unittest.TestCase):
+
+    def test_absent(self):
+        self.assertFalse(common.is_all_tenants({}))
+
+    def test_empty_value(self):
+        self.assertTrue(common.is_all_tenants({'all_tenants': ''}))
+
+    def test_bool_values(self):
+        self.assertTrue(common.is_all_tenants({'all_tenants': 'True'}))
+        self.assertTrue(common.is_all_tenants({'all_tenants': '1'}))
+        self.assertFalse(common.is_all_tenants({'all_tenants': 'false'}))
+        self.assertFalse(common.is_all_tenants({'all_tenants': '0'}))
+
+    def test_invalid_value(self):
+        self.assertRaises(exception.InvalidInput, common.is_all_tenants,
+                          {'all_tenants': 'yes please'})
@@ -0,0 +1,77 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests of fastrunner.api.compression."""
+
+import gzip
+import io
+import unittest
+
+import webob
+import webob.dec
+import webob.exc
+
+from fastrunner.api import compression
+from fastrunner import conf  # noqa
+
+_BODY = b'{"servers": [%s]}' % b', '.join([b'{"id": "uuid"}'] * 200)
+
+
+@webob.dec.wsgify
+def _listing(req):
+    """Servers listing with a strong ETag, answering 304 when it matches."""
+    if 'listing' in req.if_none_match:
+        return webob.exc.HTTPNotModified(headers={'ETag': '"listing"'})
+    response = webob.Response(body=_BODY, content_type='application/json')
+    response.headers['ETag'] = '"listing"'
+    return response
+
+
+class CompressionMiddlewareTest(unittest.TestCase):
+
+    def setUp(self):
+        super(CompressionMiddlewareTest, self).setUp()
+        self.app = compression.CompressionMiddleware(_listing)
+
+    def _get(self, **headers):
+        return webob.Request.blank('/servers', headers=headers).get_response(
+            self.app)
+
+    def test_gzip(self):
+        response = self._get(**{'Accept-Encoding': 'gzip'})
+        self.assertEqual(200, response.status_int)
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertEqual('W/"listing"', response.headers['ETag'])
+        self.assertEqual('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(
+            _BODY, gzip.GzipFile(fileobj=io.BytesIO(response.body)).read())
+
+    def test_identity(self):
+        response = self._get()
+        self.assertEqual(200, response.status_int)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual('"listing"', response.headers['ETag'])
+        self.assertEqual(_BODY, response.body)
+
+    def test_not_modified_with_gzip(self):
+        etag = self._get(**{'Accept-Encoding': 'gzip'}).headers['ETag']
+        response = self._get(**{'Accept-Encoding': 'gzip',
+                                'If-None-Match': etag})
+        self.assertEqual(304, response.status_int)
+        self.assertEqual(etag, response.headers['ETag'])
+        self.assertEqual('Accept-Encoding', response.headers['Vary'])
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_not_modified_without_encoding(self):
+        response = self._get(**{'If-None-Match': '"listing"'})
+        self.assertEqual(304, response.status_int)
+        self.assertEqual('"listing"', response.headers['ETag'])
@@ -5,8 +5,10 @@ from oslo_log import log
 from oslo_middleware import cors
 from oslo_utils import importutils
 
+import collections
 import six
 import functools
+import sys
 
 import eventlet
 from oslo_context import context as common_context
@@ -43,6 +45,84 @@ def spawn(func, *args, **kwargs):
 
     return eventlet.spawn(context_wrapper, *args, **kwargs)
 
+
+class LRUCache(object):
+    """A bounded mapping that evicts its least recently used entry.
+
+    It keeps hit and miss counters so callers can report how well it
+    works. It is meant for per-worker caches shared by greenthreads, which
+    do not switch in the middle of a get or a set.
+
+    If sizeof is given, it is called with each value stored and the sum of
+    the results for the values in the cache is kept as its footprint.
+    """
+
+    def __init__(self, maxsize, sizeof=None):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.footprint = 0
+        self._sizeof = sizeof
+        self._sizes = {}
+        self._data = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        # Re-insert to mark the entry as the most recently used.
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self._discard(key)
+        self._data[key] = value
+        if self._sizeof is not None:
+            self._sizes[key] = self._sizeof(value)
+            self.footprint += self._sizes[key]
+        while len(self._data) > self.maxsize:
+            self._discard(next(iter(self._data)))
+
+    def _discard(self, key):
+        self._data.pop(key, None)
+        self.footprint -= self._sizes.pop(key, 0)
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+        self._sizes.clear()
+        self.footprint = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {'size': len(self._data),
+                 'maxsize': self.maxsize,
+                 'hits': self.hits,
+                 'misses': self.misses,
+                 'hit_rate': float(self.hits) / lookups if lookups else 0.0}
+        if self._sizeof is not None:
+            stats['bytes'] = self.footprint
+        return stats
+
+
+def deep_getsizeof(obj):
+    """Return the number of bytes used by obj and the dicts, lists, tuples
+    and strings it holds.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_getsizeof(key) + deep_getsizeof(value)
+                    for key, value in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_getsizeof(item) for item in obj)
+    return size
+
+
 def strtime(at):
     return at.strftime("%Y-%m-%dT%H:%M:%S.%f")
 